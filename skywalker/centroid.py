@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from functools import partial
+
+from ophyd import Device, Component as Cpt, Signal
+
+from .image import FrameGeometry, BackgroundModel, beam_present, centroid
+from .subscriptions import SubscriptionRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class CentroidEngine(Device):
+    """
+    Beam centroid computed by skywalker from the frames of an imager.
+
+    This is a stand-in for the areadetector stats plugin when it lags behind
+    or is misconfigured. Every frame of the image plugin is cropped to the
+    region of interest, has the background subtracted and the pixels below
+    the threshold removed before the weighted centroid is put into :attr:`.x`
+    and :attr:`.y`. These behave like ``detector.stats2.centroid.x`` and
+    ``y``, in the same unrotated coordinates, so they can be subscribed to
+    and read in their place.
+
+    Frames are first checked for beam against the dark frame of the imager,
+    see :meth:`.capture_background`. Frames without beam are dropped, they do
+    not move the centroid, and :attr:`.beam` is set to 0 until the beam
+    returns. Dark frames are kept per imager name in :attr:`.backgrounds`, so
+    they outlive the engine.
+
+    The calculation runs on the channel access thread that delivers the frame.
+
+    Parameters
+    ----------
+    imager : pcdsdevices.PIM
+        Imager with a ``detector.image2`` plugin
+
+    roi : tuple, optional
+        Bounds (x0, x1, y0, y1) of the region to use, in pixels
+
+    background : np.ndarray, optional
+        Frame to subtract, in the shape given by :class:`.FrameGeometry`.
+        Defaults to the captured dark frame of the imager, if there is one
+
+    threshold : float, optional
+        Ignore pixels at or below this value
+
+    name : str, optional
+        Defaults to the imager name with ``_soft_centroid`` appended
+    """
+    x = Cpt(Signal, value=0.0)
+    y = Cpt(Signal, value=0.0)
+    beam = Cpt(Signal, value=1)
+    backgrounds = {}
+    beam_threshold = 20
+    beam_pixels = 5
+
+    def __init__(self, imager, roi=None, background=None, threshold=0,
+                 name=None, **kwargs):
+        if name is None:
+            name = imager.name + '_soft_centroid'
+        super().__init__('', name=name, **kwargs)
+        self.imager = imager
+        self.roi = roi
+        self._background = background
+        self.threshold = threshold
+        self.geometry = FrameGeometry()
+        self.width = None
+        self.frames = 0
+        self.dropped = 0
+        self.capturing = False
+        self.dark = self.backgrounds.setdefault(imager.name,
+                                                BackgroundModel())
+        self._registry = None
+
+    @property
+    def background(self):
+        """
+        Frame subtracted before the beam check and the centroid, or None
+        """
+        if self._background is not None:
+            return self._background
+        return self.dark.frame
+
+    def capture_background(self, frames=10):
+        """
+        Average the next frames into the dark frame of the imager. The beam
+        must be off while this happens.
+
+        Parameters
+        ----------
+        frames : int, optional
+            Number of frames to average
+        """
+        logger.info('Capturing a dark frame for %s over %s frames',
+                    self.imager.name, frames)
+        self.dark.reset(frames=frames)
+        self.capturing = True
+
+    def start(self, registry=None):
+        """
+        Start computing centroids as frames arrive.
+
+        Parameters
+        ----------
+        registry : SubscriptionRegistry, optional
+            Where to keep the subscriptions to the image plugin. They are
+            filed under the name of this device
+        """
+        self.stop()
+        self._registry = registry or SubscriptionRegistry()
+        image2 = self.imager.detector.image2
+        self._registry.subscribe(image2.width, self._width_cb, self.name)
+        self._registry.subscribe(image2.array_data, self._frame_cb,
+                                 self.name)
+
+    def stop(self):
+        """
+        Stop computing centroids
+        """
+        if self._registry is not None:
+            self._registry.clear_group(self.name)
+            self._registry = None
+
+    def process(self, frame):
+        """
+        Compute the centroid of a flat frame and update the signals. Frames
+        without beam, or with no pixels above the threshold, leave the
+        centroid alone. Frames taken while capturing a dark frame are only
+        added to it.
+
+        Returns
+        -------
+        x, y : float or None
+        """
+        frame = self.geometry.flat(frame)
+        if not self.width:
+            return None, None
+        self.geometry.update(self.width, frame.size)
+        image = self.geometry.view(frame)
+        self.frames += 1
+        if self.capturing:
+            if self.dark.add(image):
+                self.capturing = False
+                logger.info('Dark frame for %s is ready', self.imager.name)
+            return None, None
+        background = self.background
+        if background is not None and background.shape != image.shape:
+            logger.warning('Ignoring the background for %s, the image size '
+                           'changed', self.imager.name)
+            if self._background is None:
+                self.dark.reset()
+            background = None
+        present = beam_present(image, background=background,
+                               threshold=self.beam_threshold,
+                               min_pixels=self.beam_pixels)
+        if present != bool(self.beam.get()):
+            self.beam.put(int(present))
+        if not present:
+            self.dropped += 1
+            return None, None
+        x, y = centroid(image, roi=self.roi, background=background,
+                        threshold=self.threshold)
+        if x is not None:
+            self.x.put(x)
+            self.y.put(y)
+        return x, y
+
+    def _width_cb(self, *args, value=None, **kwargs):
+        self.width = value
+
+    def _frame_cb(self, *args, value=None, **kwargs):
+        if value is None:
+            return
+        try:
+            self.process(value)
+        except Exception:
+            logger.exception('Error computing centroid for %s',
+                             self.imager.name)
+
+
+class BeamWatch(Device):
+    """
+    Beam presence on the imagers of a running plan, for a suspender.
+
+    Unlike :attr:`.CentroidEngine.beam`, which follows the imager on screen,
+    this watches every imager handed to :meth:`.start`. :attr:`.beam` drops
+    to 0 while any of them that is inserted shows no beam over its dark
+    frame, see :data:`.CentroidEngine.backgrounds`. Imagers that are out of
+    the beam are ignored, they are not expected to see anything.
+
+    Parameters
+    ----------
+    name : str, optional
+    """
+    beam = Cpt(Signal, value=1)
+
+    def __init__(self, name='beam_watch', **kwargs):
+        super().__init__('', name=name, **kwargs)
+        self.imagers = []
+        self.present = {}
+        self._widths = {}
+        self._geometry = {}
+        self._registry = None
+        self._lock = threading.Lock()
+
+    def start(self, imagers, registry=None):
+        """
+        Start checking the frames of some imagers.
+
+        Parameters
+        ----------
+        imagers : list of pcdsdevices.PIM
+            Imagers of the plan, each with a ``detector.image2`` plugin
+
+        registry : SubscriptionRegistry, optional
+            Where to keep the subscriptions to the image plugins. They are
+            filed under the name of this device
+        """
+        self.stop()
+        self._registry = registry or SubscriptionRegistry()
+        self.imagers = list(imagers)
+        for imager in self.imagers:
+            image2 = imager.detector.image2
+            self._geometry[imager.name] = FrameGeometry()
+            self._registry.subscribe(image2.width,
+                                     partial(self._width_cb, imager.name),
+                                     self.name)
+            self._registry.subscribe(image2.array_data,
+                                     partial(self._frame_cb, imager),
+                                     self.name)
+
+    def stop(self):
+        """
+        Stop checking frames and assume the beam is there.
+        """
+        if self._registry is not None:
+            self._registry.clear_group(self.name)
+            self._registry = None
+        self.imagers = []
+        with self._lock:
+            self.present.clear()
+        self._widths.clear()
+        self._geometry.clear()
+        self._refresh()
+
+    def update(self, imager, frame):
+        """
+        Check one flat frame of an imager for beam and update :attr:`.beam`.
+
+        Returns
+        -------
+        present : bool or None
+            None if the frame was not checked
+        """
+        if getattr(imager, 'position', 'IN') != 'IN':
+            with self._lock:
+                self.present.pop(imager.name, None)
+            self._refresh()
+            return None
+        width = self._widths.get(imager.name)
+        geometry = self._geometry.get(imager.name)
+        if not width or geometry is None:
+            return None
+        frame = geometry.flat(frame)
+        geometry.update(width, frame.size)
+        image = geometry.view(frame)
+        background = CentroidEngine.backgrounds.get(imager.name)
+        background = background.frame if background is not None else None
+        if background is not None and background.shape != image.shape:
+            background = None
+        present = beam_present(image, background=background,
+                               threshold=CentroidEngine.beam_threshold,
+                               min_pixels=CentroidEngine.beam_pixels)
+        with self._lock:
+            self.present[imager.name] = present
+        self._refresh()
+        return present
+
+    def _refresh(self):
+        with self._lock:
+            missing = [name for name, ok in self.present.items() if not ok]
+        beam = int(not missing)
+        if beam != self.beam.get():
+            if missing:
+                logger.info('No beam on %s', missing)
+            self.beam.put(beam)
+
+    def _width_cb(self, name, *args, value=None, **kwargs):
+        self._widths[name] = value
+
+    def _frame_cb(self, imager, *args, value=None, **kwargs):
+        if value is None:
+            return
+        try:
+            self.update(imager, value)
+        except Exception:
+            logger.exception('Error checking beam on %s', imager.name)
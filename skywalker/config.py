@@ -1,14 +1,26 @@
+import os
+import time
 import logging
+import threading
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import happi
 import simplejson
 from happi.backends import JSONBackend
 
 import pcdsdevices
+from ophyd import Device, FormattedComponent
+from ophyd.signal import EpicsSignalBase
 from pcdsdevices import sim, OffsetMirror
 from pcdsdevices.happireader import construct_device
 from pswalker.examples import patch_pims
 
+from .profiling import PhaseTimer, ConnectionMetrics
+from .retry import RetryScheduler
+from .proxy import DeviceProxy
+
 logger = logging.getLogger(__name__)
 
 #####################
@@ -56,6 +68,131 @@ sim_alignments = {'HOMS': [['sim_m1h', 'sim_m2h']],
                   'MFX': [['sim_mfx']]}
 
 
+def probe_suffix(device_cls):
+    """
+    Find the suffix of the first eagerly connected EPICS signal of a device
+    class, without instantiating anything.
+
+    Parameters
+    ----------
+    device_cls : type
+        Subclass of ``ophyd.Device``
+
+    Returns
+    -------
+    suffix : str or None
+        The pv name of the signal is the device prefix plus this suffix. None
+        if no such signal could be found
+    """
+    for cpt in getattr(device_cls, '_sig_attrs', {}).values():
+        cls = getattr(cpt, 'cls', None)
+        suffix = getattr(cpt, 'suffix', None)
+        #Formatted suffixes need an instance to be filled in
+        if (cls is None or suffix is None or cpt.lazy
+                or isinstance(cpt, FormattedComponent)):
+            continue
+        if issubclass(cls, EpicsSignalBase):
+            return suffix
+        if issubclass(cls, Device):
+            sub_suffix = probe_suffix(cls)
+            if sub_suffix is not None:
+                return suffix + sub_suffix
+    return None
+
+
+def profile_signals(device, attrs):
+    """
+    Instantiate the signals of a device at the given dotted attribute names.
+    Naming a component device includes every signal inside of it, lazy or not.
+
+    Parameters
+    ----------
+    device : ophyd.Device
+
+    attrs : list of str
+        Dotted attribute names, e.g. 'pitch.user_readback'
+
+    Returns
+    -------
+    signals : OrderedDict
+        Mapping of dotted attribute name to signal
+    """
+    signals = OrderedDict()
+    for attr in attrs:
+        obj = device
+        try:
+            for step in attr.split('.'):
+                obj = getattr(obj, step)
+        except AttributeError:
+            logger.debug("%s has no attribute %s", device.name, attr)
+            continue
+        if isinstance(obj, Device):
+            for walk in obj.walk_signals(include_lazy=True):
+                signals[attr + '.' + walk.dotted_name] = walk.item
+        else:
+            signals[attr] = obj
+    return signals
+
+
+def teardown(device):
+    """
+    Remove every callback from a device and release its channel access
+    connections. The device can not be used afterwards.
+    """
+    try:
+        unsubscribe_all = getattr(device, 'unsubscribe_all', None)
+        if unsubscribe_all is not None:
+            unsubscribe_all()
+        destroy = getattr(device, 'destroy', None)
+        if destroy is not None:
+            destroy()
+    except Exception:
+        logger.exception("Error tearing down %s",
+                         getattr(device, 'name', device))
+
+
+class ConnectionPolicy:
+    """
+    Rules for how long to wait on the signals of a device
+
+    A device is usable as soon as all of its required signals connect. The
+    remaining signals are still instantiated, so their connections continue in
+    the background, but they are never waited on.
+
+    Policies can be assigned to a whole device class with the ``policies``
+    argument of :class:`.ConfigReader`, or to a single device with a
+    ``connection`` entry in the happi metadata, e.g.
+    ``"connection": {"required": ["pitch"], "timeout": 2.0}``.
+
+    Parameters
+    ----------
+    required : list of str, optional
+        Dotted attribute names of the signals that must connect. Naming a
+        component device requires every signal inside of it. By default every
+        signal is required.
+
+    timeout : float, optional
+        Time to wait for the required signals
+    """
+    def __init__(self, required=None, timeout=1):
+        self.required = required
+        self.timeout = timeout
+
+    def is_required(self, attr):
+        """
+        Whether the signal at the dotted attribute name must connect
+        """
+        if self.required is None:
+            return True
+        return any(attr == req or attr.startswith(req + '.')
+                   for req in self.required)
+
+    def __repr__(self):
+        return '{}(required={!r}, timeout={!r})'.format(type(self).__name__,
+                                                        self.required,
+                                                        self.timeout)
+
+
 class ConfigReader:
     """
     Device to store and load devices neccesary for alignment
@@ -75,6 +212,19 @@ class ConfigReader:
     subsequent requests will simply returned cached value as to avoid
     unnecessary device creation.
 
+    Names that are missing from happi or have an invalid ``device_class`` are
+    remembered for :attr:`.negative_ttl` seconds, or until the happi JSON file
+    changes, so that repeated requests fail fast without a new lookup. Other
+    devices that fail to load are retried in the background by
+    :attr:`.retry`. Once a system finishes loading it is placed in the cache
+    and every callback registered with :meth:`.subscribe` is run from the
+    retry thread.
+
+    The cache can be bounded with ``cache_size`` and ``idle_timeout``. Systems
+    that are evicted are torn down, see :meth:`.evict`, unless they have been
+    pinned with :meth:`.pin`, e.g. because they are part of the active
+    procedure.
+
     Parameters
     ----------
     happi_json : str
@@ -82,17 +232,102 @@ class ConfigReader:
 
     system_json : str
         Path to JSON file that holds device names to load from happi
+
+    timer : PhaseTimer, optional
+        Timer to record the time spent in each :meth:`.load_device` call. If
+        not provided, the ConfigReader creates its own, which keeps the last
+        :attr:`.max_phases` calls.
+
+    policies : dict, optional
+        Mapping of ``device_class`` name to the :class:`.ConnectionPolicy` used
+        for devices of that class. A ``connection`` entry in the happi
+        metadata of a device takes precedence. Devices with neither use
+        :attr:`.default_policy`
+
+    prescan : bool, optional
+        Search for one pv of every device in a single batch before building
+        anything, and skip the devices whose IOCs do not answer within
+        :attr:`.prescan_timeout`. See :meth:`.scan_reachable`
+
+    cache_size : int, optional
+        Most systems to keep in the cache. Once there are more, the least
+        recently used systems are evicted by the next :meth:`.evict`. By
+        default the cache is unbounded
+
+    idle_timeout : float, optional
+        Evict systems that have not been requested for this many seconds. See
+        :meth:`.evict`
+
+    Attributes
+    ----------
+    metrics : ConnectionMetrics
+        Time taken by each stage of :meth:`.load_device` for every device and
+        signal that has been loaded
+
+    retry : RetryScheduler
+        Background retries of the systems and devices that failed to load
     """
     device_types = ['mirror', 'imager', 'slits']
     info_swap    = {'mirror' : {'states' : 'prefix_xy'},
                     'imager' : {'data'   : 'prefix_det'}}
-    def __init__(self, happi_json, system_json):
+    default_policy = ConnectionPolicy()
+    #Signals the widget groups and the skywalker plan use for each role
+    signal_profiles = {'mirror': ['pitch'],
+                       'imager': ['states',
+                                  'detector.cam.acquire',
+                                  'detector.cam.array_size',
+                                  'detector.image2.width',
+                                  'detector.stats2.enable',
+                                  'detector.stats2.centroid'],
+                       'slits': ['xwidth', 'ywidth']}
+    prescan_timeout = 1.0
+    #Seconds to wait on a device whose policy sets no timeout
+    connect_timeout = 10.0
+    default_upstream = ['HXD']
+    beamline_upstream = {'HXD': []}
+    negative_ttl = 300
+    #Phases kept by the ConfigReader's own timer over a long session
+    max_phases = 1000
+    SUB_LOADED = 'loaded'
+    SUB_EVICTED = 'evicted'
+    def __init__(self, happi_json, system_json, timer=None, policies=None,
+                 prescan=False, cache_size=None, idle_timeout=None):
+        self._init_state(timer=timer, policies=policies, prescan=prescan,
+                         cache_size=cache_size, idle_timeout=idle_timeout)
         #Load happi client
+        self.happi_json = happi_json
         self.client  = happi.Client(database=JSONBackend(happi_json))
+        self._happi_mtime = self._get_happi_mtime()
         #Load system information
+        self.system_json = system_json
         self.live_systems = simplejson.load(open(system_json, 'r'))
-        #Create cache of previously loaded devices
-        self.cache = {}
+
+    def _init_state(self, timer=None, policies=None, prescan=False,
+                    cache_size=None, idle_timeout=None):
+        """
+        Set up the timing, cache and retry state shared with
+        :class:`.SimConfigReader`
+        """
+        #Record device load times
+        self.timer = timer or PhaseTimer(type(self).__name__,
+                                         max_phases=self.max_phases)
+        self.metrics = ConnectionMetrics()
+        #Rules for waiting on device connections
+        self.policies = dict(policies or {})
+        self.prescan = prescan
+        #Names we know will not load
+        self._bad_devices = {}
+        #Create cache of previously loaded devices, least recently used first
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.idle_timeout = idle_timeout
+        self._last_used = {}
+        self._pinned = set()
+        #Keep trying devices that fail
+        self.retry = RetryScheduler()
+        self._partial = {}
+        self._subs = {self.SUB_LOADED: [], self.SUB_EVICTED: []}
+        self._lock = threading.RLock()
 
     @property
     def available_systems(self):
@@ -128,7 +363,66 @@ class ConfigReader:
             self.systems_with_dict = d
             return self.get_systems_with(key)
 
-    def get_subsystem(self, system, timeout=30, use_cache=True):
+    def update_systems(self, live_systems):
+        """
+        Replace the system information, keeping every loaded system that did
+        not change.
+
+        Systems that were removed or now point at different devices are
+        dropped from the cache so they are rebuilt on the next request. A
+        change in rotation alone is applied to the cached system.
+
+        Parameters
+        ----------
+        live_systems : dict
+            New system information, in the same format as the system JSON
+
+        Returns
+        -------
+        added, removed, changed : list
+            Names of the systems in each category
+        """
+        with self._lock:
+            old = self.live_systems
+            added = [name for name in live_systems if name not in old]
+            removed = [name for name in old if name not in live_systems]
+            changed = [name for name in live_systems
+                       if name in old and old[name] != live_systems[name]]
+            self.live_systems = live_systems
+            for system in removed + changed:
+                new_info = dict(live_systems.get(system, {}))
+                old_info = dict(old[system])
+                new_rot = new_info.pop('rotation', 0)
+                old_info.pop('rotation', None)
+                if new_info == old_info and system in self.cache:
+                    logger.debug("Updating rotation of %s", system)
+                    self.cache[system]['rotation'] = new_rot
+                    continue
+                logger.debug("Dropping devices for %s", system)
+                self._drop(system)
+                self._partial.pop(system, None)
+                self.retry.cancel(('system', system))
+            #Rebuild the device name lookup on the next request
+            self.__dict__.pop('systems_with_dict', None)
+        if added or removed or changed:
+            logger.info("Systems added: %s, removed: %s, changed: %s",
+                        added, removed, changed)
+        return added, removed, changed
+
+    def reload_systems(self):
+        """
+        Read the system JSON file again, see :meth:`.update_systems`
+
+        Returns
+        -------
+        added, removed, changed : list
+            Names of the systems in each category
+        """
+        with open(self.system_json, 'r') as f:
+            live_systems = simplejson.load(f)
+        return self.update_systems(live_systems)
+
+    def get_subsystem(self, system, timeout=None, use_cache=True):
         """
         Load the pcdsdevices corresponding to a system name
 
@@ -138,7 +432,8 @@ class ConfigReader:
             Name of subsystem to load
 
         timeout : float, optional
-            Timeout for devices
+            Timeout for each device. By default, this is taken from the
+            connection policy of each device
 
         use_cache : bool, optional
             Search the cache for previously loaded devices before instantiating
@@ -151,8 +446,17 @@ class ConfigReader:
         #Reload previously accessed systems
         if system in self.cache and use_cache:
             logger.debug("Using cached devices for %s", system)
+            with self._lock:
+                self._touch(system)
             return self.cache[system]
 
+        #Avoid repeating a slow failure while we retry in the background
+        if ('system', system) in self.retry and use_cache:
+            logger.info("Still waiting on devices for %s", system)
+            #The retry thread is still filling in the original
+            with self._lock:
+                return dict(self._partial.get(system, {}))
+
         if system not in self.available_systems:
             logger.error("No system information found for %s", system)
 
@@ -161,101 +465,834 @@ class ConfigReader:
         system_objs  = dict.fromkeys(self.device_types)
         #Get information from system names
         try:
-            for dev_type in self.device_types:
-                #Get device name
-                name = self.live_systems[system][dev_type]
-                dev  = self.load_device(name)
-                #Report if we did not recieve a device
-                if not dev:
-                    raise ValueError
-                #Store in system obj
-                system_objs[dev_type] = dev
-            system_objs['rotation'] = self.live_systems[system]['rotation']
-
+            self._fill_system(system, system_objs, timeout=timeout)
         #System JSON failure
-        except KeyError:
+        except KeyError as exc:
             logger.error("System %s does not have a %s object registered",
-                          system, dev_type)
-        except ValueError:
-            logger.error("Abandoning configuration load for %s",
-                         system)
+                          system, exc)
+        except ValueError as exc:
+            #No point in retrying until the negative cache entry expires
+            if self.known_bad(exc.args[0]):
+                logger.error("Abandoning configuration load for %s, %s is "
+                             "known to be bad", system, exc.args[0])
+            else:
+                logger.error("Abandoning configuration load for %s, will "
+                             "keep trying in the background", system)
+                with self._lock:
+                    self._partial[system] = system_objs
+                self.retry.schedule(('system', system),
+                                    partial(self._retry_system, system,
+                                            system_objs, timeout),
+                                    callback=self._system_loaded)
+                return dict(system_objs)
         #Cache system for quick recall
         else:
+            self._store(system, system_objs)
+
+        return system_objs
+
+    def _touch(self, system):
+        """
+        Mark a cached system as the most recently used
+        """
+        self.cache.move_to_end(system)
+        self._last_used[system] = time.time()
+
+    def _store(self, system, system_objs):
+        """
+        Add a loaded system to the cache. This may run on the retry thread, so
+        nothing is evicted here, see :meth:`.evict`
+        """
+        with self._lock:
             self.cache[system] = system_objs
+            self._touch(system)
+
+    def pin(self, systems):
+        """
+        Set the systems that are never evicted from the cache, replacing any
+        that were pinned before.
+
+        Parameters
+        ----------
+        systems : list of str
+        """
+        with self._lock:
+            self._pinned = set(systems)
+
+    def evict(self):
+        """
+        Tear down the systems that no longer fit in the cache.
+
+        Unpinned systems that have been idle for longer than
+        :attr:`.idle_timeout` are removed, followed by the least recently used
+        unpinned systems until at most :attr:`.cache_size` remain. Nothing is
+        evicted automatically; the owner of the devices should call this
+        periodically from its own thread, e.g. from a gui timer.
+
+        Callbacks subscribed to ``SUB_EVICTED`` are run in the calling thread
+        with the ``system``, its ``objs`` and the list of devices that are
+        about to be ``destroyed`` so any subscriptions to them can be removed.
+        Devices that are shared with another loaded system are left alone.
+
+        Returns
+        -------
+        evicted : list of str
+            Names of the systems that were evicted
+        """
+        if self.cache_size is None and self.idle_timeout is None:
+            return []
+        with self._lock:
+            unpinned = [system for system in self.cache
+                        if system not in self._pinned]
+            evicted = []
+            if self.idle_timeout is not None:
+                cutoff = time.time() - self.idle_timeout
+                evicted.extend(system for system in unpinned
+                               if self._last_used.get(system, 0) < cutoff)
+            if self.cache_size is not None:
+                excess = len(self.cache) - len(evicted) - self.cache_size
+                for system in unpinned:
+                    if excess <= 0:
+                        break
+                    if system not in evicted:
+                        evicted.append(system)
+                        excess -= 1
+        for system in evicted:
+            logger.info("Evicting %s from the cache", system)
+            self._drop(system)
+        return evicted
 
+    def _drop(self, system):
+        """
+        Remove a system from the cache and tear down its devices that are not
+        used by any other loaded system
+        """
+        with self._lock:
+            system_objs = self.cache.pop(system, None)
+            self._last_used.pop(system, None)
+            if system_objs is None:
+                return
+            in_use = set()
+            loaded = list(self.cache.values()) + list(self._partial.values())
+            for objs in loaded:
+                in_use.update(id(objs.get(dev_type))
+                              for dev_type in self.device_types)
+            destroyed = [system_objs.get(dev_type)
+                         for dev_type in self.device_types
+                         if system_objs.get(dev_type) is not None
+                         and id(system_objs.get(dev_type)) not in in_use]
+        #Let subscribers clean up before the devices go away
+        self._run_subs(self.SUB_EVICTED, system=system, objs=system_objs,
+                       destroyed=destroyed)
+        for device in destroyed:
+            teardown(device)
+
+    def _fill_system(self, system, system_objs, timeout=None):
+        """
+        Load every device of a system that is missing from system_objs.
+
+        Raises a KeyError if the system information is incomplete and a
+        ValueError if a device fails to load.
+        """
+        missing = []
+        for dev_type in self.device_types:
+            if system_objs.get(dev_type) is None:
+                #Get device name
+                try:
+                    missing.append((dev_type,
+                                    self.live_systems[system][dev_type]))
+                except KeyError:
+                    raise KeyError(dev_type)
+        #Fail fast if an IOC is not there
+        if self.prescan and missing:
+            containers = list()
+            for (dev_type, name) in missing:
+                try:
+                    containers.append(self.client.load_device(name=name))
+                except happi.errors.SearchError:
+                    pass
+            unreachable = self.scan_reachable(containers)[1]
+            if unreachable:
+                raise ValueError(unreachable[0].name)
+        for (dev_type, name) in missing:
+            dev  = self.load_device(name, timeout=timeout, role=dev_type)
+            #Report if we did not recieve a device
+            if not dev:
+                raise ValueError(name)
+            #Store in system obj
+            system_objs[dev_type] = dev
+        system_objs['rotation'] = self.live_systems[system]['rotation']
+
+    def _retry_system(self, system, system_objs, timeout):
+        """
+        Retry target for a system, returns None while devices are missing.
+        """
+        try:
+            self._fill_system(system, system_objs, timeout=timeout)
+        except ValueError as exc:
+            if self.known_bad(exc.args[0]):
+                logger.error("Stopped retrying %s, %s is known to be "
+                             "bad", system, exc.args[0])
+                self.retry.cancel(('system', system))
+                with self._lock:
+                    self._partial.pop(system, None)
+            return None
         return system_objs
 
+    def _system_loaded(self, key, system_objs):
+        """
+        Retry callback to promote a finished system into the cache.
+        """
+        system = key[1]
+        with self._lock:
+            self._partial.pop(system, None)
+        self._store(system, system_objs)
+        self._run_subs(self.SUB_LOADED, system=system, objs=system_objs)
+
+    def _device_loaded(self, container, key, device):
+        """
+        Retry callback for a device from :meth:`.load_configuration`.
+        """
+        self._run_subs(self.SUB_LOADED, device=device, container=container)
+
+    def subscribe(self, callback, event_type=None):
+        """
+        Run a callback when a system or device finishes loading in the
+        background, or when a system is evicted from the cache.
+
+        The callback is run from the retry thread with keyword arguments. For
+        systems these are ``system`` and ``objs``, the name and the loaded
+        dictionary. For devices retried by :meth:`.load_configuration` these
+        are ``device`` and ``container``. Eviction callbacks are run from
+        whichever thread called :meth:`.evict`, see there for the arguments.
+
+        Parameters
+        ----------
+        callback : callable
+
+        event_type : str, optional
+            ``SUB_LOADED`` or ``SUB_EVICTED``. Defaults to ``SUB_LOADED``
+        """
+        event_type = event_type or self.SUB_LOADED
+        self._subs[event_type].append(callback)
+
+    def clear_sub(self, callback, event_type=None):
+        """
+        Remove a callback added with :meth:`.subscribe`
+        """
+        event_type = event_type or self.SUB_LOADED
+        try:
+            self._subs[event_type].remove(callback)
+        except ValueError:
+            pass
+
+    def _run_subs(self, event_type, **kwargs):
+        for callback in list(self._subs[event_type]):
+            try:
+                callback(sub_type=event_type, **kwargs)
+            except Exception:
+                logger.exception('Error in %s callback', event_type)
+
     def __getitem__(self, key):
         return self.cache.get(key, None)
 
-    def load_device(self, name, timeout=1):
+    def get_policy(self, happi_obj):
         """
-        Load a device by name from happi
+        Find the connection policy for a happi container
 
-        The happi file is expected to be configured with a `device_class` that
-        matches the necessary class from `pcdsdevices`, as well as information
-        under `args` and `kwargs` that are used to instantiate the device.
+        Parameters
+        ----------
+        happi_obj : happi.Device
+            Container holding the device information
 
-        If the device fails to load for any reason, `None` is returned instead
+        Returns
+        -------
+        policy : ConnectionPolicy
+        """
+        info = happi_obj.extraneous.get('connection')
+        if info:
+            return ConnectionPolicy(**info)
+        device_class = happi_obj.extraneous.get('device_class')
+        return self.policies.get(device_class, self.default_policy)
+
+    def _get_happi_mtime(self):
+        try:
+            return os.path.getmtime(self.happi_json)
+        except OSError:
+            return None
+
+    def known_bad(self, name):
+        """
+        Whether a device name recently failed to load for a reason that will
+        not fix itself, i.e. it is missing from happi or has an invalid
+        ``device_class``.
 
         Parameters
         ----------
         name : str
             Name of the device
 
+        Returns
+        -------
+        known_bad : bool
+        """
+        #Everything may have been fixed if the database changed
+        mtime = self._get_happi_mtime()
+        if mtime != self._happi_mtime:
+            if self._bad_devices:
+                logger.debug("Happi database changed, forgetting %s bad "
+                             "devices", len(self._bad_devices))
+            self.forget_bad()
+            self._happi_mtime = mtime
+        try:
+            failed = self._bad_devices[name]
+        except KeyError:
+            return False
+        if time.time() - failed > self.negative_ttl:
+            self._bad_devices.pop(name, None)
+            return False
+        return True
+
+    def forget_bad(self, name=None):
+        """
+        Allow a device that is known to be bad to be loaded again. If no name
+        is given, forget every bad device.
+        """
+        if name is None:
+            self._bad_devices.clear()
+        else:
+            self._bad_devices.pop(name, None)
+
+    def probe_pv(self, container):
+        """
+        The pv used to check whether the IOC of a device is reachable. This is
+        the ``probe_pv`` entry in the happi metadata if there is one,
+        otherwise the first eagerly connected EPICS signal of the device class.
+
+        Parameters
+        ----------
+        container : happi.Device
+
+        Returns
+        -------
+        pvname : str or None
+        """
+        info = container.extraneous
+        if info.get('probe_pv'):
+            return info['probe_pv']
+        device_cls = getattr(pcdsdevices, info.get('device_class', ''), None)
+        suffix = probe_suffix(device_cls)
+        if suffix is None or not container.prefix:
+            return None
+        return container.prefix + suffix
+
+    def z_position(self, name):
+        """
+        Position of a device along the beam, from its happi entry.
+
+        Parameters
+        ----------
+        name : str
+            Name of the device in happi
+
+        Returns
+        -------
+        z : float or None
+            In meters, None if the device or its position is not known
+        """
+        try:
+            z = self.client.load_device(name=name).z
+        except happi.errors.SearchError:
+            return None
+        if z is None or z < 0:
+            return None
+        return float(z)
+
+    def pixel_size(self, name):
+        """
+        Size of a pixel on an imager, from the ``pixel_size`` entry of its
+        happi metadata. This depends on the camera and the zoom of each
+        imager.
+
+        Parameters
+        ----------
+        name : str
+            Name of the imager in happi
+
+        Returns
+        -------
+        size : float or None
+            In microns, None if the imager or its pixel size is not known
+        """
+        try:
+            container = self.client.load_device(name=name)
+        except happi.errors.SearchError:
+            return None
+        size = container.extraneous.get('pixel_size')
+        try:
+            size = float(size)
+        except (TypeError, ValueError):
+            return None
+        if size <= 0:
+            return None
+        return size
+
+    def scan_reachable(self, containers, timeout=None):
+        """
+        Split devices by whether their IOCs respond, without building them.
+
+        The searches for the probe pv of every device, see :meth:`.probe_pv`,
+        are sent out in a single batch and given one search interval to
+        connect. The probe channels are cleared afterwards. Devices without a
+        probe pv are assumed to be reachable.
+
+        Parameters
+        ----------
+        containers : list
+            Happi containers of the devices to check
+
         timeout : float, optional
-            Timeout for EPICS signal connections
+            Time to wait for the searches. Defaults to
+            :attr:`.prescan_timeout`
 
         Returns
         -------
-        `pcdsdevices.Device` or `None`
+        reachable, unreachable : list
+            The containers in each category
+        """
+        try:
+            from epics import ca
+        except ImportError:
+            logger.error("Can not scan for devices, "
+                         "pyepics package not available")
+            return list(containers), []
+        if timeout is None:
+            timeout = self.prescan_timeout
+        chids = dict()
+        for container in containers:
+            pvname = self.probe_pv(container)
+            if pvname:
+                chids[container.name] = ca.create_channel(pvname,
+                                                          connect=False,
+                                                          auto_cb=False)
+        #Send every search at once
+        ca.flush_io()
+        start = time.time()
+        pending = set(chids)
+        try:
+            while pending and time.time() - start < timeout:
+                #Wait on the network instead of spinning
+                ca.pend_event(0.01)
+                pending = set(name for name in pending
+                              if not ca.isConnected(chids[name]))
+        finally:
+            #Devices make their own channels, do not leak one per scan
+            for chid in chids.values():
+                try:
+                    ca.clear_channel(chid)
+                except Exception:
+                    logger.debug("Could not clear probe channel",
+                                 exc_info=True)
+        reachable = [c for c in containers if c.name not in pending]
+        unreachable = [c for c in containers if c.name in pending]
+        logger.info("%s of %s devices are reachable", len(reachable),
+                    len(containers))
+        for container in unreachable:
+            logger.debug("No response for %s at %s", container.name,
+                         self.probe_pv(container))
+        return reachable, unreachable
 
+    def _prepare_device(self, name, timeout=None, role=None):
         """
+        Find and construct a device, instantiating its signals so they start
+        connecting, without waiting on any of them. Lazy signals are only
+        instantiated if they are in the :attr:`.signal_profiles` entry for the
+        role, or if the role has no profile.
+
+        Returns a dictionary of information for :meth:`._connect_devices`, or
+        None if the device could not be created.
+        """
+        if self.known_bad(name):
+            logger.debug("Skipping known bad device %s", name)
+            return None
         try:
             #Get device information
             logger.debug("Loading %s ...", name)
-            happi_obj = self.client.load_device(name=name)
-            #Grab proper device class
-            device_cls = getattr(pcdsdevices,
-                                 happi_obj.extraneous['device_class'])
-            #Extra arguments and keywords
-            (_args, _kwargs) = (happi_obj.extraneous.get(key)
-                                for key in ('args', 'kwargs'))
-            dev = construct_device(happi_obj,
-                                   device_class=device_cls,
-                                   **_kwargs)
-            #Instantiate all our signals, even if lazy
-            dev.wait_for_connection(all_signals=True,
-                                    timeout=timeout)
+            with self.timer.phase('construct ' + name):
+                with self.metrics.stage(name, 'find'):
+                    happi_obj = self.client.load_device(name=name)
+                with self.metrics.stage(name, 'construct'):
+                    #Grab proper device class
+                    device_cls = getattr(pcdsdevices,
+                                         happi_obj.extraneous['device_class'])
+                    #Extra arguments and keywords
+                    (_args, _kwargs) = (happi_obj.extraneous.get(key)
+                                        for key in ('args', 'kwargs'))
+                    dev = construct_device(happi_obj,
+                                           device_class=device_cls,
+                                           **_kwargs)
+                policy = self.get_policy(happi_obj)
+                start = time.time()
+                profile = self.signal_profiles.get(role)
+                if profile is None:
+                    #Instantiate all our signals, even if lazy
+                    signals = OrderedDict((walk.dotted_name, walk.item)
+                                          for walk in
+                                          dev.walk_signals(include_lazy=True))
+                    used = signals
+                else:
+                    #Leave the lazy signals we do not use alone
+                    signals = OrderedDict((walk.dotted_name, walk.item)
+                                          for walk in
+                                          dev.walk_signals(include_lazy=False))
+                    used = profile_signals(dev, profile)
+                    signals.update(used)
         #Happi failure
         except happi.errors.SearchError:
             logger.error("Unable to find device %s in the database",
                          name)
+            self._bad_devices[name] = time.time()
         #No proper pcds-devices
         except AttributeError as exc:
             logger.exception("Unable to find proper object for %s",
                              exc)
+            self._bad_devices[name] = time.time()
         #Catch-all
         except Exception:
             logger.exception('Error loading device %s', name)
         #Return a device if no exceptions
         else:
-            return dev
+            #Only wait on the ones we need
+            required = [attr for attr in used if policy.is_required(attr)]
+            if timeout is None:
+                timeout = policy.timeout
+            #Never wait forever on a device that will not connect
+            if timeout is None:
+                timeout = self.connect_timeout
+            return dict(device=dev, signals=signals, start=start,
+                        timeout=timeout, times=dict.fromkeys(required))
         #Do not return anything if we saw an exception
         return None
 
-    def load_configuration(self, timeout=1):
+    def _connect_devices(self, pending, deadline=None):
+        """
+        Wait on the required signals of devices from :meth:`._prepare_device`.
+
+        Yields the name and the device as soon as each one connects, or the
+        name and None if the device times out. Every device has a finite
+        timeout, see :attr:`.connect_timeout`, so this always ends. Devices
+        that time out are not put in the negative cache, the callers retry
+        them through :attr:`.retry`.
+
+        Parameters
+        ----------
+        pending : dict
+            Mapping of device name to prepared information
+
+        deadline : float, optional
+            Time, as given by ``time.time``, at which every device that has not
+            connected is given up on
+        """
+        pending = OrderedDict(pending)
+        while pending:
+            now = time.time()
+            for name, info in list(pending.items()):
+                elapsed = now - info['start']
+                times = info['times']
+                for attr, seconds in times.items():
+                    if seconds is None and info['signals'][attr].connected:
+                        times[attr] = elapsed
+                done = None not in times.values()
+                expired = (elapsed >= info['timeout']
+                           or (deadline is not None and now >= deadline))
+                if done or expired:
+                    del pending[name]
+                    yield name, self._finish_device(name, info, elapsed)
+            if pending:
+                time.sleep(0.02)
+
+    def _finish_device(self, name, info, elapsed):
+        """
+        Record the metrics of a device that connected or timed out
+        """
+        times = info['times']
+        self.metrics.record_stage(name, 'connect', elapsed)
+        pvs = [(attr, getattr(sig, 'pvname', None), times.get(attr))
+               for attr, sig in info['signals'].items()]
+        self.metrics.record_signals(name, pvs)
+        missing = [attr for attr, t in times.items() if t is None]
+        if missing:
+            logger.error("Error loading device %s, signals %s did not "
+                         "connect within %.2f seconds", name, missing,
+                         elapsed)
+            return None
+        optional = len(info['signals']) - len(times)
+        if optional:
+            logger.debug("%s optional signals of %s will connect in the "
+                         "background", optional, name)
+        return info['device']
+
+    def load_device(self, name, timeout=None, role=None):
+        """
+        Load a device by name from happi
+
+        The happi file is expected to be configured with a `device_class` that
+        matches the necessary class from `pcdsdevices`, as well as information
+        under `args` and `kwargs` that are used to instantiate the device.
+
+        Only the signals marked as required by the device's
+        :class:`.ConnectionPolicy` are waited on, every other signal continues
+        to connect in the background. If the role of the device has an entry
+        in :attr:`.signal_profiles`, only the signals listed there are waited
+        on and the other lazy signals are never connected.
+
+        If the device fails to load for any reason, `None` is returned instead.
+        Names that are already known to be bad return `None` right away, see
+        :meth:`.known_bad`.
+        The time taken to find, construct and connect the device, as well as
+        the connection time of each signal, is stored in :attr:`.metrics`
+
+        Parameters
+        ----------
+        name : str
+            Name of the device
+
+        timeout : float, optional
+            Timeout for EPICS signal connections. By default, this is taken
+            from the connection policy of the device, or is
+            :attr:`.connect_timeout` if the policy has none
+
+        role : str, optional
+            What the device is used for in a system, one of
+            :attr:`.device_types`
+
+        Returns
+        -------
+        `pcdsdevices.Device` or `None`
+
+        """
+        with self.timer.phase('load_device ' + name):
+            info = self._prepare_device(name, timeout=timeout, role=role)
+            if info is None:
+                return None
+            for _, dev in self._connect_devices({name: info}):
+                return dev
+
+    def upstream(self, beamline):
+        """
+        Beamlines the beam passes through before reaching the given one, set
+        by :attr:`.beamline_upstream`. Beamlines that are not listed there are
+        assumed to branch off of :attr:`.default_upstream`
+
+        Parameters
+        ----------
+        beamline : str
+
+        Returns
+        -------
+        upstream : list of str
+        """
+        return list(self.beamline_upstream.get(beamline,
+                                               self.default_upstream))
+
+    def containers_for(self, beamline):
+        """
+        Active happi containers on the path of the beam to a hutch, ordered by
+        their ``z`` position.
+
+        This includes every device on the beamline itself, as well as the
+        devices on the upstream beamlines up to the branch point of the
+        hutch, taken to be the ``z`` of its first device. Upstream devices
+        past the branch point are on the other branch, not in the path.
+
+        Parameters
+        ----------
+        beamline : str
+            Name of the hutch beamline, e.g. 'XPP'
+
+        Returns
+        -------
+        containers : list
+        """
+        def z(container):
+            if container.z is None:
+                return float('inf')
+            return container.z
+        upstream = self.upstream(beamline)
+        active = [c for c in self.client.all_devices if c.active]
+        on_line = [c for c in active if c.beamline == beamline]
+        if not on_line:
+            logger.warning("No active devices found for beamline %s",
+                           beamline)
+            return []
+        branch = min(z(c) for c in on_line)
+        on_path = [c for c in active
+                   if c.beamline in upstream and c.z is not None
+                   and c.z <= branch]
+        return sorted(on_line + on_path, key=z)
+
+    def load_proxies(self, beamline=None, workers=4):
+        """
+        Create a :class:`.DeviceProxy` for every active device without loading
+        anything.
+
+        The proxies hold enough happi information to draw the lightpath right
+        away. Each real device is loaded in the background, by a pool of
+        ``workers`` threads, the first time its state is requested.
+
+        Parameters
+        ----------
+        beamline : str, optional
+            Only include the devices on the path to this hutch. See
+            :meth:`.containers_for`
+
+        workers : int, optional
+            Number of devices to load at the same time
+
+        Returns
+        -------
+        proxies : list
+        """
+        if beamline is None:
+            containers = [c for c in self.client.all_devices if c.active]
+        else:
+            containers = self.containers_for(beamline)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        return [DeviceProxy(container, self, executor)
+                for container in containers]
+
+    def iter_configuration(self, timeout=None, deadline=None,
+                           beamline=None):
+        """
+        Load the entire configuration, yielding each device as soon as it
+        connects.
+
+        Every device is constructed first so that all of the connections are
+        made at the same time. The happi container and the device are then
+        yielded in the order the devices connect. Devices that fail to load
+        are yielded with None in place of the device.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Timeout for EPICS signal connections of each device. By default,
+            this is taken from the connection policy of each device
+
+        deadline : float, optional
+            Limit on the total time spent loading devices. Devices that have
+            not connected before the deadline are yielded as failures
+
+        beamline : str, optional
+            Only load the devices on the path to this hutch, in order of their
+            ``z`` position. See :meth:`.containers_for`
+
+        Yields
+        ------
+        container : happi.Device
+
+        device : pcdsdevices.Device or None
+        """
+        if beamline is None:
+            logger.info("Loading LCLS Lightpath devices ...")
+            candidates = self.client.all_devices
+        else:
+            logger.info("Loading LCLS Lightpath devices for %s ...",
+                        beamline)
+            candidates = self.containers_for(beamline)
+        if deadline is not None:
+            deadline += time.time()
+        active = list()
+        for container in candidates:
+            if not container.active:
+                logger.debug("Ignore inactive device %s", container.name)
+            else:
+                active.append(container)
+        #Skip devices whose IOCs are not there
+        if self.prescan:
+            active, unreachable = self.scan_reachable(active)
+            for container in unreachable:
+                yield container, None
+        #Create all the devices
+        containers = dict()
+        pending = OrderedDict()
+        for container in active:
+            #Check the overall deadline
+            if deadline is not None and time.time() >= deadline:
+                logger.warning("Deadline reached, skipping %s",
+                               container.name)
+                yield container, None
+                continue
+            info = self._prepare_device(container.name, timeout=timeout)
+            if info is None:
+                yield container, None
+            else:
+                containers[container.name] = container
+                pending[container.name] = info
+        #Hand them out as they connect
+        for name, dev in self._connect_devices(pending, deadline=deadline):
+            yield containers[name], dev
+
+    def retry_containers(self, containers, timeout=None):
+        """
+        Keep retrying devices that failed to load in the background. Use
+        :meth:`.subscribe` to be told when they load.
+
+        Parameters
+        ----------
+        containers : list
+            Happi containers of the failed devices
+
+        timeout : float, optional
+            Timeout for EPICS signal connections of each device
+        """
+        for container in containers:
+            if self.known_bad(container.name):
+                logger.debug("Not retrying known bad device %s",
+                             container.name)
+                continue
+            self.retry.schedule(('device', container.name),
+                                partial(self._retry_device, container.name,
+                                        timeout),
+                                callback=partial(self._device_loaded,
+                                                 container))
+
+    def _retry_device(self, name, timeout):
+        """
+        Retry target for a single device, returns None while it is missing.
+        """
+        dev = self.load_device(name, timeout=timeout)
+        if dev is None and self.known_bad(name):
+            logger.error("Stopped retrying %s, it is known to be bad", name)
+            self.retry.cancel(('device', name))
+        return dev
+
+    def load_configuration(self, timeout=None, deadline=None, retry=False,
+                           beamline=None):
         """
         Load the entire configuration
 
         In order to still represent devices in the lightpath that fail to load,
         if a device fails on intialization the happi container is returned
-        instead.
+        instead. See :meth:`.iter_configuration` to receive the devices as they
+        connect.
 
         Parameters
         ----------
         timeout : float, optional
-            Timeout for EPICS signal connections
+            Timeout for EPICS signal connections of each device. By default,
+            this is taken from the connection policy of each device
+
+        deadline : float, optional
+            Limit on the total time spent loading devices. Devices that have
+            not connected before the deadline are returned as containers
+
+        retry : bool, optional
+            Keep retrying the devices that failed in the background, see
+            :meth:`.retry_containers`
+
+        beamline : str, optional
+            Only load the devices on the path to this hutch, in order of their
+            ``z`` position. See :meth:`.containers_for`
 
         Returns
         -------
@@ -268,27 +1305,24 @@ class ConfigReader:
         #Load devices
         devices = list()
         containers = list()
-        logger.info("Loading LCLS Lightpath devices ...")
-        #Iterate through all the devices
-        for container in self.client.all_devices:
-            #Create a device
-            if not container.active:
-                logger.debug("Ignore inactive device %s", container.name)
-                continue
-
-            dev = self.load_device(container.name,
-                                   timeout=timeout)
+        for container, dev in self.iter_configuration(timeout=timeout,
+                                                      deadline=deadline,
+                                                      beamline=beamline):
             #Add to our list
             if dev is not None:
                 devices.append(dev)
             else:
                 containers.append(container)
+        #Keep trying the failures in the background
+        if retry:
+            self.retry_containers(containers, timeout=timeout)
         #Return a list of devices
         return devices, containers
 
 
 class SimConfigReader(ConfigReader):
-    def __init__(self):
+    def __init__(self, timer=None):
+        self._init_state(timer=timer)
         self.client = None
         self.live_systems = {}
         self._devs = {}
@@ -301,13 +1335,30 @@ class SimConfigReader(ConfigReader):
                     continue
                 self.live_systems[sysname][devstr] = name
                 self._devs[name] = device
-        self.cache = sim_config
+        for system, system_objs in sim_config.items():
+            self._store(system, system_objs)
 
     def get_subsystem(self, system, *args, **kwargs):
-        return self.cache[system]
+        with self._lock:
+            self._touch(system)
+            return self.cache[system]
 
     def load_device(self, name, *args, **kwargs):
         return self._devs[name]
 
     def load_configuration(self):
         return list(self._devs.values()), []
+
+    def z_position(self, name):
+        try:
+            z = self._devs[name].sim_z
+        except (KeyError, AttributeError):
+            return None
+        return float(getattr(z, 'value', z))
+
+    def pixel_size(self, name):
+        try:
+            dev = self._devs[name]
+            return dev.resolution[0] / dev.size[0] * 1e6
+        except (KeyError, AttributeError, IndexError, TypeError):
+            return None
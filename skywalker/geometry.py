@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def centroid_mask(values):
+    """
+    Which centroid readings can be trusted. The stats plugin reports a
+    centroid of 0 when there is no beam on the imager, so zero, negative and
+    NaN readings are not.
+
+    Parameters
+    ----------
+    values : array_like
+        Any number of centroid readings
+
+    Returns
+    -------
+    mask : np.ndarray
+        True for every valid reading
+    """
+    values = np.asarray(values, dtype=float)
+    return np.isfinite(values) & (values > 0)
+
+
+def valid_centroids(values):
+    """
+    Whether every centroid reading can be trusted, see :func:`.centroid_mask`
+
+    Parameters
+    ----------
+    values : array_like
+        Any number of centroid readings
+
+    Returns
+    -------
+    valid : bool
+    """
+    return bool(np.all(centroid_mask(values)))
+
+
+def first_step(error, distance, pixel_size, sign=1):
+    """
+    Pitch change that moves a centroid by ``error`` pixels, from the lever
+    arm between a mirror and an imager.
+
+    Tilting a mirror by an angle deflects the reflected beam by twice that
+    angle, so the spot on an imager ``distance`` downstream moves by
+    ``2 * angle * distance``.
+
+    Parameters
+    ----------
+    error : float
+        Centroid minus goal, in pixels
+
+    distance : float
+        Distance from the mirror to the imager, in meters
+
+    pixel_size : float
+        Size of a pixel on the imager, in microns
+
+    sign : int, optional
+        Direction the centroid moves for a positive pitch change
+
+    Returns
+    -------
+    step : float
+        Pitch change in microradians, which cancels the error
+    """
+    return -sign * error * pixel_size / (2 * distance)
+
+
+def solve_corrections(matrix, errors):
+    """
+    Pitch changes of every mirror at once that best cancel the centroid
+    errors, in the least squares sense.
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        Response matrix of shape (imagers, mirrors), the centroid motion on
+        each imager per unit of pitch of each mirror
+
+    errors : list of float
+        Centroid minus goal on each imager
+
+    Returns
+    -------
+    steps : np.ndarray
+        Change of pitch for each mirror
+    """
+    errors = np.asarray(errors, dtype=float)
+    return np.linalg.lstsq(np.asarray(matrix, dtype=float), -errors,
+                           rcond=None)[0]
+
+
+def predict_first_steps(errors, distances, pixel_sizes, default, matrix=None,
+                        minimum=None, maximum=None):
+    """
+    Initial pitch step of each mirror of an alignment.
+
+    A measured response matrix, if there is one, solves all of the steps
+    together, see :func:`.solve_corrections`. Otherwise the size of each
+    mirror's step comes from the geometry of :func:`.first_step`, and its
+    sign from ``default``, since the direction the spot moves depends on the
+    mirror and the camera. The step is ``default`` when the error, the
+    distance or the pixel size is not known. Every step is then clamped
+    between ``minimum`` and ``maximum`` in size.
+
+    Parameters
+    ----------
+    errors : list of float or None
+        Centroid minus goal on the imager of each mirror, in pixels
+
+    distances : list of float or None
+        Distance from each mirror to its imager, in meters
+
+    pixel_sizes : list of float or None
+        Size of a pixel on each imager, in microns
+
+    default : float
+        Step used when nothing better is known
+
+    matrix : np.ndarray, optional
+        Response matrix of shape (imagers, mirrors), in pixels per pitch unit
+
+    minimum : float, optional
+        Smallest step size, so that the alignment still sees the centroid
+        move when it starts almost on the goal. Defaults to a tenth of
+        ``default``
+
+    maximum : float, optional
+        Largest step size, so that a short lever arm or a large error does
+        not send the beam off the imager. Defaults to three times
+        ``default``
+
+    Returns
+    -------
+    steps : list of float
+    """
+    if minimum is None:
+        minimum = abs(default) / 10
+    if maximum is None:
+        maximum = abs(default) * 3
+    if matrix is not None and None not in errors:
+        steps = list(solve_corrections(matrix, errors))
+    else:
+        steps = []
+        for error, distance, size in zip(errors, distances, pixel_sizes):
+            if error is None or not distance or not size:
+                steps.append(default)
+            else:
+                step = first_step(error, distance, size)
+                steps.append(np.copysign(step, default))
+    result = []
+    for step in steps:
+        size = min(max(abs(step), minimum), maximum)
+        result.append(float(np.copysign(size, step)))
+    logger.debug('Predicted first steps %s from errors %s', result, errors)
+    return result
@@ -1,21 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import time
 import logging
 from os import path
 from functools import partial
+from collections import OrderedDict
 from threading import RLock
 
+import numpy as np
 import simplejson as json
 
 from bluesky import RunEngine
+from bluesky.suspenders import SuspendBoolLow
 from bluesky.utils import install_qt_kicker
 from bluesky.preprocessors import run_wrapper, stage_wrapper
 
 from pydm import Display
 from pydm.PyQt.QtCore import (pyqtSlot, pyqtSignal,
                               QCoreApplication,
-                              QObject, QEvent)
-from pydm.PyQt.QtGui import QDoubleValidator, QDialog
+                              QObject, QEvent, QFileSystemWatcher, QTimer)
+from pydm.PyQt.QtGui import QDoubleValidator, QDialog, QPushButton
 
 from pcdsdevices.epics.attenuator import FeeAtt
 from pswalker.plan_stubs import slit_scan_fiducialize
@@ -23,15 +27,34 @@ from pswalker.suspenders import (BeamEnergySuspendFloor,
                                  BeamRateSuspendFloor)
 from pswalker.skywalker import skywalker
 
+from skywalker.centroid import BeamWatch
 from skywalker.config import ConfigReader, SimConfigReader, sim_alignments
 from skywalker.logger import GuiHandler
+from skywalker.profiling import PhaseTimer
 from skywalker.utils import ad_stats_x_axis_rot
 from skywalker.settings import Setting, SettingsGroup
+from skywalker.subscriptions import SubscriptionRegistry
+from skywalker.workers import FramePool
+from skywalker.recorder import FrameRecorder
+from skywalker.thumbnails import ThumbnailWall
+from skywalker.history import History
+from skywalker.stripchart import StripChart
+from skywalker.monitor import DriftMonitor
+from skywalker.steering import (steer, measure_response, correct,
+                                check_response, valid_centroids)
+from skywalker.geometry import predict_first_steps
 from skywalker.widgetgroup import (ObjWidgetGroup, ValueWidgetGroup,
                                    ImgObjWidget)
 
 logger = logging.getLogger(__name__)
 MAX_MIRRORS = 2
+# Systems kept connected that are not on screen or in the active procedure
+CACHE_SIZE = 12
+# Seconds before an unused system is disconnected
+CACHE_IDLE = 1800
+# History series filled from the frame pool, by key of the moments
+POOL_SERIES = OrderedDict([('sum', 'intensity'), ('sigma_x', 'width x'),
+                           ('sigma_y', 'width y')])
 
 
 class SkywalkerGui(Display):
@@ -50,11 +73,22 @@ class SkywalkerGui(Display):
     dark : bool, optional
         Choice to launch the application with a dark stylesheet
 
+    profile_startup : bool, optional
+        Report the time spent in each initialization phase in the gui log. The
+        report is always written to the debug log file.
+
     parent : QWidget
         Parent Widget of application
     """
-    def __init__(self, parent=None, live=False, cfg=None,  dark=True):
-        super().__init__(parent=parent)
+    system_loaded = pyqtSignal(str)
+    drift_alert = pyqtSignal(str, float)
+
+    def __init__(self, parent=None, live=False, cfg=None,  dark=True,
+                 profile_startup=False):
+        startup_timer = PhaseTimer('Skywalker startup')
+        with startup_timer.phase('pydm display'):
+            super().__init__(parent=parent)
+        self.startup_timer = startup_timer
         ui = self.ui
 
         #Change the stylesheet
@@ -77,6 +111,7 @@ class SkywalkerGui(Display):
                             filename='./skywalker_debug.log',
                             filemode='a')
 
+        self.startup_timer.mark('config')
         # Set self.sim, self.loader, self.nominal_config
         self.sim = not live
         self.config_folder = cfg
@@ -97,17 +132,43 @@ class SkywalkerGui(Display):
         for align in self.alignments.keys():
             ui.procedure_combo.addItem(align)
 
+        self.startup_timer.mark('first subsystem')
         # Pick out some initial parameters from system and alignment dicts
         first_system_key = list(self.alignments.values())[0][0][0]
+        self.image_system = first_system_key
+        self.loader.pin([first_system_key])
         first_set = self.loader.get_subsystem(first_system_key)
         first_imager = first_set.get('imager', None)
         first_slit = first_set.get('slits', None)
         first_rotation = first_set.get('rotation', 0)
 
+        self.startup_timer.mark('widget groups')
         # self.procedure and self.image_obj keep track of the gui state
         self.procedure = 'None'
         self.image_obj = first_imager
 
+        # Every ophyd subscription the gui makes goes through here
+        self.subs = SubscriptionRegistry()
+
+        # Whether the imagers of the running plan see beam
+        self.beam_watch = BeamWatch()
+
+        # Frame analysis for every imager in the procedure
+        self.frame_pool = None
+        self.recorder = None
+
+        # Small views of every imager in the procedure
+        self.thumbnail_wall = ThumbnailWall(registry=self.subs)
+
+        # Centroids and pitches of the procedure over the whole shift
+        self.history = History()
+        self.history_chart = StripChart(self.history)
+
+        # Watch the history for drift once an alignment is done
+        self.drift_monitor = DriftMonitor(self.history,
+                                          self.drift_alert.emit)
+        self.drift_alert.connect(self.on_drift_alert)
+
         # Initialize slit readback
         self.slit_group = ObjWidgetGroup([ui.slit_x_width,
                                           ui.slit_y_width,
@@ -174,32 +235,67 @@ class SkywalkerGui(Display):
                                         ui.image_state,
                                         ui.image_state_select,
                                         ui.readback_imager_title,
-                                        self, first_rotation)
+                                        self, first_rotation,
+                                        registry=self.subs)
         ui.image.setColorMapToPreset('jet')
 
+        self.startup_timer.mark('settings')
         # Initialize the settings window.
         first_step = Setting('first_step', 6.0)
         tolerance = Setting('tolerance', 5.0)
         averages = Setting('averages', 100)
         timeout = Setting('timeout', 600.0)
         tol_scaling = Setting('tol_scaling', 8.0)
+        predict_step = Setting('predict_step', False)
+        max_first_step = Setting('max_first_step', 18.0)
+        pixel_size = Setting('pixel_size', 20.0)
         min_beam = Setting('min_beam', 1.0, required=False)
         min_rate = Setting('min_rate', 1.0, required=False)
         slit_width = Setting('slit_width', 0.2)
         samples = Setting('samples', 100)
         close_fee_att = Setting('close_fee_att', True)
+        soft_centroid = Setting('soft_centroid', False)
+        pool_workers = Setting('pool_workers', 0)
+        image_fps = Setting('image_fps', 5.0)
+        record_frames = Setting('record_frames', False)
+        record_dir = Setting('record_dir', '~/skywalker_recordings')
+        record_max_frames = Setting('record_max_frames', 1000)
+        record_rate = Setting('record_rate', 1.0, required=False)
+        drift_threshold = Setting('drift_threshold', 10.0, required=False)
+        drift_hold = Setting('drift_hold', 60.0)
+        auto_realign = Setting('auto_realign', False)
+        steer_gain = Setting('steer_gain', 0.5)
+        steer_deadband = Setting('steer_deadband', 2.0)
+        steer_max_step = Setting('steer_max_step', 1.0)
+        steer_max_excursion = Setting('steer_max_excursion', 10.0)
+        steer_period = Setting('steer_period', 1.0)
+        steer_averages = Setting('steer_averages', 5)
+        response_step = Setting('response_step', 1.0)
+        response_averages = Setting('response_averages', 10)
+        max_correction = Setting('max_correction', 5.0)
         self.settings = SettingsGroup(
             parent=self,
-            collumns=[['alignment'], ['slits', 'suspenders', 'setup']],
-            alignment=[first_step, tolerance, averages, timeout, tol_scaling],
+            collumns=[['alignment', 'drift'],
+                      ['slits', 'suspenders', 'setup', 'recording'],
+                      ['steering', 'response']],
+            alignment=[first_step, tolerance, averages, timeout,
+                       tol_scaling, predict_step, max_first_step,
+                       pixel_size],
+            drift=[drift_threshold, drift_hold, auto_realign],
+            steering=[steer_gain, steer_deadband, steer_max_step,
+                      steer_max_excursion, steer_period, steer_averages],
+            response=[response_step, response_averages, max_correction],
             suspenders=[min_beam, min_rate],
             slits=[slit_width, samples],
-            setup=[close_fee_att])
+            setup=[close_fee_att, soft_centroid, pool_workers, image_fps],
+            recording=[record_frames, record_dir, record_max_frames,
+                       record_rate])
         self.settings_cache = {}
         self.load_settings()
         self.restore_settings()
         self.cache_settings()  # Required in case nothing is loaded
 
+        self.startup_timer.mark('run engine')
         # Create the RunEngine that will be used in the alignments.
         # This gives us the ability to pause, etc.
         self.RE = RunEngine({})
@@ -216,6 +312,7 @@ class SkywalkerGui(Display):
             self.ui.status_label.setText(txt)
         RunEngine.state._memory[self.RE].set_ = new_set
 
+        self.startup_timer.mark('signals and hooks')
         # Connect relevant signals and slots
         procedure_changed = ui.procedure_combo.currentIndexChanged[str]
         procedure_changed.connect(self.on_procedure_combo_changed)
@@ -248,10 +345,49 @@ class SkywalkerGui(Display):
         settings_pressed = ui.settings_button.clicked
         settings_pressed.connect(self.on_settings_button)
 
+        self.dark_button = self.add_advanced_button(
+            'Take Dark', self.on_dark_button,
+            'Average frames from the imager on screen, with the beam '
+            'off, into its dark frame')
+        self.overview_button = self.add_advanced_button(
+            'Overview', self.on_overview_button,
+            'Show every imager in the procedure at once')
+        self.history_button = self.add_advanced_button(
+            'History', self.on_history_button,
+            'Plot the centroids and mirror pitches of the procedure')
+        self.steer_button = self.add_advanced_button(
+            'Steer', self.on_steer_button,
+            'Hold the beam at the goals until aborted')
+        self.response_button = self.add_advanced_button(
+            'Measure Response', self.on_response_button,
+            'Step each mirror to see how it moves the centroids')
+        self.correct_button = self.add_advanced_button(
+            'Correct', self.on_correct_button,
+            'Move every mirror at once using the measured response')
+
         for i, nominal_button in enumerate(mirror_nominals):
             nominal_pressed = nominal_button.clicked
             nominal_pressed.connect(partial(self.on_move_nominal_button, i))
 
+        # Systems that finish loading in the background
+        self.system_loaded.connect(self.on_system_loaded)
+        self.loader.subscribe(self.system_loaded_cb)
+
+        # Disconnect from systems nobody has looked at in a while
+        self.loader.subscribe(self.system_evicted_cb,
+                              event_type=self.loader.SUB_EVICTED)
+        self.evict_timer = QTimer(self)
+        self.evict_timer.timeout.connect(self.on_evict_timer)
+        self.evict_timer.start(60000)
+
+        # Pick up edits to the configuration files without a restart
+        self.config_watcher = QFileSystemWatcher(self)
+        if not self.sim:
+            self.config_watcher.addPaths([self.system_config,
+                                          self.alignment_config])
+        config_changed = self.config_watcher.fileChanged
+        config_changed.connect(self.on_config_file_changed)
+
         self.cam_lock = RLock()
 
         # Store some info about our screen size.
@@ -267,11 +403,18 @@ class SkywalkerGui(Display):
         self.installEventFilter(post_init)
         post_init.post_init.connect(self.on_post_init)
 
+        self.startup_timer.mark('logger')
         # Setup the on-screen logger
         console = self.setup_gui_logger()
 
         # Stop the run if we get closed
-        close_dict = dict(RE=self.RE, console=console)
+        close_dict = dict(RE=self.RE, console=console,
+                          loader=self.loader, subs=self.subs,
+                          thumbnail_wall=self.thumbnail_wall,
+                          history_chart=self.history_chart,
+                          drift_monitor=self.drift_monitor,
+                          beam_watch=self.beam_watch)
+        self.close_dict = close_dict
         self.destroyed.connect(partial(SkywalkerGui.on_close, close_dict))
 
         # Put out the initialization message.
@@ -282,6 +425,15 @@ class SkywalkerGui(Display):
             init_str = init_base + 'live mode.'
         logger.info(init_str)
 
+        # Report how long each part of the startup took
+        self.startup_timer.stop()
+        if profile_startup:
+            self.startup_timer.log_summary(logging.INFO)
+            self.loader.metrics.log_report(level=logging.INFO)
+        else:
+            self.startup_timer.log_summary(logging.DEBUG)
+            self.loader.metrics.log_report(level=logging.DEBUG)
+
     def init_config(self):
         if self.config_folder is None:
             this_dir = path.dirname(__file__)
@@ -303,9 +455,12 @@ class SkywalkerGui(Display):
 
     def load_system(self):
         if self.sim:
-            self.loader = SimConfigReader()
+            self.loader = SimConfigReader(timer=self.startup_timer)
         else:
-            self.loader = ConfigReader(self.happi_config, self.system_config)
+            self.loader = ConfigReader(self.happi_config, self.system_config,
+                                       timer=self.startup_timer,
+                                       cache_size=CACHE_SIZE,
+                                       idle_timeout=CACHE_IDLE)
 
     def load_alignments(self):
         if self.sim:
@@ -328,6 +483,15 @@ class SkywalkerGui(Display):
         RE = close_dict['RE']
         console = close_dict['console']
         console.close()
+        close_dict['loader'].retry.stop()
+        close_dict['thumbnail_wall'].close()
+        close_dict['history_chart'].close()
+        close_dict['drift_monitor'].stop()
+        close_dict['beam_watch'].stop()
+        close_dict['subs'].clear()
+        frame_pool = close_dict.get('frame_pool')
+        if frame_pool is not None:
+            frame_pool.stop()
         if RE.state != 'idle':
             RE.abort()
 
@@ -364,6 +528,8 @@ class SkywalkerGui(Display):
             # Assume that imagers have exactly one slit and one rotation
             # Therefore, we can pick an arbitrary system entry that includes
             # the imager
+            self.image_system = systems[0]
+            self.pin_systems()
             objs = self.loader.get_subsystem(systems[0])
             # This may have entries or may be missing entries if there was a
             # problem.
@@ -378,9 +544,156 @@ class SkywalkerGui(Display):
             slits_obj = objs.get('slits')
             if slits_obj is not None:
                 self.slit_group.change_obj(slits_obj)
+            # Make room in the cache now that the old imager is unpinned
+            self.loader.evict()
         except:
             logger.exception('Error on selecting imager')
 
+    def system_loaded_cb(self, *args, system=None, **kwargs):
+        """
+        Callback from the loader's retry thread, moves the notification to
+        the gui thread.
+        """
+        if system is not None:
+            self.system_loaded.emit(system)
+
+    @pyqtSlot(str)
+    def on_system_loaded(self, system):
+        """
+        Slot for when a system that failed to load finally connects. Refresh
+        any widgets that are showing that system.
+
+        Parameters
+        ----------
+        system: str
+            name of the system that loaded
+        """
+        try:
+            logger.info('Finished loading %s', system)
+            if system in self.active_system():
+                self.on_procedure_combo_changed(self.procedure)
+            imager_name = self.loader.live_systems[system].get('imager')
+            if imager_name == self.ui.image_title_combo.currentText():
+                self.on_image_combo_changed(imager_name)
+            # The loader never evicts on its own retry thread
+            self.loader.evict()
+        except:
+            logger.exception('Error on loading system')
+
+    def system_evicted_cb(self, *args, destroyed=(), **kwargs):
+        """
+        Callback from the loader when a system is evicted from its cache.
+        Removes our subscriptions from the devices that are torn down. Only
+        the gui thread calls :meth:`.ConfigReader.evict`, so this runs there
+        too.
+        """
+        for device in destroyed:
+            self.subs.clear_object(device)
+
+    @pyqtSlot()
+    def on_evict_timer(self):
+        """
+        Slot for the periodic check for systems that have been idle too long.
+        """
+        try:
+            self.loader.evict()
+        except:
+            logger.exception('Error on evicting idle systems')
+
+    def pin_systems(self):
+        """
+        Keep the systems on screen and in the active procedure in the loader's
+        cache.
+        """
+        self.loader.pin(self.active_system() + [self.image_system])
+
+    @pyqtSlot(str)
+    def on_config_file_changed(self, filename):
+        """
+        Slot for when the system or alignment file changes on disk. Only the
+        systems and procedures that changed are reloaded, every other device
+        stays connected.
+
+        Parameters
+        ----------
+        filename: str
+            path of the file that changed
+        """
+        try:
+            # Editors that replace the file take it out of the watcher
+            if (filename not in self.config_watcher.files()
+                    and path.exists(filename)):
+                self.config_watcher.addPath(filename)
+            if filename == self.system_config:
+                logger.info('Reloading system configuration.')
+                _, removed, changed = self.loader.reload_systems()
+                stale = set(removed + changed)
+                self.reload_imager_combo(stale)
+                if stale.intersection(self.active_system()):
+                    self.on_procedure_combo_changed(self.procedure)
+            elif filename == self.alignment_config:
+                logger.info('Reloading alignment configuration.')
+                old_alignments = self.alignments
+                self.load_alignments()
+                self.reload_procedure_combo(old_alignments)
+        except:
+            logger.exception('Error on reloading configuration')
+
+    def reload_imager_combo(self, stale=()):
+        """
+        Refill the imager combo box from the loader's systems, keeping the
+        current selection if it still exists.
+
+        Parameters
+        ----------
+        stale: set, optional
+            Systems whose devices were dropped. If the visible imager belongs
+            to one of these, it is loaded again.
+        """
+        combo = self.ui.image_title_combo
+        current = combo.currentText()
+        self.all_imager_names = [entry['imager'] for entry in
+                                 self.loader.live_systems.values()]
+        combo.blockSignals(True)
+        combo.clear()
+        for imager_name in self.all_imager_names:
+            combo.addItem(imager_name)
+        if current in self.all_imager_names:
+            combo.setCurrentIndex(self.all_imager_names.index(current))
+        combo.blockSignals(False)
+        systems = self.loader.get_systems_with(current)
+        if current not in self.all_imager_names:
+            self.on_image_combo_changed(combo.currentText())
+        elif stale.intersection(systems):
+            self.on_image_combo_changed(current)
+
+    def reload_procedure_combo(self, old_alignments):
+        """
+        Refill the procedure combo box from the alignments, keeping the
+        current selection if it still exists.
+
+        Parameters
+        ----------
+        old_alignments: dict
+            The alignments before the reload. The active procedure is set up
+            again if its systems changed.
+        """
+        combo = self.ui.procedure_combo
+        names = ['None'] + list(self.alignments.keys())
+        combo.blockSignals(True)
+        combo.clear()
+        for name in names:
+            combo.addItem(name)
+        if self.procedure in names:
+            combo.setCurrentIndex(names.index(self.procedure))
+        combo.blockSignals(False)
+        if self.procedure not in names:
+            logger.info('Procedure %s was removed.', self.procedure)
+            self.on_procedure_combo_changed('None')
+        elif (self.alignments.get(self.procedure)
+              != old_alignments.get(self.procedure)):
+            self.on_procedure_combo_changed(self.procedure)
+
     @pyqtSlot(str)
     def on_procedure_combo_changed(self, procedure_name):
         """
@@ -396,7 +709,12 @@ class SkywalkerGui(Display):
         try:
             logger.info('Selecting procedure %s', procedure_name)
             self.procedure = procedure_name
+            self.subs.clear_group('procedure')
+            self.subs.clear_group('history')
+            self.drift_monitor.set_targets({})
+            self.pin_systems()
             if procedure_name == 'None':
+                self.update_frame_pool()
                 return
             else:
                 self.load_active_system()
@@ -422,6 +740,10 @@ class SkywalkerGui(Display):
                     else:
                         widgets.checkbox.setEnabled(True)
                     widgets.show()
+            self.update_frame_pool()
+            self.update_history()
+            self.thumbnail_wall.set_imagers(self.imagers(),
+                                            self._objs('rotation'))
         except:
             logger.exception('Error on selecting procedure')
 
@@ -463,6 +785,7 @@ class SkywalkerGui(Display):
 
                 logger.info("Starting %s procedure with goals %s",
                             self.procedure, raw_goals)
+                self.drift_monitor.set_targets({})
                 self.install_pick_cam()
                 self.auto_switch_cam = True
                 alignment = self.alignments[self.procedure]
@@ -485,14 +808,19 @@ class SkywalkerGui(Display):
                     # coordinates.
                     det_rbv = []
                     goals = []
+                    centroids = []
                     for rot, yag, goal in zip(rots, yags, raw_goals):
                         rot_info = ad_stats_x_axis_rot(yag, rot)
                         det_rbv.append(rot_info['key'])
+                        centroids.append(rot_info['x_cent'])
                         modifier = rot_info['mod_x']
                         if modifier is not None:
                             goal = modifier - goal
                         goals.append(goal)
                     first_steps = self.settings_cache['first_step']
+                    if self.settings_cache.get('predict_step'):
+                        first_steps = self.predict_first_steps(
+                            key_set, yags, mots, centroids, goals)
                     tolerances = self.settings_cache['tolerance']
                     average = self.settings_cache['averages']
                     timeout = self.settings_cache['timeout']
@@ -513,8 +841,11 @@ class SkywalkerGui(Display):
                                      sim=self.sim, use_filters=not self.sim,
                                      tol_scaling=tol_scaling,
                                      extra_stage=extra_stage)
-                    self.initialize_RE()
+                    self.initialize_RE(yags)
+                    self.start_recording()
                     self.RE(plan)
+                if self.RE.state == 'idle':
+                    self.arm_drift_monitor()
             elif self.RE.state == 'paused':
                 logger.info("Resuming procedure.")
                 self.install_pick_cam()
@@ -524,6 +855,9 @@ class SkywalkerGui(Display):
             logger.exception('Error in running procedure')
         finally:
             self.auto_switch_cam = False
+            if self.RE.state == 'idle':
+                self.stop_recording()
+                self.beam_watch.stop()
 
     @pyqtSlot()
     def on_pause_button(self):
@@ -552,6 +886,8 @@ class SkywalkerGui(Display):
                 self.RE.abort()
             except:
                 logger.exception("Error on abort.")
+        self.stop_recording()
+        self.beam_watch.stop()
 
     @pyqtSlot()
     def on_slits_button(self):
@@ -595,7 +931,7 @@ class SkywalkerGui(Display):
                     output = modifier - output
                 output_obj[img.name] = output
 
-            self.initialize_RE()
+            self.initialize_RE(image_to_check)
             results = {}
             for img, slit in zip(image_to_check, slits_to_check):
                 systems = self.loader.get_systems_with(img.name)
@@ -619,6 +955,8 @@ class SkywalkerGui(Display):
             logger.exception('Error on slits button')
         finally:
             self.auto_switch_cam = False
+            if self.RE.state == 'idle':
+                self.beam_watch.stop()
 
     @pyqtSlot()
     def on_save_mirrors_button(self):
@@ -649,6 +987,7 @@ class SkywalkerGui(Display):
             if dialog_return == QDialog.Accepted:
                 self.cache_settings()
                 self.save_settings()
+                self.update_frame_pool()
                 logger.info('Settings saved.')
             elif dialog_return == QDialog.Rejected:
                 self.restore_settings()
@@ -656,6 +995,169 @@ class SkywalkerGui(Display):
         except:
             logger.exception('Error on opening settings')
 
+    def add_advanced_button(self, text, slot, tooltip):
+        """
+        Add a button that looks like the others to the advanced section.
+        """
+        template = self.ui.settings_button
+        button = QPushButton(text, self)
+        button.setFont(template.font())
+        button.setSizePolicy(template.sizePolicy())
+        button.setMinimumSize(template.minimumSize())
+        button.setMaximumSize(template.maximumSize())
+        button.setToolTip(tooltip)
+        self.ui.advanced_layout.addWidget(button)
+        button.clicked.connect(slot)
+        return button
+
+    @pyqtSlot()
+    def on_overview_button(self):
+        """
+        Slot for the overview button, shows the thumbnail wall.
+        """
+        try:
+            self.thumbnail_wall.show()
+            self.thumbnail_wall.raise_()
+        except:
+            logger.exception('Error on opening the overview')
+
+    @pyqtSlot()
+    def on_steer_button(self):
+        """
+        Slot for the steer button. Runs the steering plan on every mirror of
+        the procedure until it is aborted, or until a mirror reaches the
+        steer_max_excursion setting. Needs the measured response matrix of
+        the procedure.
+        """
+        try:
+            targets = self.feedback_targets(need_goals=True)
+            if targets is None:
+                return
+            responses = self.response_matrix()
+            if responses is None:
+                logger.info('Measure the response of %s first.',
+                            self.procedure)
+                return
+            imagers, mirrors, centroids, goals = targets
+            plan = steer(
+                imagers, mirrors, centroids, goals, responses,
+                gain=self.settings_cache['steer_gain'],
+                deadband=self.settings_cache['steer_deadband'],
+                max_step=self.settings_cache['steer_max_step'],
+                max_excursion=self.settings_cache['steer_max_excursion'],
+                period=self.settings_cache['steer_period'],
+                averages=self.settings_cache['steer_averages'],
+                md=dict(procedure=self.procedure))
+            logger.info('Steering %s, abort to stop.', self.procedure)
+            self.drift_monitor.set_targets({})
+            self.initialize_RE(imagers)
+            self.start_recording()
+            self.RE(plan)
+        except:
+            logger.exception('Error in steering')
+        finally:
+            if self.RE.state == 'idle':
+                self.stop_recording()
+                self.beam_watch.stop()
+
+    @pyqtSlot()
+    def on_response_button(self):
+        """
+        Slot for the measure response button. Steps every mirror of the
+        procedure and saves how the centroids moved.
+        """
+        try:
+            targets = self.feedback_targets(need_goals=False)
+            if targets is None:
+                return
+            imagers, mirrors, centroids, _ = targets
+            output = {}
+            plan = measure_response(
+                imagers, mirrors, centroids, output,
+                step=self.settings_cache['response_step'],
+                averages=self.settings_cache['response_averages'],
+                md=dict(procedure=self.procedure))
+            logger.info('Measuring the response of %s.', self.procedure)
+            self.initialize_RE(imagers)
+            self.RE(plan)
+            if 'matrix' in output:
+                logger.info('Response matrix of %s: %s', self.procedure,
+                            output['matrix'].tolist())
+                self.save_response(mirrors, imagers, output['matrix'])
+        except:
+            logger.exception('Error measuring the response matrix')
+        finally:
+            if self.RE.state == 'idle':
+                self.beam_watch.stop()
+
+    @pyqtSlot()
+    def on_correct_button(self):
+        """
+        Slot for the correct button. Moves every mirror of the procedure at
+        once using the measured response matrix.
+        """
+        try:
+            targets = self.feedback_targets(need_goals=True)
+            if targets is None:
+                return
+            matrix = self.response_matrix()
+            if matrix is None:
+                logger.info('Measure the response of %s first.',
+                            self.procedure)
+                return
+            imagers, mirrors, centroids, goals = targets
+            plan = correct(
+                imagers, mirrors, centroids, goals, matrix,
+                tolerance=self.settings_cache['tolerance'],
+                max_correction=self.settings_cache['max_correction'],
+                averages=self.settings_cache['response_averages'],
+                md=dict(procedure=self.procedure))
+            logger.info('Correcting %s with goals %s', self.procedure, goals)
+            self.drift_monitor.set_targets({})
+            self.initialize_RE(imagers)
+            self.start_recording()
+            self.RE(plan)
+            if self.RE.state == 'idle':
+                self.arm_drift_monitor()
+        except:
+            logger.exception('Error in correcting')
+        finally:
+            if self.RE.state == 'idle':
+                self.stop_recording()
+                self.beam_watch.stop()
+
+    @pyqtSlot()
+    def on_history_button(self):
+        """
+        Slot for the history button, shows the strip chart and logs the
+        jitter and drift of the last ten minutes.
+        """
+        try:
+            self.history_chart.show()
+            self.history_chart.raise_()
+            stats = self.history.stats(since=time.time() - 600)
+            for name in self.history_names():
+                if stats.get(name):
+                    logger.info('%s: jitter %.3g, drift %.3g per hour',
+                                name, stats[name]['jitter'],
+                                stats[name]['drift'])
+        except:
+            logger.exception('Error on opening the history')
+
+    @pyqtSlot()
+    def on_dark_button(self):
+        """
+        Slot for the dark frame button.
+        """
+        try:
+            if self.image_group.capture_background():
+                logger.info('Taking a dark frame, make sure the beam is off.')
+            else:
+                logger.info('Enable soft_centroid in the settings to use '
+                            'dark frames.')
+        except:
+            logger.exception('Error on taking a dark frame')
+
     @pyqtSlot(int)
     def on_move_nominal_button(self, index):
         try:
@@ -675,9 +1177,15 @@ class SkywalkerGui(Display):
         except Exception:
             logger.exception('Misc error on move nominal button')
 
-    def initialize_RE(self):
+    def initialize_RE(self, imagers=()):
         """
         Set up the RunEngine for the current cached settings.
+
+        Parameters
+        ----------
+        imagers : list, optional
+            Imagers of the plan about to run. With soft_centroid, the plan
+            is suspended while any of them that is inserted sees no beam
         """
         self.RE.clear_suspenders()
         min_beam = self.settings_cache['min_beam']
@@ -687,6 +1195,344 @@ class SkywalkerGui(Display):
                                                              averages=100))
         if min_rate is not None:
             self.RE.install_suspender(BeamRateSuspendFloor(min_rate, sleep=5))
+        # Do not spend averages on frames without beam
+        self.beam_watch.stop()
+        imagers = [imager for imager in imagers if imager is not None]
+        if self.settings_cache.get('soft_centroid') and imagers:
+            self.beam_watch.start(imagers, registry=self.subs)
+            self.RE.install_suspender(SuspendBoolLow(self.beam_watch.beam,
+                                                     sleep=1))
+
+    def update_frame_pool(self):
+        """
+        Feed the imagers of the active procedure to the worker processes set
+        up by the pool_workers setting. Zero workers turns this off. The
+        intensity and size of the beam they find go to the history, see
+        :meth:`.frame_result_cb`.
+        """
+        self.subs.clear_group('pool')
+        workers = self.settings_cache.get('pool_workers') or 0
+        pool = self.frame_pool
+        if pool is not None and (not workers or workers != self.pool_size):
+            pool.stop()
+            pool = None
+        if workers and pool is None:
+            pool = FramePool(self.frame_result_cb, processes=workers,
+                             slots=MAX_MIRRORS)
+            self.pool_size = workers
+        self.frame_pool = pool
+        self.close_dict['frame_pool'] = pool
+        if pool is not None:
+            for name in pool.names:
+                pool.release(name)
+            for imager in self.imagers():
+                if imager is not None:
+                    pool.feed(imager, self.subs, 'pool')
+        self.history_chart.set_series(self.history_names())
+
+    def history_names(self):
+        """
+        Names of the history series of the active procedure.
+        """
+        names = []
+        for imager in self.imagers():
+            if imager is not None:
+                names.extend(imager.name + ' ' + axis for axis in 'xy')
+                if self.frame_pool is not None:
+                    names.extend(imager.name + ' ' + stat
+                                 for stat in POOL_SERIES.values())
+        for mirror in self.mirrors():
+            if mirror is not None:
+                names.append(mirror.name + ' pitch')
+        return names
+
+    def update_history(self):
+        """
+        Record the centroids of the procedure's imagers and the pitch of its
+        mirrors to the history. Series of earlier procedures are kept.
+        """
+        self.subs.clear_group('history')
+        for imager in self.imagers():
+            if imager is not None:
+                centroid = imager.detector.stats2.centroid
+                for axis in 'xy':
+                    callback = self.history.recorder(imager.name + ' ' + axis)
+                    self.subs.subscribe(getattr(centroid, axis), callback,
+                                        'history')
+        for mirror in self.mirrors():
+            if mirror is not None:
+                callback = self.history.recorder(mirror.name + ' pitch')
+                self.subs.subscribe(mirror.pitch.user_readback, callback,
+                                    'history')
+        self.history_chart.set_series(self.history_names())
+
+    def goal_centroids(self):
+        """
+        The stats plugin centroid that each imager of the active procedure
+        aligns, with its goal converted to the unrotated coordinates of that
+        centroid.
+
+        Returns
+        -------
+        targets : list of tuple
+            (imager, centroid signal, goal), the goal is None if its field is
+            empty
+        """
+        targets = []
+        for imager, rotation, goal in zip(self.imagers(),
+                                          self._objs('rotation'),
+                                          self.goals()):
+            if imager is None:
+                continue
+            rot_info = ad_stats_x_axis_rot(imager, rotation or 0)
+            if goal is not None and rot_info['mod_x'] is not None:
+                goal = rot_info['mod_x'] - goal
+            targets.append((imager, rot_info['x_cent'], goal))
+        return targets
+
+    def predict_first_steps(self, key_set, imagers, mirrors, centroids,
+                            goals):
+        """
+        First pitch step of each mirror in a set of systems, from the current
+        centroid errors and either the procedure's response matrix or the
+        distances between the mirrors and the imagers, see
+        :func:`.predict_first_steps`. Limited by the max_first_step setting.
+
+        Parameters
+        ----------
+        key_set : list of str
+            Systems aligned together
+
+        imagers, mirrors, centroids : list
+            Imager, mirror and aligned centroid signal of each system
+
+        goals : list of float
+            Goal of each centroid, in unrotated coordinates
+
+        Returns
+        -------
+        first_steps : list of float
+        """
+        errors = []
+        for centroid, goal in zip(centroids, goals):
+            try:
+                value = centroid.get()
+            except Exception:
+                logger.debug('No centroid from %s', centroid.name,
+                             exc_info=True)
+                value = None
+            # No beam reads as zero
+            if value is None or not valid_centroids([value]):
+                errors.append(None)
+            else:
+                errors.append(value - goal)
+        distances = []
+        for imager, mirror in zip(imagers, mirrors):
+            mirror_z = self.loader.z_position(mirror.name)
+            imager_z = self.loader.z_position(imager.name)
+            if mirror_z is None or imager_z is None or imager_z <= mirror_z:
+                distances.append(None)
+            else:
+                distances.append(imager_z - mirror_z)
+        matrix = self.response_matrix()
+        if matrix is not None:
+            index = [self.active_system().index(key) for key in key_set]
+            matrix = matrix[np.ix_(index, index)]
+        pixel_sizes = [self.pixel_size(imager) for imager in imagers]
+        maximum = self.settings_cache['max_first_step']
+        steps = predict_first_steps(errors, distances, pixel_sizes,
+                                    self.settings_cache['first_step'],
+                                    matrix=matrix, maximum=maximum)
+        logger.info('First steps %s for %s', [round(step, 2)
+                                              for step in steps], key_set)
+        return steps
+
+    def pixel_size(self, imager):
+        """
+        Size of a pixel on an imager in microns. Taken from the pixel_size
+        section of the config file, then from happi, then from the
+        pixel_size setting.
+        """
+        size = self.config_cache.get('pixel_size', {}).get(imager.name)
+        if size is None:
+            size = self.loader.pixel_size(imager.name)
+        if size is None:
+            size = self.settings_cache['pixel_size']
+        return size
+
+    def feedback_targets(self, need_goals=True):
+        """
+        Everything the feedback plans need from the active procedure, after
+        checking that it can be used.
+
+        Parameters
+        ----------
+        need_goals : bool, optional
+            Whether every goal field must be filled
+
+        Returns
+        -------
+        targets : tuple or None
+            Lists of imagers, mirrors, centroid signals and goals, or None if
+            the procedure cannot be used, with the reason logged
+        """
+        if self.RE.state != 'idle':
+            logger.info('The RunEngine is busy.')
+            return None
+        if self.procedure == 'None':
+            logger.info("Please select a procedure.")
+            return None
+        targets = self.goal_centroids()
+        goals = [goal for _, _, goal in targets]
+        if need_goals and None in goals:
+            logger.info('Please fill all goal fields first.')
+            return None
+        imagers = [imager for imager, _, _ in targets]
+        mirrors = self.mirrors()
+        if None in mirrors or len(mirrors) != len(imagers):
+            logger.info('Every system needs a mirror and an imager.')
+            return None
+        return imagers, mirrors, [cent for _, cent, _ in targets], goals
+
+    def response_matrix(self):
+        """
+        The measured response matrix of the active procedure, or None if it
+        was never measured, its mirrors and imagers have changed since or it
+        fails :func:`.check_response`.
+        """
+        entry = self.config_cache.get('response_matrix',
+                                      {}).get(self.procedure)
+        if entry is None:
+            return None
+        mirrors = [getattr(obj, 'name', None) for obj in self.mirrors()]
+        imagers = [getattr(obj, 'name', None) for obj in self.imagers()]
+        if entry['mirrors'] != mirrors or entry['imagers'] != imagers:
+            logger.debug('Response matrix of %s is out of date',
+                         self.procedure)
+            return None
+        matrix = np.array(entry['matrix'])
+        try:
+            check_response(matrix)
+        except ValueError as exc:
+            logger.info('Not using the response matrix of %s: %s',
+                        self.procedure, exc)
+            return None
+        return matrix
+
+    def save_response(self, mirrors, imagers, matrix):
+        """
+        Keep the response matrix of the active procedure for this session and
+        save it to the config file, if there is one. Matrices that fail
+        :func:`.check_response` are not saved.
+        """
+        try:
+            check_response(matrix)
+        except ValueError as exc:
+            logger.error('Not saving the response matrix of %s: %s',
+                         self.procedure, exc)
+            return
+        entry = dict(mirrors=[mirror.name for mirror in mirrors],
+                     imagers=[imager.name for imager in imagers],
+                     matrix=np.asarray(matrix).tolist())
+        responses = self.config_cache.setdefault('response_matrix', {})
+        responses[self.procedure] = entry
+        if self.nominal_config is not None:
+            d = self.read_config() or {}
+            d.setdefault('response_matrix', {})[self.procedure] = entry
+            self.save_config(d)
+
+    def drift_targets(self):
+        """
+        Goal of each history series watched for drift.
+
+        Returns
+        -------
+        targets : dict
+            Goals keyed by series name, see :meth:`.history_names`
+        """
+        return dict((imager.name + ' ' + centroid.attr_name, goal)
+                    for imager, centroid, goal in self.goal_centroids()
+                    if goal is not None)
+
+    def arm_drift_monitor(self):
+        """
+        Start watching the procedure's centroids for drift from their goals,
+        if the drift_threshold setting is on.
+        """
+        threshold = self.settings_cache.get('drift_threshold')
+        if threshold is None:
+            self.drift_monitor.set_targets({})
+            return
+        self.drift_monitor.threshold = threshold
+        self.drift_monitor.hold = self.settings_cache['drift_hold']
+        targets = self.drift_targets()
+        self.drift_monitor.set_targets(targets)
+        self.drift_monitor.start()
+        logger.debug('Watching %s for drift', list(targets))
+
+    @pyqtSlot(str, float)
+    def on_drift_alert(self, name, deviation):
+        """
+        Slot for the drift monitor, run when a centroid has been away from
+        its goal for too long. Realigns if the auto_realign setting is on.
+        """
+        try:
+            logger.warning('%s has drifted %.1f pixels from its goal.',
+                           name, deviation)
+            if not self.settings_cache.get('auto_realign'):
+                return
+            if self.RE.state != 'idle':
+                logger.info('Not realigning, the RunEngine is busy.')
+                return
+            logger.info('Queueing a realignment of %s.', self.procedure)
+            QTimer.singleShot(0, self.on_start_button)
+        except:
+            logger.exception('Error on drift alert')
+
+    def start_recording(self):
+        """
+        Record the frames of the procedure's imagers, if the record_frames
+        setting is on. At most record_rate frames per second are kept of each
+        imager, every frame if it is unchecked.
+        """
+        if not self.settings_cache.get('record_frames'):
+            return
+        self.stop_recording()
+        try:
+            rate = self.settings_cache.get('record_rate')
+            self.recorder = FrameRecorder(
+                path.expanduser(self.settings_cache['record_dir']),
+                max_frames=self.settings_cache['record_max_frames'],
+                min_interval=1. / rate if rate and rate > 0 else 0.)
+            for imager in self.imagers():
+                if imager is not None:
+                    self.recorder.feed(imager, self.subs, 'recorder')
+        except:
+            logger.exception('Error starting the frame recorder')
+            self.stop_recording()
+
+    def stop_recording(self):
+        """
+        Stop recording frames and close the files.
+        """
+        self.subs.clear_group('recorder')
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            try:
+                recorder.close()
+            except:
+                logger.exception('Error closing the frame recorder')
+
+    def frame_result_cb(self, result):
+        """
+        Callback from the frame pool's reader thread with the moments of the
+        newest frame of an imager. The beam intensity and size are recorded
+        to the history, where the strip chart shows them.
+        """
+        for key, stat in POOL_SERIES.items():
+            self.history.record(result['name'] + ' ' + stat,
+                                result['timestamp'] or time.time(),
+                                result[key])
 
     def fee_att(self):
         try:
@@ -701,6 +1547,11 @@ class SkywalkerGui(Display):
         Pull settings from the settings object to the local cache.
         """
         self.settings_cache = self.settings.values
+        soft_centroid = self.settings_cache.get('soft_centroid', False)
+        self.image_group.set_soft_centroid(soft_centroid)
+        #Zero or less pauses the main image
+        image_fps = self.settings_cache.get('image_fps', 5.0)
+        self.image_group.pipeline.max_fps = image_fps
 
     def restore_settings(self):
         """
@@ -722,20 +1573,14 @@ class SkywalkerGui(Display):
 
     def install_pick_cam(self):
         """
-        For every camera that we've successfully loaded, subscribe the pick_cam
-        method if we haven't done so already.
+        Subscribe the pick_cam method to every imager in the active procedure,
+        the only ones it switches between.
         """
-        try:
-            installed = self.installed
-        except AttributeError:
-            installed = set()
-            self.installed = installed
-        for system in self.loader.cache.values():
-            imager = system['imager']
-            if imager not in installed:
-                imager.subscribe(self.pick_cam, event_type=imager.SUB_STATE,
-                                 run=False)
-                installed.add(imager)
+        for imager in self.imagers():
+            if imager is not None:
+                self.subs.subscribe(imager, self.pick_cam, 'procedure',
+                                    event_type=imager.SUB_STATE, run=False)
+        logger.debug('Live subscriptions: %s', self.subs.counts())
 
     def pick_cam(self, *args, **kwargs):
         """
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """
+    Fixed size record of timestamped values, overwriting the oldest.
+
+    Parameters
+    ----------
+    size : int, optional
+        Number of samples kept
+
+    min_interval : float, optional
+        Samples that come sooner than this many seconds after the last one
+        kept are skipped, so that the buffer covers a known stretch of time
+    """
+    def __init__(self, size=43200, min_interval=1.0):
+        self.size = size
+        self.min_interval = min_interval
+        self.times = np.zeros(size, dtype=np.float64)
+        self.values = np.zeros(size, dtype=np.float64)
+        # Number of samples ever kept, the next one goes at count % size
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, timestamp, value):
+        """
+        Add a sample. Safe to call from any thread.
+
+        Returns
+        -------
+        kept : bool
+            False if the sample came too soon after the last one
+        """
+        with self._lock:
+            if self.count:
+                last = self.times[(self.count - 1) % self.size]
+                if timestamp - last < self.min_interval:
+                    return False
+            index = self.count % self.size
+            self.times[index] = timestamp
+            self.values[index] = value
+            self.count += 1
+            return True
+
+    def data(self, since=None):
+        """
+        Copy of the samples in time order.
+
+        Parameters
+        ----------
+        since : float, optional
+            Only return samples at or after this timestamp
+
+        Returns
+        -------
+        times, values : np.ndarray
+        """
+        with self._lock:
+            if self.count <= self.size:
+                times = self.times[:self.count].copy()
+                values = self.values[:self.count].copy()
+            else:
+                start = self.count % self.size
+                times = np.roll(self.times, -start)
+                values = np.roll(self.values, -start)
+        if since is not None:
+            first = np.searchsorted(times, since)
+            times, values = times[first:], values[first:]
+        return times, values
+
+    def tail(self, start):
+        """
+        Copy of the samples kept after the first ``start``, in time order.
+
+        Used to follow a buffer incrementally: pass the ``count`` returned by
+        the last call to get only the samples added since. Samples that have
+        already been overwritten are skipped.
+
+        Parameters
+        ----------
+        start : int
+            Number of samples kept already seen
+
+        Returns
+        -------
+        times, values : np.ndarray
+
+        count : int
+            Number of samples kept so far, the ``start`` of the next call
+        """
+        with self._lock:
+            start = max(start, self.count - self.size)
+            index = np.arange(start, self.count) % self.size
+            return self.times[index], self.values[index], self.count
+
+    def stats(self, since=None):
+        """
+        Jitter and drift of the samples.
+
+        Parameters
+        ----------
+        since : float, optional
+            Only use samples at or after this timestamp
+
+        Returns
+        -------
+        stats : dict
+            ``mean``, ``jitter`` (standard deviation), ``peak_to_peak`` and
+            ``drift``, the slope of a straight line fit in units per hour.
+            Empty if there are fewer than two samples
+        """
+        times, values = self.data(since=since)
+        if len(times) < 2:
+            return dict()
+        hours = (times - times[0]) / 3600.
+        if hours[-1] > 0:
+            drift = np.polyfit(hours, values, 1)[0]
+        else:
+            drift = 0.
+        return dict(mean=values.mean(), jitter=values.std(),
+                    peak_to_peak=np.ptp(values), drift=drift)
+
+
+class History:
+    """
+    Named ring buffers, e.g. one per centroid axis and one per mirror pitch.
+
+    Parameters
+    ----------
+    size : int, optional
+        Samples kept per series
+
+    min_interval : float, optional
+        Shortest time between two samples of a series
+
+    The defaults keep twelve hours of one second samples, under half a
+    megabyte per series.
+    """
+    def __init__(self, size=43200, min_interval=1.0):
+        self.size = size
+        self.min_interval = min_interval
+        self.series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def buffer(self, name):
+        """
+        The ring buffer of a series, created if needed
+        """
+        with self._lock:
+            if name not in self.series:
+                self.series[name] = RingBuffer(size=self.size,
+                                               min_interval=self.min_interval)
+            return self.series[name]
+
+    def record(self, name, timestamp, value):
+        """
+        Add a sample to a series. None values are ignored.
+        """
+        if value is None:
+            return False
+        return self.buffer(name).append(timestamp, value)
+
+    def recorder(self, name):
+        """
+        An ophyd callback that records the value of a signal to a series.
+        """
+        def callback(*args, value=None, timestamp=None, **kwargs):
+            if timestamp is None:
+                return
+            try:
+                self.record(name, timestamp, float(value))
+            except (TypeError, ValueError):
+                pass
+        return callback
+
+    def stats(self, since=None):
+        """
+        :meth:`.RingBuffer.stats` for every series, keyed by name
+        """
+        with self._lock:
+            series = list(self.series.items())
+        return OrderedDict((name, buff.stats(since=since))
+                           for name, buff in series)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LatestFrame:
+    """
+    Single slot hand-off of camera frames between threads.
+
+    The channel access thread puts every frame it receives and the display
+    takes whatever is newest when it is ready to draw. Frames that are
+    replaced before they are taken are dropped and counted.
+    """
+    def __init__(self):
+        self._frame = None
+        self._fresh = False
+        self._lock = threading.Lock()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        """
+        Store a frame, replacing the one that is waiting if there is one.
+        """
+        with self._lock:
+            if self._fresh:
+                self.dropped += 1
+            self._frame = frame
+            self._fresh = True
+            self.received += 1
+
+    def take(self):
+        """
+        The newest frame, or None if nothing arrived since the last take.
+        """
+        with self._lock:
+            if not self._fresh:
+                return None
+            self._fresh = False
+            return self._frame
+
+    def clear(self):
+        """
+        Forget the waiting frame, e.g. when switching cameras
+        """
+        with self._lock:
+            self._frame = None
+            self._fresh = False
+
+
+def downsample(image, factor, mode='decimate'):
+    """
+    Shrink an image by an integer factor along both axes.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Two dimensional image
+
+    factor : int
+        Number of pixels along each axis combined into one
+
+    mode : {'decimate', 'bin'}, optional
+        'decimate' keeps every nth pixel and returns a view of the image.
+        'bin' averages each block of pixels, trimming the edges that do not
+        fill a whole block
+
+    Returns
+    -------
+    image : np.ndarray
+    """
+    if factor <= 1:
+        return image
+    if mode == 'decimate':
+        return image[::factor, ::factor]
+    elif mode == 'bin':
+        rows = image.shape[0] // factor
+        cols = image.shape[1] // factor
+        blocks = image[:rows * factor, :cols * factor]
+        blocks = blocks.reshape(rows, factor, cols, factor)
+        return blocks.mean(axis=(1, 3))
+    raise ValueError('Unknown downsample mode {}'.format(mode))
+
+
+class FrameGeometry:
+    """
+    Cached shape of the frames from an areadetector image plugin.
+
+    Each frame arrives as a flat array, with the width on a separate channel.
+    The shape is derived once and reused for every frame until the width or
+    the number of pixels changes, and frames are viewed in that shape without
+    copying. The view uses the column major layout expected by the image
+    widget, so the first axis has the length of the width.
+
+    Parameters
+    ----------
+    dtype : numpy.dtype, optional
+        Pixel type used to interpret raw buffers, numpy arrays keep their own
+    """
+    def __init__(self, dtype=np.uint8):
+        self.dtype = dtype
+        self.width = None
+        self.height = None
+
+    @property
+    def size(self):
+        """
+        Number of pixels in a frame, or None if the geometry is not known
+        """
+        if self.width is None:
+            return None
+        return self.width * self.height
+
+    def update(self, width, size):
+        """
+        Derive the geometry again if the width or number of pixels changed.
+
+        Parameters
+        ----------
+        width : int
+            Number of pixels in a row
+
+        size : int
+            Number of pixels in a frame
+
+        Returns
+        -------
+        changed : bool
+        """
+        width = int(width)
+        if width == self.width and size == self.size:
+            return False
+        if width <= 0 or size % width:
+            raise ValueError('{} pixels do not fit in rows of {}'
+                             ''.format(size, width))
+        self.width = width
+        self.height = size // width
+        logger.debug('Frame geometry is now %sx%s', self.width, self.height)
+        return True
+
+    def flat(self, data):
+        """
+        The frame data as a one dimensional numpy array, without copying
+        arrays or buffers.
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return np.frombuffer(data, dtype=self.dtype)
+        return np.asarray(data).ravel()
+
+    def view(self, data):
+        """
+        The frame data in the cached shape, without copying.
+
+        Parameters
+        ----------
+        data : np.ndarray or buffer
+            Flat frame with :attr:`.size` pixels
+
+        Returns
+        -------
+        image : np.ndarray
+            Array of shape (width, height)
+        """
+        return self.flat(data).reshape((self.width, self.height), order='F')
+
+
+def centroid(image, roi=None, background=None, threshold=0):
+    """
+    Intensity weighted centroid of an image.
+
+    The image is reduced to its projections on each axis before weighting, so
+    the cost is one pass over the pixels.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image of shape (width, height), as given by :meth:`.FrameGeometry.view`
+
+    roi : tuple, optional
+        Bounds (x0, x1, y0, y1) of the region to use, in pixels. The centroid
+        is still given in the coordinates of the full image
+
+    background : np.ndarray, optional
+        Image of the same shape to subtract first
+
+    threshold : float, optional
+        Pixels at or below this value after the background subtraction are
+        ignored
+
+    Returns
+    -------
+    x, y : float
+        Centroid along each axis, or None if no pixel is above the threshold
+    """
+    x0 = y0 = 0
+    if roi is not None:
+        x0, x1, y0, y1 = roi
+        image = image[x0:x1, y0:y1]
+        if background is not None:
+            background = background[x0:x1, y0:y1]
+    if background is not None:
+        image = np.subtract(image, background, dtype=np.float32)
+    data = np.where(image > threshold, image, 0)
+    x_proj = data.sum(axis=1, dtype=np.float64)
+    y_proj = data.sum(axis=0, dtype=np.float64)
+    total = x_proj.sum()
+    if total <= 0:
+        return None, None
+    x = np.dot(x_proj, np.arange(x_proj.size)) / total + x0
+    y = np.dot(y_proj, np.arange(y_proj.size)) / total + y0
+    return x, y
+
+
+class BackgroundModel:
+    """
+    Dark frame of an imager, the average of frames taken with the beam off.
+
+    Parameters
+    ----------
+    frames : int, optional
+        Number of frames to average
+    """
+    def __init__(self, frames=10):
+        self.frames = frames
+        self.count = 0
+        self.frame = None
+        self._sum = None
+
+    @property
+    def ready(self):
+        """
+        Whether a complete dark frame is available
+        """
+        return self.frame is not None
+
+    def reset(self, frames=None):
+        """
+        Forget the dark frame and start collecting a new one.
+        """
+        if frames is not None:
+            self.frames = frames
+        self.count = 0
+        self.frame = None
+        self._sum = None
+
+    def add(self, image):
+        """
+        Add a frame taken with the beam off to the average.
+
+        Returns
+        -------
+        done : bool
+            True once enough frames have been added
+        """
+        if self._sum is None or self._sum.shape != image.shape:
+            self._sum = np.zeros(image.shape, dtype=np.float64)
+            self.count = 0
+        self._sum += image
+        self.count += 1
+        if self.count >= self.frames:
+            self.frame = (self._sum / self.count).astype(np.float32)
+            self._sum = None
+            logger.debug('Dark frame complete after %s frames', self.count)
+            return True
+        return False
+
+
+def beam_present(image, background=None, threshold=20, min_pixels=5,
+                 stride=4):
+    """
+    Quick check of whether a frame shows any beam.
+
+    Only every ``stride`` pixel along each axis is looked at. The beam is
+    present if at least ``min_pixels`` of those rise more than ``threshold``
+    above the background.
+
+    Parameters
+    ----------
+    image : np.ndarray
+
+    background : np.ndarray, optional
+        Dark frame of the same shape, see :class:`.BackgroundModel`
+
+    threshold : float, optional
+
+    min_pixels : int, optional
+
+    stride : int, optional
+
+    Returns
+    -------
+    present : bool
+    """
+    sample = image[::stride, ::stride]
+    if background is not None:
+        sample = np.subtract(sample, background[::stride, ::stride],
+                             dtype=np.float32)
+    return np.count_nonzero(sample > threshold) >= min_pixels
+
+
+def moments(image, threshold=0):
+    """
+    Total intensity, centroid and width of an image.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image of shape (width, height)
+
+    threshold : float, optional
+        Pixels at or below this value are ignored
+
+    Returns
+    -------
+    moments : dict
+        ``sum``, the centroid ``x`` and ``y`` and the standard deviations
+        ``sigma_x`` and ``sigma_y``. Everything but the sum is None if no
+        pixel is above the threshold
+    """
+    data = np.where(image > threshold, image, 0)
+    x_proj = data.sum(axis=1, dtype=np.float64)
+    y_proj = data.sum(axis=0, dtype=np.float64)
+    total = x_proj.sum()
+    result = dict(sum=total, x=None, y=None, sigma_x=None, sigma_y=None)
+    if total <= 0:
+        return result
+    for axis, proj in (('x', x_proj), ('y', y_proj)):
+        pixels = np.arange(proj.size)
+        mean = np.dot(proj, pixels) / total
+        var = np.dot(proj, (pixels - mean)**2) / total
+        result[axis] = mean
+        result['sigma_' + axis] = np.sqrt(var)
+    return result
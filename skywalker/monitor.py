@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import logging
+import threading
+
+from .geometry import centroid_mask
+
+logger = logging.getLogger(__name__)
+
+
+class DriftMonitor:
+    """
+    Watch the centroids in a :class:`.History` for drift away from the goals.
+
+    A background thread looks at the mean of each series over the last
+    ``window`` seconds every ``period`` seconds. Once that mean has stayed
+    more than ``threshold`` away from its goal for ``hold`` seconds, the
+    callback is run from the monitor thread with the name of the series and
+    the deviation. It is not run again for that series until it has come back
+    within the threshold.
+
+    Readings that can not be trusted, see :func:`.centroid_mask`, are left
+    out of the mean. A window without beam has no valid readings and gives
+    no verdict, rather than looking like a drift to zero.
+
+    Parameters
+    ----------
+    history : History
+        Source of the centroids
+
+    callback : callable
+        Called as ``callback(name, deviation)``
+
+    threshold : float, optional
+        Allowed deviation, in the units of the series
+
+    hold : float, optional
+        Seconds the deviation must last before the callback runs
+
+    window : float, optional
+        Seconds of samples averaged into each deviation
+
+    period : float, optional
+        Seconds between checks
+    """
+    def __init__(self, history, callback, threshold=10., hold=60.,
+                 window=10., period=1.):
+        self.history = history
+        self.callback = callback
+        self.threshold = threshold
+        self.hold = hold
+        self.window = window
+        self.period = period
+        self.targets = {}
+        self._since = {}
+        self._alerted = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set_targets(self, targets):
+        """
+        Choose what to watch, forgetting any deviation seen so far.
+
+        Parameters
+        ----------
+        targets : dict
+            Goal of each series, in the units of the series. An empty dict
+            stops the alerts until new targets are set
+        """
+        with self._lock:
+            self.targets = dict(targets)
+            self._since.clear()
+            self._alerted.clear()
+
+    def check(self, now=None):
+        """
+        Compare every series to its goal once, running the callback for the
+        ones that drifted for long enough.
+
+        Returns
+        -------
+        deviations : dict
+            Current deviation of each series that has recent samples
+        """
+        if now is None:
+            now = time.time()
+        deviations = {}
+        alerts = []
+        with self._lock:
+            for name, goal in self.targets.items():
+                _, values = self.history.buffer(name).data(
+                    since=now - self.window)
+                values = values[centroid_mask(values)]
+                if not len(values):
+                    # No recent centroids, e.g. no beam, so no verdict
+                    self._since.pop(name, None)
+                    continue
+                deviation = values.mean() - goal
+                deviations[name] = deviation
+                if abs(deviation) <= self.threshold:
+                    self._since.pop(name, None)
+                    self._alerted.discard(name)
+                    continue
+                since = self._since.setdefault(name, now)
+                if now - since >= self.hold and name not in self._alerted:
+                    self._alerted.add(name)
+                    alerts.append((name, deviation))
+        for name, deviation in alerts:
+            try:
+                self.callback(name, deviation)
+            except Exception:
+                logger.exception('Error in drift callback for %s', name)
+        return deviations
+
+    def start(self):
+        """
+        Start the monitor thread, if it is not running already.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='DriftMonitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the monitor thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            try:
+                self.check()
+            except Exception:
+                logger.exception('Error checking for drift')
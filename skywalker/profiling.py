@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import csv
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import simplejson
+
+logger = logging.getLogger(__name__)
+
+
+class PhaseTimer:
+    """
+    Record the wall time spent in named phases of a longer process, e.g. the
+    startup sequence of the gui.
+
+    Phases may be nested, in which case the summary is indented to show which
+    phase each measurement happened inside of. A sequence of top-level phases
+    can also be timed with :meth:`.mark`, without a with block for each.
+    Phases can be recorded from several threads at once, the nesting is
+    tracked separately in each thread.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the process being timed, used in the summary header
+
+    max_phases : int, optional
+        Only keep this many of the newest phases, for timers that run for a
+        whole session
+    """
+    def __init__(self, name='startup', max_phases=None):
+        self.name = name
+        self.phases = deque(maxlen=max_phases)
+        self.active = True
+        self._mark = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _depth(self):
+        return getattr(self._local, 'depth', 0)
+
+    @_depth.setter
+    def _depth(self, depth):
+        self._local.depth = depth
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager that records the time spent inside the block.
+
+        Parameters
+        ----------
+        name : str
+            Name of the phase
+        """
+        if not self.active:
+            yield
+            return
+        depth = self._depth
+        self._depth += 1
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._depth = depth
+            if self.active:
+                with self._lock:
+                    self.phases.append((name, start, time.time() - start,
+                                        depth))
+
+    def mark(self, name):
+        """
+        End the phase started by the last mark, if there is one, and start a
+        new top-level phase.
+
+        Parameters
+        ----------
+        name : str or None
+            Name of the new phase, None only ends the last one
+        """
+        now = time.time()
+        if self._mark is not None:
+            last, start = self._mark
+            self._mark = None
+            self._depth = 0
+            if self.active:
+                with self._lock:
+                    self.phases.append((last, start, now - start, 0))
+        if name is not None and self.active:
+            self._mark = (name, now)
+            self._depth = 1
+
+    def stop(self):
+        """
+        Stop recording phases, keeping everything recorded so far. Ends the
+        phase started by the last mark.
+        """
+        self.mark(None)
+        self.active = False
+
+    @property
+    def total(self):
+        """
+        Sum of the durations of all the top-level phases
+        """
+        with self._lock:
+            return sum(phase[2] for phase in self.phases if phase[3] == 0)
+
+    def durations(self):
+        """
+        Durations of every recorded phase, keyed by name. Repeated phases are
+        summed together.
+
+        Returns
+        -------
+        durations : dict
+        """
+        durations = {}
+        with self._lock:
+            phases = list(self.phases)
+        for name, _, dur, _ in phases:
+            durations[name] = durations.get(name, 0) + dur
+        return durations
+
+    def summary(self):
+        """
+        Text table of every recorded phase, in the order they started.
+
+        Returns
+        -------
+        summary : str
+        """
+        lines = ['{} timing ({:.3f}s total):'.format(self.name, self.total)]
+        with self._lock:
+            ordered = sorted(self.phases, key=lambda p: (p[1], p[3]))
+        for name, _, dur, depth in ordered:
+            lines.append('{}{:<40} {:8.3f}s'.format('  ' * (depth + 1),
+                                                    name, dur))
+        return '\n'.join(lines)
+
+    def log_summary(self, level=logging.INFO):
+        """
+        Put the summary table into the log.
+
+        Parameters
+        ----------
+        level : int, optional
+            Logging level to use
+        """
+        logger.log(level, self.summary())
+
+
+class ConnectionMetrics:
+    """
+    In-memory table of how long each stage of loading a device took.
+
+    Every device gets a row for each of the stages of :meth:`.load_device`,
+    ``find`` for the happi lookup, ``construct`` for the instantiation of the
+    ``pcdsdevices`` object and ``connect`` for the wait on the signals, as well
+    as a row for every signal that was waited on. Signals that never connected
+    have a time of ``None``. Loading a device again replaces its old rows.
+    Devices may be loaded from several threads at once.
+    """
+    fields = ['device', 'stage', 'signal', 'pvname', 'seconds']
+
+    def __init__(self):
+        self._stages = OrderedDict()
+        self._signals = OrderedDict()
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def stage(self, device, stage):
+        """
+        Context manager that records the time spent on a stage of loading a
+        device.
+
+        Parameters
+        ----------
+        device : str
+            Name of the device
+
+        stage : str
+            Name of the stage, e.g. 'find', 'construct' or 'connect'
+        """
+        if stage == 'find':
+            self.clear(device)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_stage(device, stage, time.time() - start)
+
+    def record_stage(self, device, stage, seconds):
+        """
+        Record the time spent on a stage of loading a device.
+
+        Parameters
+        ----------
+        device : str
+            Name of the device
+
+        stage : str
+            Name of the stage
+
+        seconds : float
+            Time spent on the stage
+        """
+        with self._lock:
+            stages = self._stages.setdefault(device, OrderedDict())
+            stages[stage] = seconds
+
+    def record_signals(self, device, signals):
+        """
+        Record the connection times of a device's signals.
+
+        Parameters
+        ----------
+        device : str
+            Name of the device
+
+        signals : list
+            List of (attribute, pvname, seconds) tuples. Seconds is None for
+            signals that did not connect.
+        """
+        with self._lock:
+            self._signals[device] = list(signals)
+
+    def clear(self, device=None):
+        """
+        Drop the rows for one device, or for every device if none is given.
+        """
+        with self._lock:
+            if device is None:
+                self._stages.clear()
+                self._signals.clear()
+            else:
+                self._stages.pop(device, None)
+                self._signals.pop(device, None)
+
+    @property
+    def table(self):
+        """
+        Every row of the table as a list of dicts with keys from ``fields``
+        """
+        rows = []
+        with self._lock:
+            for device, stages in self._stages.items():
+                for stage, seconds in stages.items():
+                    rows.append(dict(device=device, stage=stage, signal=None,
+                                     pvname=None, seconds=seconds))
+                for attr, pvname, seconds in self._signals.get(device, []):
+                    rows.append(dict(device=device, stage='signal',
+                                     signal=attr, pvname=pvname,
+                                     seconds=seconds))
+        return rows
+
+    def device_time(self, device):
+        """
+        Total time spent loading a device
+        """
+        with self._lock:
+            return sum(self._stages.get(device, {}).values())
+
+    def slowest_devices(self, n=10):
+        """
+        Devices that took the longest to load.
+
+        Returns
+        -------
+        devices : list
+            List of (device, seconds) tuples, slowest first
+        """
+        with self._lock:
+            totals = [(dev, self.device_time(dev)) for dev in self._stages]
+        return sorted(totals, key=lambda x: x[1], reverse=True)[:n]
+
+    def slowest_signals(self, n=10):
+        """
+        Signals that took the longest to connect. Signals that never connected
+        are listed first.
+
+        Returns
+        -------
+        signals : list
+            List of (device, attribute, pvname, seconds) tuples, slowest first
+        """
+        with self._lock:
+            signals = [(dev, attr, pvname, seconds)
+                       for dev, sigs in self._signals.items()
+                       for attr, pvname, seconds in sigs]
+
+        def key(sig):
+            if sig[3] is None:
+                return float('inf')
+            return sig[3]
+        return sorted(signals, key=key, reverse=True)[:n]
+
+    def report(self, n=5):
+        """
+        Text summary of the slowest devices and pvs.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of devices and pvs to include
+
+        Returns
+        -------
+        report : str
+        """
+        lines = ['Slowest devices:']
+        for device, seconds in self.slowest_devices(n):
+            lines.append('  {:<40} {:8.3f}s'.format(device, seconds))
+        lines.append('Slowest pvs:')
+        for device, attr, pvname, seconds in self.slowest_signals(n):
+            if seconds is None:
+                txt = 'not connected'
+            else:
+                txt = '{:.3f}s'.format(seconds)
+            lines.append('  {:<40} {} ({}.{})'.format(str(pvname), txt,
+                                                      device, attr))
+        return '\n'.join(lines)
+
+    def log_report(self, n=5, level=logging.INFO):
+        """
+        Put the report of the slowest devices and pvs into the log.
+        """
+        logger.log(level, self.report(n=n))
+
+    def dump(self, filename):
+        """
+        Write the table to disk. The format is chosen by the file extension,
+        CSV for ``.csv`` and JSON for anything else.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the file to write
+        """
+        rows = self.table
+        if filename.endswith('.csv'):
+            with open(filename, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=self.fields)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(filename, 'w') as f:
+                simplejson.dump(rows, f, indent=4)
+        logger.info('Wrote connection metrics to %s', filename)
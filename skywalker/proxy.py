@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from functools import partial
+
+import pcdsdevices
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceProxy:
+    """
+    Stand-in for a device that has not been loaded yet.
+
+    The proxy is built straight from a happi container and carries the
+    information needed to place the device on the lightpath, i.e. ``name``,
+    ``z``, ``beamline`` and ``prefix``. The first time the state of the device
+    is requested, the real ``pcdsdevices`` object is loaded in the background
+    by the :class:`.ConfigReader`. Until then the device is neither inserted
+    nor removed, and subscriptions are held until they can be handed to the
+    real device.
+
+    Parameters
+    ----------
+    container : happi.Device
+        Happi information for the device
+
+    loader : ConfigReader
+        Used to load the real device
+
+    executor : concurrent.futures.Executor
+        Runs the device loads in the background
+    """
+    def __init__(self, container, loader, executor):
+        self.container = container
+        self.name = container.name
+        self.z = container.z
+        self.beamline = container.beamline
+        self.prefix = container.prefix
+        self._loader = loader
+        self._executor = executor
+        self._device = None
+        self._future = None
+        self._subs = []
+        self._lock = threading.RLock()
+        # Class level information is available without loading the device
+        self._device_cls = getattr(pcdsdevices,
+                                   container.extraneous.get('device_class',
+                                                            ''),
+                                   None)
+
+    @property
+    def device(self):
+        """
+        The real device, or None if it has not loaded yet
+        """
+        return self._device
+
+    @property
+    def SUB_STATE(self):
+        return getattr(self._device_cls, 'SUB_STATE', None)
+
+    @property
+    def inserted(self):
+        return self._state('inserted')
+
+    @property
+    def removed(self):
+        return self._state('removed')
+
+    def _state(self, attr):
+        device = self._device
+        if device is None:
+            self.materialize()
+            return False
+        return getattr(device, attr)
+
+    def materialize(self):
+        """
+        Start loading the real device in the background, if we have not
+        already.
+        """
+        with self._lock:
+            if self._future is None:
+                logger.debug('Loading %s in the background', self.name)
+                self._future = self._executor.submit(self._load)
+
+    def _load(self):
+        device = self._loader.load_device(self.name)
+        if device is None:
+            # Hand the device to the loader's retries
+            self._loader.retry.schedule(('device', self.name),
+                                        partial(self._loader.load_device,
+                                                self.name),
+                                        callback=self._loaded)
+        else:
+            self._loaded(self.name, device)
+
+    def _loaded(self, key, device):
+        with self._lock:
+            self._device = device
+            subs = self._subs
+            self._subs = []
+        for callback, event_type in subs:
+            device.subscribe(callback, event_type=event_type, run=True)
+
+    def subscribe(self, callback, event_type=None, run=True):
+        """
+        Subscribe to the real device, waiting for it to load if needed. The
+        callback is always run once the device loads.
+        """
+        with self._lock:
+            device = self._device
+            if device is None:
+                self._subs.append((callback, event_type))
+        if device is None:
+            self.materialize()
+        else:
+            device.subscribe(callback, event_type=event_type, run=run)
+
+    def clear_sub(self, callback, event_type=None):
+        with self._lock:
+            device = self._device
+            self._subs = [(cb, evt) for (cb, evt) in self._subs
+                          if cb != callback]
+        if device is not None:
+            device.clear_sub(callback, event_type=event_type)
+
+    def __getattr__(self, attr):
+        # Only called for attributes the proxy does not have itself
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        device = self._device
+        if device is None:
+            self.materialize()
+            raise AttributeError('{} has not loaded {} yet'
+                                 ''.format(self.name, attr))
+        return getattr(device, attr)
+
+    def __repr__(self):
+        return '{}({!r}, loaded={})'.format(type(self).__name__, self.name,
+                                            self._device is not None)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+import queue
+import logging
+import threading
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .image import FrameGeometry
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRecorder:
+    """
+    Record the frames of imagers to disk in the background.
+
+    Each imager gets a preallocated, memory mapped ``.npy`` file of frames
+    next to a ``_times.npy`` index of frame timestamps. Frames are views of
+    shape (width, height), see :class:`.FrameGeometry`. Slots that were never
+    written have a timestamp of NaN. Use :func:`.load_recording` to read a
+    recording back.
+
+    Cameras usually run much faster than an alignment needs to be reviewed,
+    so frames of an imager that come sooner than ``min_interval`` after the
+    last one kept are skipped before they are copied anywhere. Frames are then
+    handed to a writer thread through a bounded queue. If the writer falls
+    behind, new frames are dropped rather than held in memory or blocking the
+    caller. Once the file of an imager is full, its later frames are dropped
+    too. A warning is logged the first time either happens.
+
+    Parameters
+    ----------
+    directory : str
+        Where to put the files, created if needed
+
+    max_frames : int, optional
+        Number of frames preallocated per imager
+
+    queue_size : int, optional
+        Most frames waiting on the writer
+
+    min_interval : float, optional
+        Seconds between the frames kept of each imager. Zero keeps them all
+    """
+    def __init__(self, directory, max_frames=1000, queue_size=32,
+                 min_interval=0.):
+        self.directory = directory
+        self.max_frames = max_frames
+        self.min_interval = min_interval
+        self.prefix = time.strftime('%Y%m%d-%H%M%S')
+        self.files = {}
+        self.dropped = 0
+        self.skipped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._widths = {}
+        self._last = {}
+        self._open = {}
+        self._warned = set()
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write,
+                                        name='FrameRecorder', daemon=True)
+        self._writer.start()
+
+    def submit(self, name, frame, width, timestamp=None):
+        """
+        Queue a flat frame to be written. Safe to call from any thread.
+
+        Returns
+        -------
+        queued : bool
+            False if the frame was skipped or dropped
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        last = self._last.get(name)
+        if last is not None and timestamp - last < self.min_interval:
+            self.skipped += 1
+            return False
+        try:
+            self._queue.put_nowait((name, frame, width, timestamp))
+        except queue.Full:
+            self._drop(name, 'the writer fell behind')
+            return False
+        self._last[name] = timestamp
+        return True
+
+    def feed(self, imager, registry, group):
+        """
+        Record every frame from the image plugin of an imager.
+
+        Parameters
+        ----------
+        imager : pcdsdevices.PIM
+
+        registry : SubscriptionRegistry
+            Where to keep the subscriptions to the image plugin
+
+        group : str
+            Registry group for the subscriptions, clear it to stop recording
+        """
+        name = imager.name
+        image2 = imager.detector.image2
+
+        def width_cb(*args, value=None, **kwargs):
+            self._widths[name] = value
+
+        def frame_cb(*args, value=None, timestamp=None, **kwargs):
+            width = self._widths.get(name)
+            if value is not None and width:
+                self.submit(name, value, width, timestamp=timestamp)
+
+        registry.subscribe(image2.width, width_cb, group)
+        registry.subscribe(image2.array_data, frame_cb, group)
+
+    def close(self):
+        """
+        Write every queued frame, then flush and close the files
+        """
+        self._queue.put(None)
+        self._writer.join()
+        for name, (frames, times, count) in self._open.items():
+            frames.flush()
+            times.flush()
+            logger.info('Recorded %s frames from %s to %s', count, name,
+                        self.files[name])
+        self._open.clear()
+        if self.dropped:
+            logger.warning('Dropped %s frames while recording', self.dropped)
+
+    def _drop(self, name, reason):
+        self.dropped += 1
+        if name not in self._warned:
+            self._warned.add(name)
+            logger.warning('Dropping frames from %s, %s', name, reason)
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write_frame(*item)
+            except Exception:
+                logger.exception('Error recording frame from %s', item[0])
+
+    def _write_frame(self, name, frame, width, timestamp):
+        geometry = FrameGeometry()
+        frame = geometry.flat(frame)
+        geometry.update(width, frame.size)
+        if name not in self._open:
+            self._open[name] = self._create(name, geometry, frame.dtype)
+        frames, times, count = self._open[name]
+        if count >= len(frames):
+            self._drop(name, 'its {} frames are recorded'.format(count))
+            return
+        if frames.shape[1:] != (geometry.width, geometry.height):
+            self._drop(name, 'the image size changed')
+            return
+        frames[count] = geometry.view(frame)
+        times[count] = timestamp
+        self._open[name] = (frames, times, count + 1)
+
+    def _create(self, name, geometry, dtype):
+        base = os.path.join(self.directory,
+                            '{}_{}'.format(self.prefix,
+                                           name.replace(' ', '_')))
+        filename = base + '.npy'
+        frames = open_memmap(filename, mode='w+', dtype=dtype,
+                             shape=(self.max_frames, geometry.width,
+                                    geometry.height))
+        times = open_memmap(base + '_times.npy', mode='w+',
+                            dtype=np.float64, shape=(self.max_frames,))
+        times[:] = np.nan
+        self.files[name] = filename
+        logger.debug('Recording %s to %s', name, filename)
+        return frames, times, 0
+
+
+def load_recording(filename):
+    """
+    Load a recording made by :class:`.FrameRecorder`.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the frames file
+
+    Returns
+    -------
+    times : np.ndarray
+        Timestamp of each recorded frame
+
+    frames : np.ndarray
+        Memory mapped frames, of shape (n, width, height)
+    """
+    frames = np.load(filename, mmap_mode='r')
+    times = np.load(filename[:-len('.npy')] + '_times.npy')
+    count = np.count_nonzero(~np.isnan(times))
+    return times[:count], frames[:count]
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RetryScheduler:
+    """
+    Keep retrying failed operations in a background thread.
+
+    Each operation is identified by a key and retried with an exponential
+    backoff until it succeeds or is cancelled. An attempt is a failure if it
+    raises an exception or returns None. On success, the callback is run in
+    the scheduler's thread as ``callback(key, result)``.
+
+    Parameters
+    ----------
+    delay : float, optional
+        Time to wait before the first retry
+
+    factor : float, optional
+        Multiplier applied to the delay after each failure
+
+    max_delay : float, optional
+        Longest time to wait between two attempts
+
+    max_attempts : int, optional
+        Give up after this many failed attempts. By default, we never give up.
+    """
+    def __init__(self, delay=1.0, factor=2.0, max_delay=60.0,
+                 max_attempts=None):
+        self.delay = delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self._jobs = {}
+        self._queue = []
+        self._count = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, key, func, callback=None):
+        """
+        Start retrying an operation. If the key is already being retried, the
+        existing job is left alone.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifier for the operation
+
+        func : callable
+            Operation to retry, called with no arguments
+
+        callback : callable, optional
+            Called with the key and the result once func succeeds
+        """
+        with self._cond:
+            if key in self._jobs or self._stopped:
+                return
+            logger.debug('Scheduling retries for %s', key)
+            self._jobs[key] = dict(func=func, callback=callback, attempts=0,
+                                   delay=self.delay)
+            self._push(key, self.delay)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='RetryScheduler',
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, key):
+        """
+        Stop retrying an operation
+        """
+        with self._cond:
+            self._jobs.pop(key, None)
+
+    def stop(self):
+        """
+        Stop retrying everything and end the background thread
+        """
+        with self._cond:
+            self._stopped = True
+            self._jobs.clear()
+            self._cond.notify()
+
+    @property
+    def pending(self):
+        """
+        Keys of the operations that are still being retried
+        """
+        with self._cond:
+            return list(self._jobs)
+
+    def __contains__(self, key):
+        with self._cond:
+            return key in self._jobs
+
+    def _push(self, key, delay):
+        # The counter breaks ties so keys never need to be compared
+        self._count += 1
+        heapq.heappush(self._queue, (time.time() + delay, self._count, key))
+
+    def _next(self):
+        """
+        Block until a job is due, returning its key, or None if stopped.
+        """
+        with self._cond:
+            while not self._stopped:
+                # Drop entries for cancelled jobs
+                while self._queue and self._queue[0][2] not in self._jobs:
+                    heapq.heappop(self._queue)
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                due = self._queue[0][0] - time.time()
+                if due > 0:
+                    self._cond.wait(timeout=due)
+                    continue
+                return heapq.heappop(self._queue)[2]
+            return None
+
+    def _run(self):
+        while True:
+            key = self._next()
+            if key is None:
+                return
+            with self._cond:
+                job = self._jobs.get(key)
+            if job is None:
+                continue
+            try:
+                result = job['func']()
+            except Exception:
+                logger.debug('Retry of %s raised', key, exc_info=True)
+                result = None
+            with self._cond:
+                if self._jobs.get(key) is not job:
+                    # Cancelled or rescheduled while we were working
+                    continue
+                if result is None:
+                    job['attempts'] += 1
+                    if (self.max_attempts is not None
+                            and job['attempts'] >= self.max_attempts):
+                        logger.warning('Giving up on %s after %s attempts',
+                                       key, job['attempts'])
+                        del self._jobs[key]
+                        continue
+                    job['delay'] = min(job['delay'] * self.factor,
+                                       self.max_delay)
+                    logger.debug('Retry of %s failed, next try in %.1fs',
+                                 key, job['delay'])
+                    self._push(key, job['delay'])
+                    continue
+                del self._jobs[key]
+            logger.info('Retry of %s succeeded', key)
+            if job['callback'] is not None:
+                try:
+                    job['callback'](key, result)
+                except Exception:
+                    logger.exception('Error in retry callback for %s', key)
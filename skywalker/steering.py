@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+
+import numpy as np
+from bluesky import plan_stubs as bps
+from bluesky.preprocessors import run_decorator, stage_decorator
+
+from .geometry import solve_corrections, valid_centroids
+
+logger = logging.getLogger(__name__)
+
+
+def steering_step(errors, responses, gain=0.5, deadband=2.0, max_step=1.0):
+    """
+    Pitch corrections that move each centroid part of the way to its goal.
+
+    Parameters
+    ----------
+    errors : list of float
+        Centroid minus goal on each imager, in pixels
+
+    responses : list of float or np.ndarray
+        Centroid motion per unit of pitch of the mirror paired with each
+        imager, in pixels. The sign matters. A full response matrix from
+        :func:`.measure_response` also accounts for every mirror moving every
+        centroid, see :func:`.solve_corrections`
+
+    gain : float, optional
+        Fraction of each error corrected in one step
+
+    deadband : float, optional
+        Errors this small, in pixels, are left alone
+
+    max_step : float, optional
+        Largest correction applied in one step, in pitch units
+
+    Returns
+    -------
+    steps : np.ndarray
+        Change of pitch for each mirror
+    """
+    errors = np.asarray(errors, dtype=float)
+    errors = np.where(np.abs(errors) <= deadband, 0, errors)
+    responses = np.asarray(responses, dtype=float)
+    if responses.ndim == 2:
+        steps = gain * solve_corrections(responses, errors)
+    else:
+        steps = -gain * errors / responses
+    return np.clip(steps, -max_step, max_step)
+
+
+def check_response(matrix, max_condition=100., min_response=1.0):
+    """
+    Raise if a response matrix is unsafe to correct with.
+
+    A mirror whose column is close to zero barely moves any centroid, e.g.
+    because the beam was off an imager while it was measured, so solving for
+    it asks for huge moves. An ill-conditioned matrix does the same for some
+    combinations of the mirrors.
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        Response matrix of shape (imagers, mirrors)
+
+    max_condition : float, optional
+        Largest condition number allowed
+
+    min_response : float, optional
+        Smallest centroid motion per unit of pitch allowed for each mirror
+
+    Raises
+    ------
+    ValueError
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    if matrix.ndim != 2 or not matrix.size:
+        raise ValueError('Response matrix has shape {}'.format(matrix.shape))
+    if not np.all(np.isfinite(matrix)):
+        raise ValueError('Response matrix is not finite')
+    columns = np.linalg.norm(matrix, axis=0)
+    weak = np.flatnonzero(columns < min_response)
+    if len(weak):
+        raise ValueError('Mirrors {} barely move the centroids, responses {}'
+                         ''.format(weak.tolist(), columns.tolist()))
+    condition = np.linalg.cond(matrix)
+    if condition > max_condition:
+        raise ValueError('Response matrix is ill-conditioned, condition '
+                         'number {:.3g}'.format(condition))
+
+
+def read_samples(signals, averages=10, delay=0.1):
+    """
+    Plan that reads signals several times, returning every reading.
+
+    Each read is saved as an event. ``delay`` should be long enough for a
+    new frame to arrive between reads.
+
+    Returns
+    -------
+    values : np.ndarray
+        Readings of shape (averages, signals)
+    """
+    values = np.zeros((averages, len(signals)))
+    for i in range(averages):
+        yield from bps.create()
+        for j, sig in enumerate(signals):
+            reading = yield from bps.read(sig)
+            values[i, j] = reading[sig.name]['value']
+        yield from bps.save()
+        if i < averages - 1:
+            yield from bps.sleep(delay)
+    return values
+
+
+def read_average(signals, averages=10, delay=0.1):
+    """
+    Plan that reads signals several times, returning the mean of each. See
+    :func:`.read_samples`.
+    """
+    values = yield from read_samples(signals, averages=averages, delay=delay)
+    return values.mean(axis=0)
+
+
+def measure_response(imagers, mirrors, centroids, output, step=1.0,
+                     averages=10, delay=0.1, md=None):
+    """
+    Measure how each mirror's pitch moves each centroid.
+
+    Every mirror in turn is moved ``step`` above and below its starting
+    pitch, the centroids are averaged at both ends and the mirror is put
+    back. The slope between the two ends is its column of the matrix. The
+    measurement stops if a centroid is invalid at either end, see
+    :func:`.valid_centroids`, and the matrix is only kept if it passes
+    :func:`.check_response`.
+
+    Parameters
+    ----------
+    imagers : list
+        Imagers to stage for the run
+
+    mirrors : list
+        Mirrors to move, with ``set`` and ``position``
+
+    centroids : list of ophyd.Signal
+        Centroids that make the rows of the matrix
+
+    output : dict
+        The matrix is stored here under ``'matrix'``, since RunEngine calls
+        do not return what the plan returns
+
+    step : float, optional
+        Pitch change on each side of the start, small enough to keep the
+        beam on every imager
+
+    averages : int, optional
+        Reads averaged at each point
+
+    delay : float, optional
+        Seconds between reads
+
+    md : dict, optional
+        Extra metadata for the run
+
+    Returns
+    -------
+    matrix : np.ndarray or None
+        None if the measurement was rejected
+    """
+    _md = dict(plan_name='measure_response', step=step, averages=averages,
+               mirrors=[mirror.name for mirror in mirrors])
+    _md.update(md or {})
+
+    @stage_decorator(list(imagers))
+    @run_decorator(md=_md)
+    def inner():
+        matrix = np.zeros((len(centroids), len(mirrors)))
+        for j, mirror in enumerate(mirrors):
+            start = mirror.position
+            try:
+                ends = []
+                for offset in (step, -step):
+                    yield from bps.abs_set(mirror, start + offset, wait=True)
+                    values = yield from read_samples(centroids,
+                                                     averages=averages,
+                                                     delay=delay)
+                    if not valid_centroids(values):
+                        logger.error('Lost the beam with %s at %s, the '
+                                     'response was not measured',
+                                     mirror.name, start + offset)
+                        return None
+                    ends.append(values.mean(axis=0))
+            finally:
+                yield from bps.abs_set(mirror, start, wait=True)
+            matrix[:, j] = (ends[0] - ends[1]) / (2 * step)
+            logger.debug('Response to %s: %s', mirror.name, matrix[:, j])
+        try:
+            check_response(matrix)
+        except ValueError as exc:
+            logger.error('Rejected response matrix %s: %s', matrix.tolist(),
+                         exc)
+            return None
+        output['matrix'] = matrix
+        return matrix
+    return (yield from inner())
+
+
+def correct(imagers, mirrors, centroids, goals, matrix, tolerance=5.0,
+            max_moves=3, max_correction=5.0, averages=10, delay=0.1,
+            md=None):
+    """
+    Align every mirror at once from a measured response matrix.
+
+    The centroids are averaged and all of the mirrors are moved together by
+    :func:`.solve_corrections`, repeating until every centroid is within
+    ``tolerance`` of its goal or ``max_moves`` moves were made. Each move of
+    a mirror is clipped to ``max_correction``, and nothing is moved while a
+    centroid is invalid, see :func:`.valid_centroids`.
+
+    Parameters
+    ----------
+    imagers, mirrors, centroids : list
+        See :func:`.measure_response`
+
+    goals : list of float
+        Goal of each centroid
+
+    matrix : np.ndarray
+        Response matrix from :func:`.measure_response`
+
+    tolerance : float, optional
+        Allowed error of each centroid, in pixels
+
+    max_moves : int, optional
+
+    max_correction : float, optional
+        Largest pitch change of a mirror in one move
+
+    averages, delay : optional
+        See :func:`.read_samples`
+
+    md : dict, optional
+        Extra metadata for the run
+    """
+    check_response(matrix)
+    _md = dict(plan_name='correct', goals=list(goals),
+               matrix=np.asarray(matrix).tolist(), tolerance=tolerance,
+               max_correction=max_correction)
+    _md.update(md or {})
+
+    @stage_decorator(list(imagers))
+    @run_decorator(md=_md)
+    def inner():
+        for move in range(max_moves + 1):
+            yield from bps.checkpoint()
+            values = yield from read_samples(centroids, averages=averages,
+                                             delay=delay)
+            if not valid_centroids(values):
+                logger.error('Not correcting without beam on every imager')
+                return False
+            errors = values.mean(axis=0) - np.asarray(goals)
+            if np.all(np.abs(errors) <= tolerance):
+                logger.info('Aligned after %s moves, errors %s', move,
+                            errors)
+                return True
+            if move == max_moves:
+                break
+            steps = np.clip(solve_corrections(matrix, errors),
+                            -max_correction, max_correction)
+            for mirror, step in zip(mirrors, steps):
+                logger.debug('Correcting %s by %s', mirror.name, step)
+                yield from bps.abs_set(mirror, mirror.position + step,
+                                       group='correct')
+            yield from bps.wait('correct')
+        logger.info('Not aligned after %s moves, errors %s', max_moves,
+                    errors)
+        return False
+    return (yield from inner())
+
+
+def steer(imagers, mirrors, centroids, goals, responses, gain=0.5,
+          deadband=2.0, max_step=1.0, max_excursion=10.0, period=1.0,
+          averages=5, delay=0.1, cycles=None, md=None):
+    """
+    Hold the beam at its goals with small pitch corrections at a fixed rate.
+
+    Each cycle the centroids are averaged, each mirror is moved by
+    :func:`.steering_step` and the plan sleeps for ``period`` seconds. Each
+    cycle starts with a checkpoint, so the suspenders installed on the
+    RunEngine pause the loop and it resumes where it was. Cycles with an
+    invalid centroid, see :func:`.valid_centroids`, do not move anything.
+    The plan ends once a mirror would leave ``max_excursion`` of the pitch
+    it started at, or after ``cycles`` cycles. Otherwise it runs until the
+    RunEngine is stopped.
+
+    The responses must be measured, see :func:`.measure_response`, since
+    a response of the wrong sign turns the loop into positive feedback.
+
+    Parameters
+    ----------
+    imagers : list
+        Imagers, one per mirror, staged for the whole run
+
+    mirrors : list
+        Mirrors to steer, moved with ``set``
+
+    centroids : list of ophyd.Signal
+        Centroid on each imager along the axis its mirror moves the beam
+
+    goals : list of float
+        Goal of each centroid, in the same coordinates
+
+    responses : list of float or np.ndarray
+        Measured responses, see :func:`.steering_step`
+
+    gain, deadband, max_step : float, optional
+        See :func:`.steering_step`. The rate limit is ``max_step`` per cycle
+
+    max_excursion : float, optional
+        Furthest any mirror may be steered from its starting pitch
+
+    period : float, optional
+        Seconds to wait after each correction
+
+    averages, delay : optional
+        See :func:`.read_samples`
+
+    cycles : int, optional
+        Number of cycles before the plan ends on its own
+
+    md : dict, optional
+        Extra metadata for the run
+
+    Returns
+    -------
+    held : bool
+        False if the plan ended because a mirror reached ``max_excursion``
+    """
+    if responses is None:
+        raise ValueError('Steering needs a measured response')
+    responses = np.asarray(responses, dtype=float)
+    if responses.ndim == 1 and not np.all(responses):
+        raise ValueError('Every mirror needs a non-zero response')
+    _md = dict(plan_name='steer', gain=gain, deadband=deadband,
+               max_step=max_step, max_excursion=max_excursion,
+               period=period, averages=averages, goals=list(goals),
+               responses=responses.tolist())
+    _md.update(md or {})
+
+    @stage_decorator(list(imagers))
+    @run_decorator(md=_md)
+    def inner():
+        starts = [mirror.position for mirror in mirrors]
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            cycle += 1
+            yield from bps.checkpoint()
+            values = yield from read_samples(centroids, averages=averages,
+                                             delay=delay)
+            # The centroids fill the primary stream, record the pitches
+            # next to them in their own
+            yield from bps.create(name='mirrors')
+            for mirror in mirrors:
+                yield from bps.read(mirror)
+            yield from bps.save()
+            if not valid_centroids(values):
+                logger.info('Not steering without beam on every imager')
+                yield from bps.sleep(period)
+                continue
+            errors = values.mean(axis=0) - np.asarray(goals)
+            steps = steering_step(errors, responses, gain=gain,
+                                  deadband=deadband, max_step=max_step)
+            targets = [mirror.position + step
+                       for mirror, step in zip(mirrors, steps)]
+            for mirror, start, target in zip(mirrors, starts, targets):
+                if abs(target - start) > max_excursion:
+                    logger.warning('Stopped steering, %s would move %.3g '
+                                   'from its start of %.3g', mirror.name,
+                                   target - start, start)
+                    return False
+            for mirror, step, target in zip(mirrors, steps, targets):
+                if step:
+                    logger.debug('Steering %s by %s', mirror.name, step)
+                    yield from bps.abs_set(mirror, target, group='steer')
+            yield from bps.wait('steer')
+            yield from bps.sleep(period)
+        return True
+    return (yield from inner())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import logging
+
+import numpy as np
+import pyqtgraph as pg
+from pydm.PyQt.QtCore import QTimer, pyqtSlot
+from pydm.PyQt.QtGui import QWidget, QVBoxLayout
+
+logger = logging.getLogger(__name__)
+
+
+class StripChart(QWidget):
+    """
+    Scrolling plots of the series in a :class:`.History`, one row each.
+
+    One shared timer redraws the chart at ``fps``, and only the curves whose
+    buffers got new samples since the last draw are touched. Each curve keeps
+    the samples it shows, adds only the new ones from its buffer and drops
+    those older than ``span``, so a draw never copies the whole history. Long
+    series are decimated by pyqtgraph to what fits on screen.
+
+    Parameters
+    ----------
+    history : History
+
+    span : float, optional
+        Seconds of history shown
+
+    fps : float, optional
+        Redraw rate of the whole chart
+    """
+    def __init__(self, history, span=600, fps=1, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('History')
+        self.history = history
+        self.span = span
+        self.curves = {}
+        self._counts = {}
+        self._data = {}
+        self.layout_widget = pg.GraphicsLayoutWidget()
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.layout_widget)
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(1000 / fps))
+        self.timer.timeout.connect(self.draw)
+
+    def set_series(self, names):
+        """
+        Plot a new set of series, dropping the old plots.
+
+        Parameters
+        ----------
+        names : list of str
+            Series of the history to show
+        """
+        self.layout_widget.clear()
+        self.curves = {}
+        self._counts = {}
+        self._data = {}
+        first = None
+        for row, name in enumerate(names):
+            plot = self.layout_widget.addPlot(row=row, col=0, title=name)
+            plot.setDownsampling(auto=True, mode='peak')
+            plot.setClipToView(True)
+            plot.setLabel('bottom', 'seconds ago')
+            if first is None:
+                first = plot
+            else:
+                plot.setXLink(first)
+            self.curves[name] = plot.plot()
+        if self.isVisible():
+            self.draw()
+
+    def showEvent(self, event):
+        self._counts = {}
+        self._data = {}
+        self.draw()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    @pyqtSlot()
+    def draw(self):
+        """
+        Redraw every curve that has new samples.
+        """
+        now = time.time()
+        for name, curve in self.curves.items():
+            try:
+                buff = self.history.buffer(name)
+                if buff.count == self._counts.get(name):
+                    continue
+                start = self._counts.get(name, 0)
+                new_times, new_values, count = buff.tail(start)
+                self._counts[name] = count
+                times, values = self._data.get(name, (new_times[:0],
+                                                      new_values[:0]))
+                times = np.concatenate((times, new_times))
+                values = np.concatenate((values, new_values))
+                # Drop what scrolled out of view
+                first = np.searchsorted(times, now - self.span)
+                times, values = times[first:], values[first:]
+                self._data[name] = (times, values)
+                curve.setData(times - now, values)
+            except Exception:
+                logger.exception('Error drawing history of %s', name)
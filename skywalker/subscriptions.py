@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionRegistry:
+    """
+    Keep track of every ophyd subscription made by the gui.
+
+    Subscriptions are filed under a group that names the context they belong
+    to, e.g. the imager on screen or the active procedure, so that all of the
+    callbacks for a context can be removed at once when it changes. Making the
+    same subscription twice in a group does nothing.
+    """
+    def __init__(self):
+        self._groups = OrderedDict()
+        self._lock = threading.RLock()
+
+    def subscribe(self, obj, callback, group, event_type=None, run=True):
+        """
+        Subscribe a callback to an ophyd object and record it.
+
+        Parameters
+        ----------
+        obj : ophyd.OphydObject
+            Signal or device to subscribe to
+
+        callback : callable
+
+        group : str
+            Context the subscription belongs to
+
+        event_type : str, optional
+            Passed to ``obj.subscribe``, defaults to the object's default
+
+        run : bool, optional
+            Run the callback right away with the current value
+
+        Returns
+        -------
+        subscribed : bool
+            False if this subscription already existed in the group
+        """
+        entry = (obj, callback, event_type)
+        with self._lock:
+            subs = self._groups.setdefault(group, [])
+            if entry in subs:
+                return False
+            subs.append(entry)
+        obj.subscribe(callback, event_type=event_type, run=run)
+        return True
+
+    def clear_group(self, group):
+        """
+        Remove every subscription in a group.
+
+        Parameters
+        ----------
+        group : str
+        """
+        with self._lock:
+            subs = self._groups.pop(group, [])
+        for entry in subs:
+            self._clear(*entry)
+        if subs:
+            logger.debug('Cleared %s subscriptions for %s, %s left',
+                         len(subs), group, len(self))
+
+    def clear_object(self, obj):
+        """
+        Remove every subscription to an object, in any group. Used when the
+        object is about to be destroyed.
+
+        Parameters
+        ----------
+        obj : ophyd.OphydObject
+        """
+        with self._lock:
+            removed = []
+            for group, subs in self._groups.items():
+                removed.extend(entry for entry in subs if entry[0] is obj)
+                subs[:] = [entry for entry in subs if entry[0] is not obj]
+        for entry in removed:
+            self._clear(*entry)
+
+    def clear(self):
+        """
+        Remove every subscription in every group.
+        """
+        with self._lock:
+            groups = list(self._groups)
+        for group in groups:
+            self.clear_group(group)
+
+    def counts(self):
+        """
+        Number of live subscriptions in each group.
+
+        Returns
+        -------
+        counts : dict
+        """
+        with self._lock:
+            return dict((group, len(subs))
+                        for group, subs in self._groups.items() if subs)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._groups.values())
+
+    def _clear(self, obj, callback, event_type):
+        try:
+            obj.clear_sub(callback, event_type=event_type)
+        except (AttributeError, ValueError, KeyError):
+            logger.debug('Subscription on %s was already gone',
+                         getattr(obj, 'name', obj), exc_info=True)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+import pyqtgraph as pg
+from pydm.PyQt.QtCore import QTimer, pyqtSlot
+from pydm.PyQt.QtGui import QWidget, QVBoxLayout
+
+from .image import LatestFrame, FrameGeometry, downsample
+from .subscriptions import SubscriptionRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class Thumbnail:
+    """
+    Newest frame of one imager, shrunk for the thumbnail wall.
+
+    Only the width of the image plugin is subscribed to. Frames are fetched
+    with :meth:`.poll`, so the camera is read at the rate of the wall rather
+    than at the rate of the camera.
+    """
+    def __init__(self, imager, rotation):
+        self.imager = imager
+        self.rotation = rotation or 0
+        self.frames = LatestFrame()
+        self.geometry = FrameGeometry()
+        self.width = None
+        self.item = None
+        self._shape = None
+
+    def connect(self, registry, group):
+        """
+        Subscribe to the width of the image plugin.
+        """
+        registry.subscribe(self.imager.detector.image2.width, self.width_cb,
+                           group)
+
+    def width_cb(self, *args, value=None, **kwargs):
+        self.width = value
+
+    def poll(self):
+        """
+        Read one frame from the image plugin, from any thread.
+        """
+        if not self.width:
+            return
+        value = self.imager.detector.image2.array_data.get()
+        if value is not None:
+            self.frames.put(value)
+
+    def image(self, factor):
+        """
+        The newest frame as a view decimated by ``factor``, or None if no
+        frame arrived since the last call.
+        """
+        frame = self.frames.take()
+        if frame is None or not self.width:
+            return None
+        frame = self.geometry.flat(frame)
+        self.geometry.update(self.width, frame.size)
+        return downsample(self.geometry.view(frame), factor)
+
+    def draw(self, factor):
+        image = self.image(factor)
+        if image is None or self.item is None:
+            return
+        self.item.setImage(image, autoLevels=True)
+        if image.shape != self._shape:
+            # Match the orientation of the main image
+            self._shape = image.shape
+            self.item.setTransformOriginPoint(image.shape[0]/2,
+                                              image.shape[1]/2)
+            self.item.setRotation((self.rotation + 90) % 360)
+
+
+class ThumbnailWall(QWidget):
+    """
+    Small, slow views of every imager in the active procedure at once.
+
+    While the wall is visible, a background thread reads one frame of every
+    imager at ``fps``, see :meth:`.Thumbnail.poll`. Frames are decimated by
+    ``factor`` and every thumbnail is redrawn by one shared timer at the same
+    rate. Only the image widths are subscribed to, and only while the wall is
+    visible.
+
+    Parameters
+    ----------
+    registry : SubscriptionRegistry, optional
+        Where to keep the subscriptions to the image plugins
+
+    fps : float, optional
+        Read and redraw rate of the whole wall
+
+    factor : int, optional
+        Decimation of each frame along both axes
+    """
+    sub_group = 'thumbnails'
+
+    def __init__(self, registry=None, fps=2, factor=8, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Imager Overview')
+        self.registry = registry or SubscriptionRegistry()
+        self.factor = factor
+        self.period = 1. / fps
+        self.thumbnails = []
+        self.layout_widget = pg.GraphicsLayoutWidget()
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.layout_widget)
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(1000 / fps))
+        self.timer.timeout.connect(self.draw)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set_imagers(self, imagers, rotations):
+        """
+        Show a new set of imagers, dropping the old ones.
+
+        Parameters
+        ----------
+        imagers : list
+            Imagers to show, None entries are skipped
+
+        rotations : list
+            Rotation of each imager
+        """
+        self.registry.clear_group(self.sub_group)
+        self.layout_widget.clear()
+        thumbnails = []
+        for imager, rotation in zip(imagers, rotations):
+            if imager is None:
+                continue
+            view = self.layout_widget.addViewBox(row=0,
+                                                 col=len(thumbnails),
+                                                 lockAspect=True,
+                                                 enableMouse=False)
+            view.invertY(True)
+            self.layout_widget.addLabel(imager.name, row=1,
+                                        col=len(thumbnails))
+            thumb = Thumbnail(imager, rotation)
+            thumb.item = pg.ImageItem()
+            view.addItem(thumb.item)
+            thumbnails.append(thumb)
+        self.thumbnails = thumbnails
+        if self.isVisible():
+            self.connect_imagers()
+
+    def connect_imagers(self):
+        for thumb in self.thumbnails:
+            thumb.connect(self.registry, self.sub_group)
+
+    def showEvent(self, event):
+        self.connect_imagers()
+        self.start_polling()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        self.stop_polling()
+        self.registry.clear_group(self.sub_group)
+        super().hideEvent(event)
+
+    def start_polling(self):
+        """
+        Start reading frames in the background, if it is not running already.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # A thread left over from the last stop keeps its own stop event
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, args=(self._stop,),
+                                        name='ThumbnailWall', daemon=True)
+        self._thread.start()
+
+    def stop_polling(self, timeout=0.1):
+        """
+        Stop reading frames.
+
+        A read may be blocked on channel access, so the thread is only waited
+        on for ``timeout`` seconds and otherwise left to exit on its own once
+        the read returns.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                logger.debug('Leaving the thumbnail poll thread to finish')
+            self._thread = None
+
+    def _poll(self, stop):
+        while not stop.wait(self.period):
+            for thumb in self.thumbnails:
+                try:
+                    thumb.poll()
+                except Exception:
+                    logger.debug('Could not read a frame from %s',
+                                 thumb.imager.name, exc_info=True)
+
+    @pyqtSlot()
+    def draw(self):
+        """
+        Redraw every thumbnail that has a new frame.
+        """
+        for thumb in self.thumbnails:
+            try:
+                thumb.draw(self.factor)
+            except Exception:
+                logger.exception('Error drawing thumbnail for %s',
+                                 thumb.imager.name)
@@ -6,12 +6,18 @@ from pydm.PyQt.QtCore import QCoreApplication
 logger = logging.getLogger(__name__)
 
 
-def ad_stats_x_axis_rot(imager, rotation):
+def ad_stats_x_axis_rot(imager, rotation, centroid=None):
     """
     Helper function to pick the correct key and modify a value for a rotated
     areadetector camera with a stats plugin, where you care about the x axis of
     the centroid.
 
+    Parameters
+    ----------
+    centroid: object, optional
+        Source of the centroid signals, with x and y attributes. Defaults to
+        the stats plugin, pass a CentroidEngine to use skywalker's own.
+
     Returns
     -------
     output: dict
@@ -25,7 +31,8 @@ def ad_stats_x_axis_rot(imager, rotation):
     """
     det_key_base = 'detector_stats2_centroid_'
     sizes = imager.detector.cam.array_size
-    centroid = imager.detector.stats2.centroid
+    if centroid is None:
+        centroid = imager.detector.stats2.centroid
     rotation = rotation % 360
     if rotation % 180 == 0:
         det_key = det_key_base + 'x'
@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from pydm.PyQt.QtCore import QCoreApplication
+import logging
+
+from pydm.PyQt.QtCore import (QCoreApplication, QObject, QTimer, pyqtSlot,
+                              pyqtSignal)
 from pydm.PyQt.QtGui import QDoubleValidator
 
 from .utils import ad_stats_x_axis_rot
+from .centroid import CentroidEngine
+from .image import LatestFrame, FrameGeometry, downsample
+from .subscriptions import SubscriptionRegistry
+
+logger = logging.getLogger(__name__)
 
 
 class BaseWidgetGroup:
@@ -313,14 +321,154 @@ class ObjWidgetGroup(PydmWidgetGroup):
         return obj
 
 
+class ImagePipeline(QObject):
+    """
+    Feed camera frames to a PyDMImageView at a limited rate.
+
+    Frames arrive on the channel access thread and only the newest one is
+    kept. A timer on the Qt thread hands it to the image widget at most
+    ``max_fps`` times per second, after shrinking it by ``factor`` if asked
+    to. Frames that arrive in between are dropped.
+
+    Frames are viewed in the shape cached in :attr:`.geometry` without
+    copying. ``geometry_changed`` is emitted with the new width and height
+    the few times the frame size changes.
+
+    Parameters
+    ----------
+    img_widget : PyDMImageView
+
+    max_fps : float, optional
+        Most frames to draw per second, zero or less pauses drawing
+
+    factor : int, optional
+        Shrink the image by this factor along each axis before drawing
+
+    mode : {'decimate', 'bin'}, optional
+        How to shrink the image, see :func:`.downsample`
+
+    registry : SubscriptionRegistry, optional
+        Where to keep the subscriptions to the image signals
+    """
+    sub_group = 'image'
+    geometry_changed = pyqtSignal(int, int)
+
+    def __init__(self, img_widget, max_fps=5, factor=1, mode='decimate',
+                 registry=None, parent=None):
+        super().__init__(parent)
+        self.img_widget = img_widget
+        self.factor = factor
+        self.mode = mode
+        self.registry = registry or SubscriptionRegistry()
+        self.frames = LatestFrame()
+        self.geometry = FrameGeometry()
+        self.width = None
+        self._drawn_width = None
+        self._source = False
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.draw)
+        self.max_fps = max_fps
+
+    @property
+    def max_fps(self):
+        return self._max_fps
+
+    @max_fps.setter
+    def max_fps(self, fps):
+        self._max_fps = fps
+        if fps <= 0:
+            self.timer.stop()
+            return
+        self.timer.setInterval(int(1000 / fps))
+        if self._source:
+            self.timer.start()
+
+    def set_source(self, data_sig, width_sig):
+        """
+        Start drawing frames from a new pair of image plugin signals, or stop
+        drawing if they are None.
+        """
+        self.registry.clear_group(self.sub_group)
+        self.frames.clear()
+        self.geometry = FrameGeometry()
+        self.width = None
+        self._drawn_width = None
+        self._source = data_sig is not None and width_sig is not None
+        if not self._source:
+            self.timer.stop()
+            return
+        self.registry.subscribe(width_sig, self.width_cb, self.sub_group)
+        self.registry.subscribe(data_sig, self.frame_cb, self.sub_group)
+        if self.max_fps > 0:
+            self.timer.start()
+
+    def set_geometry(self, width, height):
+        """
+        Use a frame size that is already known, so the first frames need not
+        wait for the width channel or derive the geometry again.
+        """
+        if width and height and width > 0 and height > 0:
+            self.width = width
+            self.geometry.update(width, width * height)
+
+    def width_cb(self, *args, value=None, **kwargs):
+        self.width = value
+
+    def frame_cb(self, *args, value=None, **kwargs):
+        if value is not None:
+            self.frames.put(value)
+
+    @pyqtSlot()
+    def draw(self):
+        """
+        Hand the newest frame to the image widget, if there is one.
+        """
+        frame = self.frames.take()
+        width = self.width
+        if frame is None or not width:
+            return
+        try:
+            geometry = self.geometry
+            frame = geometry.flat(frame)
+            if geometry.update(width, frame.size):
+                self.geometry_changed.emit(geometry.width, geometry.height)
+            width = geometry.width
+            if self.factor > 1:
+                image = downsample(geometry.view(frame), self.factor,
+                                   self.mode)
+                width = image.shape[0]
+                frame = image.ravel(order='F')
+            if width != self._drawn_width:
+                self.img_widget.image_width_changed(width)
+                self._drawn_width = width
+            self.img_widget.image_value_changed(frame)
+        except Exception:
+            logger.exception('Error drawing image')
+
+
 class ImgObjWidget(ObjWidgetGroup):
     """
     Macros to set up the image widget channels from opyhd areadetector obj.
-    This also includes all of the centroid stuff.
+    This also includes all of the centroid stuff. The centroid subscriptions
+    are kept in the 'imager' group of the registry. Frames are drawn through
+    an :class:`.ImagePipeline` rather than by the image widget's own channels.
+    With soft_centroid, the centroids come from a :class:`.CentroidEngine`
+    instead of the stats plugin.
     """
+    sub_group = 'imager'
+
     def __init__(self, img_widget, img_obj, cent_x_widget, cent_y_widget,
                  delta_x_widget, delta_y_widget, state_widget,
-                 state_select_widget, label, goals_source, rotation=0):
+                 state_select_widget, label, goals_source, rotation=0,
+                 registry=None, max_fps=5, factor=1, mode='decimate',
+                 soft_centroid=False):
+        self.registry = registry or SubscriptionRegistry()
+        self.soft_centroid = soft_centroid
+        self.engine = None
+        self.pipeline = ImagePipeline(img_widget, max_fps=max_fps,
+                                      factor=factor, mode=mode,
+                                      registry=self.registry)
+        self.pipeline.geometry_changed.connect(self.update_geometry)
         self.cent_x_widget = cent_x_widget
         self.cent_y_widget = cent_y_widget
         self.delta_x_widget = delta_x_widget
@@ -339,48 +487,38 @@ class ImgObjWidget(ObjWidgetGroup):
 
     def setup(self, *, pvnames, name=None, rotation=0, **kwargs):
         BaseWidgetGroup.setup(self, name=name)
-        try:
-            self.cent_x.clear_sub(self.update_centroid)
-            self.cent_y.clear_sub(self.update_centroid)
-        except (AttributeError, ValueError):
-            pass
+        self.registry.clear_group(self.sub_group)
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
         self.rotation = rotation
         img_widget = self.widgets[0]
         if self.obj is None:
-            width_pv = None
-            image_pv = None
+            self.pipeline.set_source(None, None)
         else:
-            rot_info = ad_stats_x_axis_rot(self.obj, rotation)
-            self.size_x = rot_info['x_size'].value
-            self.size_y = rot_info['y_size'].value
+            if self.soft_centroid:
+                self.engine = CentroidEngine(self.obj)
+                self.engine.start(registry=self.registry)
+            rot_info = ad_stats_x_axis_rot(self.obj, rotation,
+                                           centroid=self.engine)
             self.cent_x = rot_info['x_cent']
             self.cent_y = rot_info['y_cent']
-            self.mod_x = rot_info['mod_x']
-            self.mod_y = rot_info['mod_y']
-            width_pv = pvnames[0]
-            image_pv = pvnames[1]
-            image_item = img_widget.getImageItem()
-            image_item.setTransformOriginPoint(self.size_x/2,
-                                               self.size_y/2)
-            image_item.setRotation((rotation + 90) % 360)
-            view = img_widget.getView()
-            view.setRange(xRange=(0, self.size_x),
-                          yRange=(0, self.size_y),
-                          padding=0.0)
-
-        if width_pv is None:
-            width_channel = ''
-        else:
-            width_channel = self.protocol + width_pv
-        if image_pv is None:
-            image_channel = ''
-        else:
-            image_channel = self.protocol + image_pv
-        img_widget.widthChannel = width_channel
-        img_widget.imageChannel = image_channel
+            width_sig, image_sig = (self.nested_getattr(self.obj, attr)
+                                    for attr in self.attrs)
+            self.pipeline.set_source(image_sig, width_sig)
+            # Reuse the camera size for the frames until they say otherwise
+            raw_x, raw_y = self.raw_size_x, self.raw_size_y
+            self.pipeline.set_geometry(raw_x, raw_y)
+            self.update_geometry(raw_x, raw_y)
+
+        # The pipeline draws the frames, not the widget's channels
+        img_widget.widthChannel = ''
+        img_widget.imageChannel = ''
         if self.obj is not None:
-            self.cent_x.subscribe(self.update_centroid)
-            self.cent_y.subscribe(self.update_centroid)
+            self.registry.subscribe(self.cent_x, self.update_centroid,
+                                    self.sub_group)
+            self.registry.subscribe(self.cent_y, self.update_centroid,
+                                    self.sub_group)
 
         try:
             state_read = self.obj.states.state._read_pv.pvname or ''
@@ -396,6 +534,54 @@ class ImgObjWidget(ObjWidgetGroup):
         self.state_widget.channel = state_read
         self.state_select_widget.channel = state_write
 
+    def capture_background(self, frames=10):
+        """
+        Take a dark frame for the imager on screen. Only possible with
+        soft_centroid.
+
+        Returns
+        -------
+        started : bool
+        """
+        if self.engine is None:
+            return False
+        self.engine.capture_background(frames=frames)
+        return True
+
+    def set_soft_centroid(self, soft_centroid):
+        """
+        Choose between skywalker's centroids and the stats plugin's.
+        """
+        if soft_centroid != self.soft_centroid:
+            self.soft_centroid = soft_centroid
+            self.change_obj(self.obj, rotation=self.rotation)
+
+    def update_geometry(self, raw_x, raw_y):
+        """
+        Fit the view and the centroid corrections to the unrotated frame size.
+        This only runs when the camera changes or the frame size does.
+        """
+        if self.obj is None:
+            return
+        rot_info = ad_stats_x_axis_rot(self.obj, self.rotation)
+        self.mod_x = rot_info['mod_x']
+        self.mod_y = rot_info['mod_y']
+        if self.rotation % 180 == 0:
+            self.size_x, self.size_y = raw_x, raw_y
+        else:
+            self.size_x, self.size_y = raw_y, raw_x
+        # Shrunken images are drawn in shrunken coordinates
+        scale = max(self.pipeline.factor, 1)
+        img_widget = self.widgets[0]
+        image_item = img_widget.getImageItem()
+        image_item.setTransformOriginPoint(self.size_x/2/scale,
+                                           self.size_y/2/scale)
+        image_item.setRotation((self.rotation + 90) % 360)
+        view = img_widget.getView()
+        view.setRange(xRange=(0, self.size_x/scale),
+                      yRange=(0, self.size_y/scale),
+                      padding=0.0)
+
     def update_centroid(self, *args, **kwargs):
         xpos = self.cent_x.value
         ypos = self.cent_y.value
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import multiprocessing
+
+import numpy as np
+
+from .image import FrameGeometry, moments
+
+logger = logging.getLogger(__name__)
+
+
+def _analyze(buffers, locks, pending, tasks, results, threshold):
+    """
+    Worker process loop. Each task names a slot whose newest frame is copied
+    out of shared memory and reduced to its moments.
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        slot, name, dtype, size, width, timestamp = task
+        with locks[slot]:
+            pending[slot] = 0
+            frame = np.frombuffer(buffers[slot], dtype=dtype,
+                                  count=size).copy()
+        try:
+            geometry = FrameGeometry()
+            geometry.update(width, size)
+            result = moments(geometry.view(frame), threshold=threshold)
+        except Exception as exc:
+            result = dict(error=str(exc))
+        result.update(name=name, timestamp=timestamp)
+        results.put(result)
+
+
+class FramePool:
+    """
+    Analyze the frames of several cameras in separate processes.
+
+    Every imager is given a slot of shared memory. Submitting a frame copies
+    it into the slot and, unless the slot is already waiting on a worker,
+    queues it for analysis. A frame that arrives before the worker gets to the
+    previous one replaces it, so only the newest frame of each camera is ever
+    analyzed. The workers send back only the moments of the frame, see
+    :func:`.moments`, which are passed to the callback from a reader thread as
+    a dictionary with the ``name`` of the imager and the ``timestamp`` of the
+    frame added.
+
+    Parameters
+    ----------
+    callback : callable
+        Called with each result dictionary
+
+    processes : int, optional
+        Number of worker processes, defaults to the number of slots
+
+    slots : int, optional
+        Most imagers that can be fed at once
+
+    max_bytes : int, optional
+        Size of the largest frame that fits in a slot
+
+    threshold : float, optional
+        Pixels at or below this value are ignored
+
+    method : str, optional
+        Multiprocessing start method. The default, 'spawn', avoids copying
+        the Qt application into the workers
+    """
+    def __init__(self, callback, processes=None, slots=4,
+                 max_bytes=4 * 1024 * 1024, threshold=0, method='spawn'):
+        ctx = multiprocessing.get_context(method)
+        self.callback = callback
+        self.max_bytes = max_bytes
+        self._buffers = [ctx.RawArray('B', max_bytes) for _ in range(slots)]
+        self._locks = [ctx.Lock() for _ in range(slots)]
+        self._pending = ctx.RawArray('b', slots)
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._slots = {}
+        self._widths = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self._workers = [ctx.Process(target=_analyze,
+                                     args=(self._buffers, self._locks,
+                                           self._pending, self._tasks,
+                                           self._results, threshold),
+                                     name='FramePool-{}'.format(i),
+                                     daemon=True)
+                         for i in range(processes or slots)]
+        for worker in self._workers:
+            worker.start()
+        self._running = True
+        self._reader = threading.Thread(target=self._read_results,
+                                        name='FramePool results',
+                                        daemon=True)
+        self._reader.start()
+
+    def assign(self, name):
+        """
+        Give an imager a slot, or return the one it already has.
+
+        Raises
+        ------
+        RuntimeError
+            If every slot is taken
+        """
+        with self._lock:
+            if name not in self._slots:
+                taken = set(self._slots.values())
+                free = set(range(len(self._buffers))) - taken
+                if not free:
+                    raise RuntimeError('No free slot for {}'.format(name))
+                self._slots[name] = min(free)
+            return self._slots[name]
+
+    def release(self, name):
+        """
+        Free the slot of an imager
+        """
+        with self._lock:
+            self._slots.pop(name, None)
+
+    @property
+    def names(self):
+        """
+        Imagers that have a slot
+        """
+        with self._lock:
+            return list(self._slots)
+
+    def submit(self, name, frame, width, timestamp=None):
+        """
+        Hand a flat frame to the workers. Safe to call from any thread.
+
+        Parameters
+        ----------
+        name : str
+            Imager the frame is from, must have a slot
+
+        frame : np.ndarray
+            Flat frame data
+
+        width : int
+            Number of pixels in a row
+
+        timestamp : float, optional
+            Passed back with the result
+
+        Returns
+        -------
+        queued : bool
+            False if the frame replaced one that was still waiting
+        """
+        if not self._running:
+            return False
+        with self._lock:
+            slot = self._slots[name]
+        frame = np.asarray(frame).ravel()
+        if frame.nbytes > self.max_bytes:
+            raise ValueError('Frame of {} bytes does not fit in a slot'
+                             ''.format(frame.nbytes))
+        with self._locks[slot]:
+            shared = np.frombuffer(self._buffers[slot], dtype=frame.dtype,
+                                   count=frame.size)
+            shared[:] = frame
+            waiting = self._pending[slot]
+            self._pending[slot] = 1
+            if not waiting:
+                self._tasks.put((slot, name, frame.dtype.str, frame.size,
+                                 int(width), timestamp))
+        self.submitted += 1
+        if waiting:
+            self.dropped += 1
+        return not waiting
+
+    def feed(self, imager, registry, group):
+        """
+        Submit every frame from the image plugin of an imager.
+
+        Parameters
+        ----------
+        imager : pcdsdevices.PIM
+
+        registry : SubscriptionRegistry
+            Where to keep the subscriptions to the image plugin
+
+        group : str
+            Registry group for the subscriptions. Clearing it stops the feed,
+            the slot is kept until :meth:`.release`
+        """
+        name = imager.name
+        self.assign(name)
+        image2 = imager.detector.image2
+
+        def width_cb(*args, value=None, **kwargs):
+            self._widths[name] = value
+
+        def frame_cb(*args, value=None, timestamp=None, **kwargs):
+            width = self._widths.get(name)
+            if value is None or not width:
+                return
+            try:
+                self.submit(name, value, width, timestamp=timestamp)
+            except (KeyError, ValueError):
+                logger.debug('Frame from %s not analyzed', name,
+                             exc_info=True)
+
+        registry.subscribe(image2.width, width_cb, group)
+        registry.subscribe(image2.array_data, frame_cb, group)
+
+    def _read_results(self):
+        while True:
+            result = self._results.get()
+            if result is None:
+                return
+            if 'error' in result:
+                logger.debug('Could not analyze frame from %s: %s',
+                             result['name'], result['error'])
+                continue
+            try:
+                self.callback(result)
+            except Exception:
+                logger.exception('Error in frame result callback')
+
+    def stop(self):
+        """
+        End the worker processes and the reader thread
+        """
+        if not self._running:
+            return
+        self._running = False
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+        self._results.put(None)
+        self._reader.join(timeout=1)
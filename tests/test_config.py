@@ -14,7 +14,8 @@ import pytest
 ##########
 import pcdsdevices
 from pcdsdevices.sim.pim import PIM
-from skywalker.config import ConfigReader, sim_config
+from skywalker.config import (ConfigReader, ConnectionPolicy, SimConfigReader,
+                              sim_config)
 from pcdsdevices.sim.pv import using_fake_epics_pv
 
 #Hack to use simulated PIM
@@ -46,3 +47,216 @@ def test_lightpath_loading():
     devs, containers = cfg.load_configuration()
     assert len(devs) == 3
     assert len(containers) == 0
+    #Check that the load times were recorded
+    assert len(cfg.metrics.slowest_devices()) == 3
+
+def test_connection_policy():
+    #Everything is required by default
+    assert ConnectionPolicy().is_required('states.state')
+    #Naming a component requires all of its signals
+    policy = ConnectionPolicy(required=['states'])
+    assert policy.is_required('states.state')
+    assert not policy.is_required('detector.image2.array_data')
+    assert not policy.is_required('states_extra')
+
+def test_policy_lookup():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'),
+                       policies={'PIM': ConnectionPolicy(timeout=5)})
+    pim = cfg.client.load_device(name='HX2 PIM')
+    assert cfg.get_policy(pim).timeout == 5
+    mirror = cfg.client.load_device(name='FEE M1H')
+    assert cfg.get_policy(mirror) is cfg.default_policy
+
+def test_negative_cache(monkeypatch):
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    lookups = []
+    load = cfg.client.load_device
+    def counted_load(**kwargs):
+        lookups.append(kwargs)
+        return load(**kwargs)
+    monkeypatch.setattr(cfg.client, 'load_device', counted_load)
+    #A missing device is only looked up once
+    assert cfg.load_device('Not A Device') is None
+    assert cfg.load_device('Not A Device') is None
+    assert len(lookups) == 1
+    assert cfg.known_bad('Not A Device')
+    #The entry expires
+    monkeypatch.setattr(cfg, 'negative_ttl', -1)
+    assert not cfg.known_bad('Not A Device')
+
+def test_no_retry_for_known_bad():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    assert cfg.load_device('Not A Device') is None
+    container = cfg.client.load_device(name='HX2 PIM')
+    container.name = 'Not A Device'
+    #Known bad devices are not handed to the retry thread
+    cfg.retry_containers([container])
+    assert cfg.retry.pending == []
+
+def test_connect_timeout(monkeypatch):
+    #A policy without a timeout still gives up on devices
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'),
+                       policies={'PIM': ConnectionPolicy(timeout=None)})
+    monkeypatch.setattr(cfg, 'connect_timeout', 0.2)
+    info = cfg._prepare_device('HX2 PIM')
+    assert info['timeout'] == 0.2
+    #Nothing ever connects
+    for sig in info['signals'].values():
+        monkeypatch.setattr(type(sig), 'connected', False, raising=False)
+    assert list(cfg._connect_devices({'HX2 PIM': info})) == [('HX2 PIM',
+                                                              None)]
+    #It is not in the negative cache, so it can be retried
+    assert not cfg.known_bad('HX2 PIM')
+
+def test_update_systems():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    #Pretend both systems are loaded
+    cfg.cache = {'m1h': {'rotation': 90}, 'm2h': {'rotation': 90}}
+    new_systems = {'m1h': dict(cfg.live_systems['m1h'], rotation=0),
+                   'm3h': dict(cfg.live_systems['m2h'])}
+    added, removed, changed = cfg.update_systems(new_systems)
+    assert added == ['m3h']
+    assert removed == ['m2h']
+    assert changed == ['m1h']
+    #Rotation changes keep the loaded devices
+    assert cfg.cache == {'m1h': {'rotation': 0}}
+    assert cfg.get_systems_with('HFX DG3 PIM') == ['m3h']
+
+def test_containers_for():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    #Everything is on HXD, ordered by z
+    names = [c.name for c in cfg.containers_for('HXD')]
+    assert names == ['FEE M1H', 'HX2 Slits', 'HX2 PIM']
+    #No devices in this hutch
+    assert cfg.containers_for('XPP') == []
+
+def test_containers_for_branch():
+    cfg = ConfigReader(make_test_path('../config/metadata.json'),
+                       make_test_path('../config/system.json'))
+    containers = cfg.containers_for('MFX')
+    mfx = [c for c in containers if c.beamline == 'MFX']
+    hxd = [c for c in containers if c.beamline == 'HXD']
+    assert mfx and hxd
+    #Every MFX device, but only the HXD devices before the branch point
+    assert len(mfx) == len([c for c in cfg.client.all_devices
+                            if c.active and c.beamline == 'MFX'])
+    branch = min(c.z for c in mfx)
+    assert all(c.z <= branch for c in hxd)
+    assert not [c for c in containers if c.beamline in ('MEC', 'XCS')]
+    #XCS branches after the end of HXD and gets all of it
+    xcs_hxd = [c for c in cfg.containers_for('XCS') if c.beamline == 'HXD']
+    assert len(xcs_hxd) == len([c for c in cfg.client.all_devices
+                                if c.active and c.beamline == 'HXD'
+                                and c.z is not None])
+
+@using_fake_epics_pv
+def test_device_proxies():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    proxies = cfg.load_proxies(beamline='HXD')
+    assert [proxy.z for proxy in proxies] == sorted(proxy.z
+                                                    for proxy in proxies)
+    #Nothing is loaded until we ask for the state
+    proxy = proxies[0]
+    assert proxy.device is None
+    assert not proxy.inserted
+    proxy._future.result(timeout=10)
+    assert proxy.device is not None
+
+@using_fake_epics_pv
+def test_iter_configuration():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    loaded = list(cfg.iter_configuration())
+    assert len(loaded) == 3
+    assert all(dev is not None for (container, dev) in loaded)
+    assert all(container.name == dev.name for (container, dev) in loaded)
+
+def test_probe_pv():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    container = cfg.client.load_device(name='HX2 PIM')
+    assert cfg.probe_pv(container).startswith(container.prefix)
+    #Explicit probe in the happi metadata
+    container.extraneous['probe_pv'] = 'HX2:SB1:PIM:STATE'
+    assert cfg.probe_pv(container) == 'HX2:SB1:PIM:STATE'
+
+def test_z_position():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    assert cfg.z_position('HX2 PIM') == 773.805
+    assert cfg.z_position('not a device') is None
+
+def test_pixel_size():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    assert cfg.pixel_size('HX2 PIM') == 12.5
+    #Known devices without a pixel size
+    assert cfg.pixel_size('HX2 Slits') is None
+    assert cfg.pixel_size('not a device') is None
+
+def test_prescan(monkeypatch):
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'),
+                       prescan=True)
+    #Nothing answers, so nothing is built
+    monkeypatch.setattr(cfg, 'scan_reachable',
+                        lambda containers: ([], list(containers)))
+    monkeypatch.setattr(cfg, '_prepare_device', None)
+    loaded = list(cfg.iter_configuration())
+    assert len(loaded) == 3
+    assert all(dev is None for (container, dev) in loaded)
+
+@using_fake_epics_pv
+def test_signal_profiles():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    #Only wait on the signals the mirror role uses
+    info = cfg._prepare_device('FEE M1H', role='mirror')
+    assert info['times']
+    assert all(attr.startswith('pitch.') for attr in info['times'])
+    #Without a role every signal is connected and waited on
+    info = cfg._prepare_device('FEE M1H')
+    assert len(info['times']) == len(info['signals'])
+
+def test_cache_eviction():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'),
+                       cache_size=2)
+    evicted = []
+    cfg.subscribe(lambda system, destroyed, **kwargs:
+                  evicted.append((system, destroyed)),
+                  event_type=cfg.SUB_EVICTED)
+    shared = object()
+    cfg.pin(['a'])
+    cfg._store('a', {'mirror': shared})
+    cfg._store('b', {'mirror': shared})
+    cfg._store('c', {'mirror': object()})
+    #Nothing is evicted until asked
+    assert list(cfg.cache) == ['a', 'b', 'c']
+    assert evicted == []
+    #Least recently used unpinned system goes first, shared devices stay
+    assert cfg.evict() == ['b']
+    assert list(cfg.cache) == ['a', 'c']
+    assert evicted == [('b', [])]
+    #Idle systems are evicted even when there is room
+    cfg.idle_timeout = 60
+    cfg._last_used['c'] -= 120
+    assert cfg.evict() == ['c']
+    assert list(cfg.cache) == ['a']
+
+def test_sim_config_reader():
+    cfg = SimConfigReader()
+    cfg.pin(['sim_mfx'])
+    assert cfg.get_subsystem('sim_mfx') is sim_config['sim_mfx']
+    #Requests keep the cache in order of use
+    assert list(cfg.cache)[-1] == 'sim_mfx'
+    #The simulated cache is unbounded
+    assert cfg.evict() == []
+    assert set(cfg.cache) == set(sim_config)
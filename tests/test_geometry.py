@@ -0,0 +1,58 @@
+############
+# Standard #
+############
+
+###############
+# Third Party #
+###############
+import numpy as np
+import pytest
+
+##########
+# Module #
+##########
+from skywalker.geometry import (first_step, predict_first_steps,
+                                solve_corrections)
+
+
+def test_first_step():
+    #100 pixels of 20 microns, 10 meters downstream
+    assert first_step(100, 10, 20) == pytest.approx(-100)
+    assert first_step(100, 10, 20, sign=-1) == pytest.approx(100)
+
+
+def test_solve_corrections():
+    matrix = np.array([[10., 0.], [25., -8.]])
+    steps = np.array([0.3, -0.7])
+    assert np.allclose(solve_corrections(matrix, matrix.dot(steps)), -steps)
+
+
+def test_predict_first_steps():
+    steps = predict_first_steps([100, None, 0.5, 50, 10],
+                                [10, 10, 10, None, 10],
+                                [20, 20, 20, 20, None], 6, maximum=50)
+    #Geometry clamped to the maximum, no error, the minimum step, no
+    #distance and no pixel size
+    assert steps == pytest.approx([50, 6, 0.6, 6, 6])
+    #The sign comes from the default step without a calibration
+    steps = predict_first_steps([10, -10, 0], [10, 10, 10], [20, 20, 20],
+                                -6)
+    assert steps == pytest.approx([-10, -10, -0.6])
+    #The maximum defaults to three default steps
+    assert predict_first_steps([1000], [10], [20], 6) == pytest.approx([18])
+
+
+def test_predict_first_steps_matrix():
+    matrix = np.array([[10., 0.], [25., -8.]])
+    errors = matrix.dot([3., -7.])
+    steps = predict_first_steps(errors, [None, None], [None, None], 6,
+                                matrix=matrix)
+    assert steps == pytest.approx([-3, 7])
+    #The measured signs are kept through the clamp
+    steps = predict_first_steps(errors * 10, [None, None], [None, None], 6,
+                                matrix=matrix)
+    assert steps == pytest.approx([-18, 18])
+    #Without every error the matrix can not be used
+    steps = predict_first_steps([errors[0], None], [10, 10], [20, 20], 6,
+                                matrix=matrix, maximum=100)
+    assert steps == pytest.approx([abs(first_step(errors[0], 10, 20)), 6])
@@ -0,0 +1,82 @@
+############
+# Standard #
+############
+
+###############
+# Third Party #
+###############
+import numpy as np
+import pytest
+
+##########
+# Module #
+##########
+from skywalker.history import RingBuffer, History
+
+
+def test_ring_buffer_wraps():
+    buff = RingBuffer(size=4, min_interval=0)
+    for i in range(6):
+        assert buff.append(float(i), i * 10.)
+    assert len(buff) == 4
+    assert buff.count == 6
+    times, values = buff.data()
+    assert list(times) == [2, 3, 4, 5]
+    assert list(values) == [20, 30, 40, 50]
+    times, values = buff.data(since=4)
+    assert list(times) == [4, 5]
+
+
+def test_ring_buffer_tail():
+    buff = RingBuffer(size=4, min_interval=0)
+    times, values, count = buff.tail(0)
+    assert len(times) == 0 and count == 0
+    for i in range(3):
+        buff.append(float(i), i * 10.)
+    times, values, count = buff.tail(0)
+    assert list(times) == [0, 1, 2]
+    assert count == 3
+    #Only the new samples, skipping those that were overwritten
+    for i in range(3, 9):
+        buff.append(float(i), i * 10.)
+    times, values, count = buff.tail(count)
+    assert list(times) == [5, 6, 7, 8]
+    assert list(values) == [50, 60, 70, 80]
+    assert count == 9
+    assert len(buff.tail(count)[0]) == 0
+
+
+def test_ring_buffer_min_interval():
+    buff = RingBuffer(size=4, min_interval=1.0)
+    assert buff.append(0.0, 1.)
+    #Too soon after the last sample
+    assert not buff.append(0.5, 2.)
+    assert buff.append(1.0, 3.)
+    assert list(buff.data()[1]) == [1, 3]
+
+
+def test_ring_buffer_stats():
+    buff = RingBuffer(size=100, min_interval=0)
+    assert buff.stats() == {}
+    #Two pixels per hour of drift with +/-1 of jitter
+    for i in range(100):
+        buff.append(i * 36., i * 0.02 + (-1)**i)
+    stats = buff.stats()
+    assert stats['drift'] == pytest.approx(2, abs=0.1)
+    assert stats['jitter'] == pytest.approx(np.sqrt(1 + 2**2/12), abs=0.1)
+    assert stats['peak_to_peak'] == pytest.approx(3.94)
+
+
+def test_history_recorder():
+    history = History(size=10, min_interval=0)
+    callback = history.recorder('HX2 PIM x')
+    callback(value=3, timestamp=1.)
+    callback(value=None, timestamp=2.)
+    callback(value=4)
+    assert list(history.buffer('HX2 PIM x').data()[1]) == [3]
+    history.record('FEE M1H pitch', 1., 100.)
+    history.record('FEE M1H pitch', 2., 102.)
+    stats = history.stats()
+    assert list(stats) == ['HX2 PIM x', 'FEE M1H pitch']
+    assert stats['HX2 PIM x'] == {}
+    assert stats['FEE M1H pitch']['mean'] == 101
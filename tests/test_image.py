@@ -0,0 +1,100 @@
+############
+# Standard #
+############
+
+###############
+# Third Party #
+###############
+import numpy as np
+import pytest
+
+##########
+# Module #
+##########
+from skywalker.image import (LatestFrame, FrameGeometry, BackgroundModel,
+                             downsample, centroid, beam_present, moments)
+
+
+def test_latest_frame():
+    frames = LatestFrame()
+    assert frames.take() is None
+    frames.put(1)
+    frames.put(2)
+    frames.put(3)
+    #Only the newest frame survives
+    assert frames.take() == 3
+    assert frames.take() is None
+    assert frames.received == 3
+    assert frames.dropped == 2
+
+
+def test_downsample():
+    image = np.arange(36).reshape(6, 6)
+    assert downsample(image, 1) is image
+    small = downsample(image, 2)
+    assert small.shape == (3, 3)
+    assert np.shares_memory(small, image)
+    assert small[1, 1] == image[2, 2]
+    binned = downsample(np.ones((7, 5)), 2, mode='bin')
+    assert binned.shape == (3, 2)
+    assert np.all(binned == 1)
+    with pytest.raises(ValueError):
+        downsample(image, 2, mode='smudge')
+
+
+def test_frame_geometry():
+    geometry = FrameGeometry()
+    frame = np.arange(12, dtype=np.uint16)
+    assert geometry.update(4, frame.size)
+    #Nothing to derive for the next frame of the same size
+    assert not geometry.update(4, frame.size)
+    image = geometry.view(frame)
+    assert image.shape == (4, 3)
+    assert np.shares_memory(image, frame)
+    #Rows run along the first axis
+    assert image[1, 2] == 9
+    #Raw buffers are viewed too
+    raw = bytearray(range(12))
+    assert np.shares_memory(geometry.view(raw), np.frombuffer(raw, np.uint8))
+    with pytest.raises(ValueError):
+        geometry.update(5, frame.size)
+
+
+def test_centroid():
+    image = np.zeros((20, 10))
+    image[5, 3] = 1
+    image[7, 3] = 1
+    assert centroid(image) == (6, 3)
+    #Cropping keeps full frame coordinates
+    assert centroid(image, roi=(6, 20, 0, 10)) == (7, 3)
+    #Everything under the threshold
+    assert centroid(image, threshold=1) == (None, None)
+    #Flat background is removed
+    noisy = image + 0.5
+    assert centroid(noisy, background=np.full(image.shape, 0.5)) == (6, 3)
+
+
+def test_background_and_beam():
+    dark = BackgroundModel(frames=2)
+    noise = np.full((40, 40), 30, dtype=np.uint8)
+    assert not dark.add(noise)
+    assert dark.add(noise + 2)
+    assert dark.ready
+    assert np.all(dark.frame == 31)
+    #A dark frame has no beam once the background is removed
+    assert beam_present(noise)
+    assert not beam_present(noise, background=dark.frame)
+    beam = noise.copy()
+    beam[8:24, 8:24] = 200
+    assert beam_present(beam, background=dark.frame)
+
+
+def test_moments():
+    image = np.zeros((10, 10))
+    assert moments(image)['x'] is None
+    image[2, 5] = 1
+    image[6, 5] = 1
+    result = moments(image)
+    assert result['sum'] == 2
+    assert (result['x'], result['y']) == (4, 5)
+    assert (result['sigma_x'], result['sigma_y']) == (2, 0)
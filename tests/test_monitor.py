@@ -0,0 +1,80 @@
+############
+# Standard #
+############
+import time
+
+###############
+# Third Party #
+###############
+
+##########
+# Module #
+##########
+from skywalker.history import History
+from skywalker.monitor import DriftMonitor
+
+
+def test_drift_monitor_check():
+    history = History(min_interval=0)
+    alerts = []
+    monitor = DriftMonitor(history, lambda *args: alerts.append(args),
+                           threshold=5, hold=3, window=2)
+    monitor.set_targets({'HX2 PIM x': 100})
+    #Nothing recorded yet
+    assert monitor.check(now=0) == {}
+    for t in range(10):
+        history.record('HX2 PIM x', t, 102)
+    assert monitor.check(now=9)['HX2 PIM x'] == 2
+    for t in range(10, 20):
+        history.record('HX2 PIM x', t, 110)
+        monitor.check(now=t)
+        #Drifted from t=10 but alert only after holding for 3 seconds
+        if t < 13:
+            assert alerts == []
+    #Only alert once per drift
+    assert alerts == [('HX2 PIM x', 10)]
+    monitor.set_targets({})
+    assert monitor.check(now=19) == {}
+
+
+def test_drift_monitor_beam_off():
+    history = History(min_interval=0)
+    alerts = []
+    monitor = DriftMonitor(history, lambda *args: alerts.append(args),
+                           threshold=5, hold=0, window=2)
+    monitor.set_targets({'HX2 PIM x': 100})
+    for t in range(5):
+        history.record('HX2 PIM x', t, 101)
+    assert monitor.check(now=4)['HX2 PIM x'] == 1
+    #The stats plugin reports zero without beam
+    for t in range(5, 10):
+        history.record('HX2 PIM x', t, 0)
+        deviations = monitor.check(now=t)
+        #Beam off for the whole window gives no verdict
+        if t >= 7:
+            assert 'HX2 PIM x' not in deviations
+        else:
+            assert deviations['HX2 PIM x'] == 1
+    assert alerts == []
+    #Only the valid readings count while the beam comes back
+    history.record('HX2 PIM x', 10, 102)
+    assert monitor.check(now=10)['HX2 PIM x'] == 2
+    assert alerts == []
+
+
+def test_drift_monitor_thread():
+    history = History(min_interval=0)
+    alerts = []
+    monitor = DriftMonitor(history, lambda *args: alerts.append(args),
+                           threshold=1, hold=0, period=0.01)
+    monitor.set_targets({'HX2 PIM y': 0})
+    history.record('HX2 PIM y', time.time(), 5)
+    monitor.start()
+    try:
+        for _ in range(100):
+            if alerts:
+                break
+            time.sleep(0.01)
+    finally:
+        monitor.stop()
+    assert alerts == [('HX2 PIM y', 5)]
@@ -0,0 +1,110 @@
+############
+# Standard #
+############
+import time
+import threading
+
+###############
+# Third Party #
+###############
+import pytest
+import simplejson
+
+
+##########
+# Module #
+##########
+from skywalker.profiling import PhaseTimer, ConnectionMetrics
+
+
+def test_phase_timer():
+    timer = PhaseTimer('test')
+    with timer.phase('outer'):
+        with timer.phase('inner'):
+            time.sleep(0.01)
+    #Nested phases do not count twice towards the total
+    durations = timer.durations()
+    assert durations['inner'] >= 0.01
+    assert timer.total == pytest.approx(durations['outer'])
+    #Summary is in start order with indented children
+    lines = timer.summary().split('\n')
+    assert lines[1].startswith('  outer')
+    assert lines[2].startswith('    inner')
+    #Nothing is recorded after stopping
+    timer.stop()
+    with timer.phase('ignored'):
+        pass
+    assert 'ignored' not in timer.durations()
+
+
+def test_phase_timer_mark():
+    timer = PhaseTimer('test', max_phases=3)
+    timer.mark('first')
+    with timer.phase('nested'):
+        pass
+    timer.mark('second')
+    timer.stop()
+    #Marked phases are top-level, with phases inside them nested
+    assert [(p[0], p[3]) for p in timer.phases] == [('nested', 1),
+                                                    ('first', 0),
+                                                    ('second', 0)]
+    assert timer.total == pytest.approx(timer.durations()['first']
+                                        + timer.durations()['second'])
+    #Only the newest phases are kept
+    timer = PhaseTimer('test', max_phases=3)
+    for i in range(5):
+        with timer.phase(str(i)):
+            pass
+    assert [p[0] for p in timer.phases] == ['2', '3', '4']
+
+
+def test_phase_timer_threads():
+    timer = PhaseTimer('test')
+    metrics = ConnectionMetrics()
+
+    def load(name):
+        for i in range(50):
+            with timer.phase(name):
+                metrics.record_stage(name, str(i), 0.)
+
+    with timer.phase('outer'):
+        threads = [threading.Thread(target=load, args=(str(n),))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    #Other threads do not nest inside of this thread's phases
+    assert len(timer.phases) == 201
+    assert all(phase[3] == 0 for phase in timer.phases)
+    assert len(metrics.table) == 200
+
+
+def test_connection_metrics(tmpdir):
+    metrics = ConnectionMetrics()
+    for dev in ('fast', 'slow'):
+        with metrics.stage(dev, 'find'):
+            pass
+    with metrics.stage('slow', 'connect'):
+        time.sleep(0.01)
+    metrics.record_signals('fast', [('a', 'FAST:A', 0.1)])
+    metrics.record_signals('slow', [('a', 'SLOW:A', 0.5),
+                                    ('b', 'SLOW:B', None)])
+    assert metrics.slowest_devices(1)[0][0] == 'slow'
+    #Unconnected signals are the slowest
+    assert [sig[2] for sig in metrics.slowest_signals(2)] == ['SLOW:B',
+                                                             'SLOW:A']
+    assert 'SLOW:B' in metrics.report()
+    #Reloading a device replaces the old rows
+    with metrics.stage('slow', 'find'):
+        pass
+    assert len(metrics.table) == 3
+    #Dump to both formats
+    csv_path = str(tmpdir.join('metrics.csv'))
+    metrics.dump(csv_path)
+    with open(csv_path) as f:
+        assert len(f.readlines()) == 4
+    json_path = str(tmpdir.join('metrics.json'))
+    metrics.dump(json_path)
+    with open(json_path) as f:
+        assert len(simplejson.load(f)) == 3
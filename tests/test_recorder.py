@@ -0,0 +1,44 @@
+############
+# Standard #
+############
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+##########
+# Module #
+##########
+from skywalker.recorder import FrameRecorder, load_recording
+
+
+def test_frame_recorder(tmpdir):
+    recorder = FrameRecorder(str(tmpdir), max_frames=3)
+    image = np.arange(12, dtype=np.uint8).reshape((4, 3), order='F')
+    for i in range(4):
+        recorder.submit('HX2 PIM', image.ravel(order='F') + i, 4,
+                        timestamp=float(i))
+    recorder.close()
+    #The fourth frame did not fit
+    assert recorder.dropped == 1
+    times, frames = load_recording(recorder.files['HX2 PIM'])
+    assert list(times) == [0, 1, 2]
+    assert frames.shape == (3, 4, 3)
+    assert np.all(frames[2] == image + 2)
+
+
+def test_frame_recorder_rate(tmpdir, caplog):
+    recorder = FrameRecorder(str(tmpdir), max_frames=2, min_interval=1.0)
+    frame = np.zeros(12, dtype=np.uint8)
+    for i in range(10):
+        recorder.submit('HX2 PIM', frame, 4, timestamp=i * 0.4)
+    recorder.close()
+    #Frames at 0, 1.2, 2.4 and 3.6 pass the rate limit, two of them fit
+    assert recorder.skipped == 6
+    assert recorder.dropped == 2
+    times, frames = load_recording(recorder.files['HX2 PIM'])
+    assert np.allclose(times, [0, 1.2])
+    #Only the first dropped frame is logged
+    drops = [rec for rec in caplog.records if 'Dropping' in rec.getMessage()]
+    assert len(drops) == 1
@@ -0,0 +1,61 @@
+############
+# Standard #
+############
+import time
+import threading
+
+###############
+# Third Party #
+###############
+
+
+##########
+# Module #
+##########
+from skywalker.retry import RetryScheduler
+
+
+def test_retry_until_success():
+    attempts = []
+    results = {}
+    done = threading.Event()
+
+    def flaky():
+        attempts.append(time.time())
+        if len(attempts) < 3:
+            return None
+        return 'device'
+
+    def callback(key, result):
+        results[key] = result
+        done.set()
+
+    retry = RetryScheduler(delay=0.01, factor=2, max_delay=0.05)
+    retry.schedule('dev', flaky, callback=callback)
+    assert 'dev' in retry
+    assert done.wait(timeout=5)
+    assert results == {'dev': 'device'}
+    assert len(attempts) == 3
+    #Backoff increases the wait between attempts
+    assert attempts[2] - attempts[1] > attempts[1] - attempts[0]
+    assert retry.pending == []
+    retry.stop()
+
+
+def test_retry_gives_up_and_cancels():
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise RuntimeError
+
+    retry = RetryScheduler(delay=0.01, max_attempts=2)
+    retry.schedule('broken', broken)
+    retry.schedule('never', broken)
+    retry.cancel('never')
+    deadline = time.time() + 5
+    while retry.pending and time.time() < deadline:
+        time.sleep(0.01)
+    assert retry.pending == []
+    assert len(calls) == 2
+    retry.stop()
@@ -0,0 +1,180 @@
+############
+# Standard #
+############
+
+###############
+# Third Party #
+###############
+import numpy as np
+import pytest
+from bluesky import RunEngine
+
+##########
+# Module #
+##########
+from skywalker.config import sim_config, s as undulator
+from skywalker.steering import (steering_step, solve_corrections, steer,
+                                check_response, measure_response, correct)
+
+
+@pytest.fixture(scope='function')
+def RE():
+    return RunEngine({})
+
+
+@pytest.fixture(scope='function')
+def mfx():
+    """
+    The simulated MFX mirror and imager, with the beam in the middle of the
+    imager
+    """
+    mirror = sim_config['sim_mfx']['mirror']
+    imager = sim_config['sim_mfx']['imager']
+    imager.move('IN')
+    #Invert the one bounce ray tracing of pswalker.examples
+    z1, z2 = mirror.sim_z.value, imager.sim_z.value
+    alpha = (imager.sim_x.value - 2 * mirror.sim_x.value
+             + undulator.sim_x.value + z2 * undulator.sim_xp.value)
+    mirror.set(alpha / (2 * (z2 - z1)) * 1e6)
+    centroid = imager.detector.stats2.centroid.x
+    start = mirror.position
+    mirror.set(start + 4)
+    slope = centroid.get()
+    mirror.set(start)
+    slope = (slope - centroid.get()) / 4
+    return mirror, imager, centroid, slope
+
+
+def cut_beam(monkeypatch, imager, lost):
+    """
+    Read a centroid of 0, as the stats plugin does without beam, whenever
+    lost() is True
+    """
+    readback = imager.detector._get_readback_centroid_x
+    monkeypatch.setattr(imager.detector, '_get_readback_centroid_x',
+                        lambda: 0 if lost() else readback())
+
+
+def run_steer(RE, mfx, offset, **kwargs):
+    mirror, imager, centroid, slope = mfx
+    start = mirror.position
+    kwargs.setdefault('averages', 1)
+    plan = steer([imager], [mirror], [centroid], [centroid.get() + offset],
+                 [slope], gain=1, deadband=2, max_step=0.5, period=0,
+                 delay=0, **kwargs)
+    RE(plan)
+    return mirror.position - start
+
+
+def test_steering_step():
+    steps = steering_step([10, -1, 100], [10, 10, -5], gain=0.5,
+                          deadband=2, max_step=1)
+    #Half the error, nothing in the deadband, clipped to the rate limit
+    assert np.allclose(steps, [-0.5, 0, 1])
+
+
+def test_solve_corrections():
+    matrix = np.array([[10., 0.], [25., -8.]])
+    steps = np.array([0.3, -0.7])
+    errors = matrix.dot(steps)
+    assert np.allclose(solve_corrections(matrix, errors), -steps)
+    #The same matrix steers both mirrors together
+    assert np.allclose(steering_step(errors, matrix, gain=0.5, deadband=0,
+                                     max_step=10), -steps / 2)
+
+
+def test_steer(RE, mfx):
+    slope = mfx[3]
+    assert slope
+    #Each cycle is clipped to max_step, towards the goal
+    moved = run_steer(RE, mfx, 3 * slope, cycles=3)
+    assert moved == pytest.approx(1.5)
+
+
+def test_steer_deadband(RE, mfx):
+    assert run_steer(RE, mfx, 1, cycles=2) == 0
+
+
+def test_steer_max_excursion(RE, mfx):
+    #The third step would go past the excursion and ends the plan
+    moved = run_steer(RE, mfx, 3 * mfx[3], cycles=5, max_excursion=1.0)
+    assert moved == pytest.approx(1.0)
+
+
+def test_steer_no_beam(RE, mfx, monkeypatch):
+    mirror, imager, centroid, slope = mfx
+    goal = centroid.get() + 3 * slope
+    cut_beam(monkeypatch, imager, lambda: True)
+    assert centroid.get() == 0
+    start = mirror.position
+    RE(steer([imager], [mirror], [centroid], [goal], [slope], gain=1,
+             deadband=2, max_step=0.5, period=0, delay=0, averages=1,
+             cycles=2))
+    assert mirror.position == start
+
+
+def test_steer_needs_response(mfx):
+    mirror, imager, centroid, _ = mfx
+    with pytest.raises(ValueError):
+        next(steer([imager], [mirror], [centroid], [100], None))
+    with pytest.raises(ValueError):
+        next(steer([imager], [mirror], [centroid], [100], [0]))
+
+
+def test_check_response():
+    check_response([[10., 0.], [25., -8.]])
+    #A mirror that moves nothing
+    with pytest.raises(ValueError):
+        check_response([[10., 0.], [25., 0.1]])
+    #Two mirrors that move the beam the same way
+    with pytest.raises(ValueError):
+        check_response([[10., 10.1], [20., 20.]])
+    with pytest.raises(ValueError):
+        check_response([[np.nan]])
+
+
+def test_measure_response(RE, mfx):
+    mirror, imager, centroid, slope = mfx
+    start = mirror.position
+    output = {}
+    RE(measure_response([imager], [mirror], [centroid], output, step=4,
+                        averages=2, delay=0))
+    assert output['matrix'].shape == (1, 1)
+    assert output['matrix'][0, 0] == pytest.approx(slope, rel=0.05)
+    #The mirror is put back
+    assert mirror.position == pytest.approx(start)
+
+
+def test_measure_response_no_beam(RE, mfx, monkeypatch):
+    mirror, imager, centroid, slope = mfx
+    start = mirror.position
+    #The beam is lost at the upper end of the measurement
+    cut_beam(monkeypatch, imager, lambda: mirror.position > start + 1)
+    output = {}
+    RE(measure_response([imager], [mirror], [centroid], output, step=2,
+                        averages=1, delay=0))
+    assert 'matrix' not in output
+    #The mirror is still put back
+    assert mirror.position == pytest.approx(start)
+
+
+def test_correct(RE, mfx):
+    mirror, imager, centroid, slope = mfx
+    goal = centroid.get()
+    start = mirror.position
+    mirror.set(start + 2)
+    RE(correct([imager], [mirror], [centroid], [goal], [[slope]],
+               tolerance=2, max_moves=2, averages=1, delay=0))
+    assert abs(centroid.get() - goal) <= 2
+    assert mirror.position == pytest.approx(start, abs=0.1)
+
+
+def test_correct_clipped(RE, mfx):
+    mirror, imager, centroid, slope = mfx
+    goal = centroid.get()
+    start = mirror.position
+    mirror.set(start + 2)
+    RE(correct([imager], [mirror], [centroid], [goal], [[slope]],
+               tolerance=2, max_moves=1, max_correction=0.5, averages=1,
+               delay=0))
+    assert mirror.position == pytest.approx(start + 1.5)
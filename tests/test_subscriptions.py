@@ -0,0 +1,55 @@
+############
+# Standard #
+############
+
+###############
+# Third Party #
+###############
+
+
+##########
+# Module #
+##########
+from skywalker.subscriptions import SubscriptionRegistry
+
+
+class Source:
+    """
+    Stand-in for an ophyd object that only tracks its callbacks
+    """
+    def __init__(self, name):
+        self.name = name
+        self.callbacks = []
+
+    def subscribe(self, callback, event_type=None, run=True):
+        self.callbacks.append(callback)
+
+    def clear_sub(self, callback, event_type=None):
+        self.callbacks.remove(callback)
+
+
+def test_subscription_groups():
+    registry = SubscriptionRegistry()
+    cam, yag = Source('cam'), Source('yag')
+
+    def cb(*args, **kwargs):
+        pass
+
+    assert registry.subscribe(cam, cb, 'imager')
+    #Duplicates are ignored
+    assert not registry.subscribe(cam, cb, 'imager')
+    registry.subscribe(yag, cb, 'procedure')
+    registry.subscribe(cam, cb, 'procedure')
+    assert registry.counts() == {'imager': 1, 'procedure': 2}
+    assert len(cam.callbacks) == 2
+    #Tear down one context
+    registry.clear_group('imager')
+    assert registry.counts() == {'procedure': 2}
+    assert len(cam.callbacks) == 1
+    #Tear down one object
+    registry.clear_object(cam)
+    assert cam.callbacks == []
+    assert len(registry) == 1
+    registry.clear()
+    assert yag.callbacks == []
+    assert len(registry) == 0
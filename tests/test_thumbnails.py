@@ -0,0 +1,76 @@
+############
+# Standard #
+############
+from types import SimpleNamespace
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+##########
+# Module #
+##########
+from skywalker.subscriptions import SubscriptionRegistry
+from skywalker.thumbnails import Thumbnail
+
+
+class Source:
+    """
+    Stand-in for an ophyd signal that tracks its callbacks and reads
+    """
+    def __init__(self, name, value=None):
+        self.name = name
+        self.value = value
+        self.callbacks = []
+        self.reads = 0
+
+    def subscribe(self, callback, event_type=None, run=True):
+        self.callbacks.append(callback)
+
+    def clear_sub(self, callback, event_type=None):
+        self.callbacks.remove(callback)
+
+    def get(self):
+        self.reads += 1
+        return self.value
+
+
+def fake_imager(image):
+    width = Source('width', value=image.shape[0])
+    array_data = Source('array_data', value=image.ravel(order='F'))
+    image2 = SimpleNamespace(width=width, array_data=array_data)
+    return SimpleNamespace(name='HX2 PIM',
+                           detector=SimpleNamespace(image2=image2))
+
+
+def test_thumbnail_decimation():
+    image = np.arange(64 * 48, dtype=np.uint16).reshape((64, 48), order='F')
+    imager = fake_imager(image)
+    thumb = Thumbnail(imager, 90)
+    #Nothing is read before the width is known
+    thumb.poll()
+    assert imager.detector.image2.array_data.reads == 0
+    assert thumb.image(8) is None
+    thumb.width_cb(value=64)
+    thumb.poll()
+    small = thumb.image(8)
+    assert small.shape == (8, 6)
+    assert np.all(small == image[::8, ::8])
+    #Each frame is only drawn once
+    assert thumb.image(8) is None
+
+
+def test_thumbnail_subscriptions():
+    registry = SubscriptionRegistry()
+    imager = fake_imager(np.zeros((4, 3)))
+    image2 = imager.detector.image2
+    thumb = Thumbnail(imager, 0)
+    thumb.connect(registry, 'thumbnails')
+    #Frames are polled, only the width is subscribed to
+    assert len(image2.width.callbacks) == 1
+    assert not image2.array_data.callbacks
+    image2.width.callbacks[0](value=4)
+    assert thumb.width == 4
+    registry.clear_group('thumbnails')
+    assert not image2.width.callbacks
@@ -0,0 +1,49 @@
+############
+# Standard #
+############
+import threading
+
+###############
+# Third Party #
+###############
+import numpy as np
+import pytest
+
+##########
+# Module #
+##########
+from skywalker.workers import FramePool
+
+
+def test_frame_pool():
+    results = []
+    done = threading.Event()
+
+    def callback(result):
+        results.append(result)
+        done.set()
+
+    pool = FramePool(callback, processes=1, slots=1, max_bytes=1024)
+    try:
+        assert pool.assign('cam') == 0
+        assert pool.assign('cam') == 0
+        #Only one slot
+        with pytest.raises(RuntimeError):
+            pool.assign('yag')
+        image = np.zeros((8, 4), dtype=np.uint16)
+        image[2, 1] = 10
+        image[4, 1] = 10
+        frame = image.ravel(order='F')
+        pool.submit('cam', frame, 8, timestamp=1.5)
+        assert done.wait(timeout=30)
+        result = results[0]
+        assert result['name'] == 'cam'
+        assert result['timestamp'] == 1.5
+        assert result['x'] == 3
+        assert result['y'] == 1
+        assert result['sigma_x'] == 1
+        #Frames that do not fit are refused
+        with pytest.raises(ValueError):
+            pool.submit('cam', np.zeros(2048, dtype=np.uint8), 64)
+    finally:
+        pool.stop()